@@ -0,0 +1,129 @@
+"""
+Encode time versus file size of the SaveImage output formats.
+
+Every banner in Assets/Output Images (or the files given with --images) is resized to the
+benchmarked size and encoded in memory with the encoder settings SaveImage uses for each format,
+reporting the median encode time and the mean file size:
+
+    python benchmarks/benchmark_encoders.py --size 1600x904
+
+PNG and lossless WebP are pixel exact, the report includes the PSNR of the lossy formats.
+"""
+import argparse
+import glob
+import io
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+DEFAULT_IMAGES = os.path.join(REPO_DIR, "Assets", "Output Images", "*")
+
+#(label, SaveImage inputs) of the benchmarked encoder settings
+CONFIGS = [
+    ("png level 4 (SaveImage)", {"format": "png", "png_compress_level": 4}),
+    ("png level 1 (PreviewImage)", {"format": "png", "png_compress_level": 1}),
+    ("png level 1 rle", {"format": "png", "png_compress_level": 1, "png_strategy": "rle"}),
+    ("png level 1 huffman_only", {"format": "png", "png_compress_level": 1, "png_strategy": "huffman_only"}),
+    ("png level 0", {"format": "png", "png_compress_level": 0}),
+    ("webp_lossless method 0", {"format": "webp_lossless", "quality": 0, "webp_method": 0}),
+    ("webp_lossless method 4", {"format": "webp_lossless", "quality": 75, "webp_method": 4}),
+    ("webp q90 method 0", {"format": "webp", "quality": 90, "webp_method": 0}),
+    ("webp q90 method 4", {"format": "webp", "quality": 90, "webp_method": 4}),
+    ("jpeg q90 progressive", {"format": "jpeg", "quality": 90}),
+    ("jpeg q95 progressive", {"format": "jpeg", "quality": 95}),
+]
+
+
+def load_images(pattern, width, height):
+    """Returns the images matching pattern as uint8 [H, W, 3] arrays of the benchmarked size."""
+    arrays = []
+    for path in sorted(glob.glob(pattern)):
+        try:
+            with Image.open(path) as img:
+                arrays.append(np.asarray(img.convert("RGB").resize((width, height), Image.LANCZOS)))
+        except OSError:
+            continue
+    return arrays
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def benchmark_config(image_writer, arrays, options, repeats):
+    extension, save_kwargs = image_writer.encoder_options(**options)
+    times = []
+    sizes = []
+    quality = []
+    for array in arrays:
+        for repeat in range(repeats + 1):
+            buffer = io.BytesIO()
+            start = time.perf_counter()
+            image_writer.save_array(array, buffer, **save_kwargs)
+            seconds = time.perf_counter() - start
+            #the first encode of every image is a warmup
+            if repeat > 0:
+                times.append(seconds)
+        sizes.append(buffer.tell())
+        buffer.seek(0)
+        with Image.open(buffer) as decoded:
+            quality.append(psnr(array, np.asarray(decoded.convert("RGB"))))
+    return {
+        "extension": extension,
+        "ms": statistics.median(times) * 1000,
+        "kb": statistics.mean(sizes) / 1024,
+        "psnr": min(quality),
+    }
+
+
+def format_results(results):
+    lines = ["{:<28} {:>10} {:>10} {:>8}".format("Encoder", "ms", "KB", "PSNR")]
+    for r in results:
+        lines.append("{:<28} {:>10.1f} {:>10.0f} {:>8}".format(
+            r["encoder"], r["ms"], r["kb"], "lossless" if math.isinf(r["psnr"]) else "{:.1f}".format(r["psnr"])))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark encode time and file size of the SaveImage output formats.")
+    parser.add_argument("--size", default="1600x904", help="WIDTHxHEIGHT the images are resized to.")
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="Glob of the images to encode, defaults to the example banners.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed encodes per image and encoder after one warmup encode.")
+    parser.add_argument("--json", default=None, help="Also write the results to this json file.")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_DIR)
+    import image_writer
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    arrays = load_images(args.images, width, height)
+    if len(arrays) == 0:
+        print("No images match {}".format(args.images))
+        return 1
+
+    results = []
+    for label, options in CONFIGS:
+        result = benchmark_config(image_writer, arrays, options, args.repeats)
+        result["encoder"] = label
+        results.append(result)
+
+    print("{} images at {}x{}".format(len(arrays), width, height))
+    print(format_results(results))
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([dict(r, psnr=None if math.isinf(r["psnr"]) else r["psnr"]) for r in results], f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
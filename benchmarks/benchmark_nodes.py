@@ -0,0 +1,231 @@
+"""
+Micro-benchmarks of the built in nodes of nodes.py generated from their INPUT_TYPES.
+
+For every node class defined in nodes.py the required inputs are synthesized from the declared
+types: IMAGE, MASK and LATENT tensors of the benchmarked size, INT/FLOAT/BOOLEAN/STRING defaults
+(width and height follow the size), the first entry of option lists, a placeholder conditioning and
+a pooling stand-in for the VAE. Nodes with other inputs (models, files to load) and output nodes
+are skipped. Every node FUNCTION is timed on CPU and one extra call is run under the torch profiler
+to count the memory it allocates:
+
+    python benchmarks/benchmark_nodes.py --sizes 512x512,1024x576,1600x904 --sort ms_per_mp
+
+ms/MP is the median latency per megapixel of the benchmarked size, a node that is slow for its
+size (python loops over pixels, needless copies) stands out there even when its absolute time
+looks small.
+"""
+import argparse
+import csv
+import json
+import os
+import statistics
+import sys
+import time
+
+import torch
+import torch.nn.functional as F
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+DEFAULT_SIZES = "512x512,1024x576,1600x904"
+SORT_KEYS = ("ms", "ms_per_mp", "alloc_mb", "node")
+
+
+class Unsupported(Exception):
+    pass
+
+
+class PoolingVAE:
+    """VAE stand-in that encodes by average pooling, so only the work of the node itself is measured."""
+    downscale_ratio = 8
+    latent_channels = 4
+
+    def encode(self, pixels):
+        samples = F.avg_pool2d(pixels[..., :3].movedim(-1, 1), self.downscale_ratio)
+        return torch.cat((samples, samples.mean(dim=1, keepdim=True)), dim=1)
+
+    def decode(self, samples):
+        return F.interpolate(samples[:, :3], scale_factor=self.downscale_ratio, mode="nearest").movedim(1, -1)
+
+    def encode_tiled(self, pixels, *args, **kwargs):
+        return self.encode(pixels)
+
+    def decode_tiled(self, samples, *args, **kwargs):
+        return self.decode(samples)
+
+
+def synthetic_input(name, spec, width, height, batch, generator):
+    """Returns a value for a required input of a node from its INPUT_TYPES spec."""
+    type_name = spec[0]
+    options = spec[1] if len(spec) > 1 else {}
+    if isinstance(type_name, (list, tuple)):
+        if len(type_name) == 0:
+            raise Unsupported("{} has no options".format(name))
+        return type_name[0]
+    if type_name == "IMAGE":
+        return torch.rand((batch, height, width, 3), generator=generator)
+    if type_name == "MASK":
+        return torch.rand((batch, height, width), generator=generator)
+    if type_name == "LATENT":
+        return {"samples": torch.randn((batch, 4, height // 8, width // 8), generator=generator)}
+    if type_name == "INT":
+        if name == "width":
+            return width
+        if name == "height":
+            return height
+        value = options.get("default", options.get("min", 0))
+        return min(max(value, options.get("min", value)), options.get("max", value))
+    if type_name == "FLOAT":
+        return options.get("default", options.get("min", 0.0))
+    if type_name == "BOOLEAN":
+        return options.get("default", False)
+    if type_name == "STRING":
+        return options.get("default", "")
+    if type_name == "VAE":
+        return PoolingVAE()
+    if type_name == "CONDITIONING":
+        return [[torch.randn((1, 77, 768), generator=generator), {"pooled_output": torch.randn((1, 768), generator=generator)}]]
+    raise Unsupported("unsupported input type {} of {}".format(type_name, name))
+
+
+def build_inputs(node_cls, width, height, batch, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    required = node_cls.INPUT_TYPES().get("required", {})
+    return {name: synthetic_input(name, spec, width, height, batch, generator) for name, spec in required.items()}
+
+
+def output_bytes(value):
+    if isinstance(value, torch.Tensor):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(output_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(output_bytes(v) for v in value)
+    return 0
+
+
+def allocations(function, inputs):
+    """Returns the bytes and number of CPU allocations of one call, as recorded by the torch profiler."""
+    with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], profile_memory=True) as prof:
+        function(**inputs)
+    allocated = [e.self_cpu_memory_usage for e in prof.events() if e.self_cpu_memory_usage > 0]
+    return sum(allocated), len(allocated)
+
+
+def benchmark_node(name, node_cls, width, height, batch, repeats, max_seconds):
+    """Times the FUNCTION of a node at one size, returns a result row or raises Unsupported."""
+    function = getattr(node_cls(), node_cls.FUNCTION)
+    times = []
+    output = None
+    for repeat in range(repeats + 1):
+        inputs = build_inputs(node_cls, width, height, batch, seed=repeat)
+        start = time.perf_counter()
+        output = function(**inputs)
+        seconds = time.perf_counter() - start
+        #the first call is a warmup unless it is already too slow to repeat
+        if repeat > 0 or seconds > max_seconds:
+            times.append(seconds)
+        if sum(times) > max_seconds:
+            break
+
+    alloc_bytes, alloc_count = allocations(function, build_inputs(node_cls, width, height, batch)) if times[0] <= max_seconds else (None, None)
+    ms = statistics.median(times) * 1000
+    return {
+        "node": name,
+        "size": "{}x{}".format(width, height),
+        "batch": batch,
+        "runs": len(times),
+        "ms": ms,
+        "ms_per_mp": ms / (width * height * batch / 1e6),
+        "alloc_mb": None if alloc_bytes is None else alloc_bytes / (1024 * 1024),
+        "allocs": alloc_count,
+        "output_mb": output_bytes(output) / (1024 * 1024),
+    }
+
+
+def builtin_nodes(nodes_module, names=None):
+    """Returns the (name, class) pairs of the node classes defined in nodes.py."""
+    out = []
+    for name, node_cls in dict.items(nodes_module.NODE_CLASS_MAPPINGS):
+        if getattr(node_cls, "__module__", None) != nodes_module.__name__:
+            continue
+        if names is not None and name not in names:
+            continue
+        out.append((name, node_cls))
+    return out
+
+
+def sort_key(key):
+    if key == "node":
+        return lambda r: (r["node"], r["size"])
+    return lambda r: -(r[key] or 0)
+
+
+def format_results(results):
+    lines = ["{:<32} {:>10} {:>5} {:>10} {:>10} {:>10} {:>8} {:>10}".format("Node", "Size", "Runs", "ms", "ms/MP", "Alloc MB", "Allocs", "Output MB")]
+    for r in results:
+        lines.append("{:<32} {:>10} {:>5} {:>10.2f} {:>10.2f} {:>10} {:>8} {:>10.1f}".format(
+            r["node"][:32], r["size"], r["runs"], r["ms"], r["ms_per_mp"],
+            "-" if r["alloc_mb"] is None else "{:.1f}".format(r["alloc_mb"]),
+            "-" if r["allocs"] is None else r["allocs"], r["output_mb"]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the nodes of nodes.py with inputs generated from their INPUT_TYPES.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma separated WIDTHxHEIGHT image sizes.")
+    parser.add_argument("--batch", type=int, default=1, help="Batch size of the generated images, masks and latents.")
+    parser.add_argument("--nodes", default=None, help="Comma separated node names, defaults to every supported node.")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed calls per node and size after one warmup call.")
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="Stop repeating a node at a size once its calls took this long.")
+    parser.add_argument("--include-output-nodes", action="store_true", help="Also benchmark output nodes such as SaveImage, they write files.")
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads, defaults to the torch default.")
+    parser.add_argument("--sort", choices=SORT_KEYS, default="ms_per_mp", help="Column to sort the report by.")
+    parser.add_argument("--csv", default=None, help="Also write the results to this csv file.")
+    parser.add_argument("--json", default=None, help="Also write the results to this json file.")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_DIR)
+    import nodes
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    names = None if args.nodes is None else set(args.nodes.split(","))
+    sizes = [tuple(int(v) for v in size.lower().split("x")) for size in args.sizes.split(",")]
+
+    results = []
+    skipped = {}
+    with torch.inference_mode():
+        for name, node_cls in builtin_nodes(nodes, names):
+            if getattr(node_cls, "OUTPUT_NODE", False) and not args.include_output_nodes:
+                skipped[name] = "output node"
+                continue
+            for width, height in sizes:
+                try:
+                    results.append(benchmark_node(name, node_cls, width, height, args.batch, args.repeats, args.max_seconds))
+                except Unsupported as e:
+                    skipped[name] = str(e)
+                    break
+                except Exception as e:
+                    skipped[name] = "{}: {}".format(type(e).__name__, e)
+                    break
+
+    results.sort(key=sort_key(args.sort))
+    print(format_results(results))
+    if len(skipped) > 0:
+        print("\nSkipped {} nodes: {}".format(len(skipped), ", ".join(sorted(skipped))))
+
+    if args.csv is not None:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()) if results else ["node"])
+            writer.writeheader()
+            writer.writerows(results)
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "skipped": skipped}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+CPU benchmark of the whole banner workflow with tiny stand-in models.
+
+Renders banners with run_batch of workflow_bb_hackathon.py like the batch runner does. Only the
+models and the external node packs are replaced (see stub_nodes.py), the nodes of nodes.py and
+comfy_extras load the example assets, sample and save into a temporary directory for real, so no
+model has to be downloaded and no GPU is needed. Every resolution runs in a fresh process so the
+peak RSS of one doesn't hide the next one. Reports the median latency per stage, the wall time per
+banner, the peak RSS and the throughput in banners per minute:
+
+    python benchmarks/benchmark_workflow.py --resolutions 1024x576,1600x904,3200x1808 --jobs 3
+
+Without options every job does the full work one after another. The scheduling and caching features
+of the batch runner are switched on with --pipeline, --dedupe, --resume, --async-save, --uint8-images
+and the cache options, run the benchmark with and without one to measure it. --unique-jobs repeats
+the seeds of the first jobs so the result caches can hit.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+DEFAULT_RESOLUTIONS = "1024x576,1600x904,3200x1808"
+PRODUCT_IMAGE = os.path.join("Assets", "Background Removal", "Green Soda Can.png")
+BACKGROUND_DIR = os.path.join("Assets", "Background Images")
+
+#options of the child processes, (flag, help)
+OPTIONS = [
+    ("--pipeline", "Preprocess the next job in a second thread like the --pipeline of the batch runner."),
+    ("--dedupe", "Memoize identical node calls within a job."),
+    ("--resume", "Store the stage outputs of every job like the batch runner does by default."),
+    ("--async-save", "Write the banners on the writer threads."),
+    ("--uint8-images", "Load images as uint8."),
+    ("--model-cache", "Reuse loaded checkpoints and ControlNets, the workflow loads some of them twice."),
+    ("--image-cache", "Keep decoded input images in memory."),
+    ("--prompt-cache", "Keep encoded prompts in memory."),
+    ("--sample-cache", "Keep sampler results in memory."),
+    ("--disk-cache", "Also store encoded prompts and sampler results on disk, with --prompt-cache and --sample-cache."),
+]
+
+
+def option_name(flag):
+    return flag[2:].replace("-", "_")
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #kilobytes on linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def time_stages(workflow, timings):
+    """Wraps the stage functions of the workflow so the seconds of every stage run are recorded in timings."""
+    for stage in workflow.STAGES:
+        name = "stage_" + stage
+        fn = getattr(workflow, name)
+
+        def timed(*args, fn=fn, stage=stage):
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                timings[stage].append(time.perf_counter() - start)
+        setattr(workflow, name, timed)
+
+
+def run_resolution(width, height, jobs, warmup, threads, options, directory):
+    """Renders warmup + jobs banners at one resolution in this process and returns the measurements."""
+    for name in ("input", "output", "temp", "models", "cache"):
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+    os.environ["PROMOGENIE_CACHE_DIR"] = os.path.join(directory, "cache")
+    sys.path.insert(0, REPO_DIR)
+    sys.path.insert(0, BENCHMARK_DIR)
+
+    import torch
+    import workflow_bb_hackathon as workflow
+    import folder_paths
+    import image_writer
+    import nodes
+    import prompt_cache
+    import sample_cache
+    import uint8_image
+    from headless import init_headless_server
+    from node_memo import MemoizingNodeMappings
+    from stage_store import StageStore
+    import stub_nodes
+
+    folder_paths.set_input_directory(os.path.join(directory, "input"))
+    folder_paths.set_output_directory(os.path.join(directory, "output"))
+    folder_paths.set_temp_directory(os.path.join(directory, "temp"))
+    shutil.copy(os.path.join(REPO_DIR, PRODUCT_IMAGE), os.path.join(directory, "input"))
+    backgrounds = sorted(os.listdir(os.path.join(REPO_DIR, BACKGROUND_DIR)))
+    for name in backgrounds:
+        shutil.copy(os.path.join(REPO_DIR, BACKGROUND_DIR, name), os.path.join(directory, "input"))
+
+    init_headless_server()
+    nodes.init_extra_nodes(init_custom_nodes=False)
+    stub_nodes.install(os.path.join(directory, "models"))
+    nodes.NODE_CLASS_MAPPINGS.update(stub_nodes.STUB_NODE_CLASS_MAPPINGS)
+
+    model_cache_bytes = 24 * 1024 ** 3 if options["model_cache"] else 0
+    nodes.CHECKPOINT_CACHE.set_max_bytes(model_cache_bytes)
+    nodes.CONTROLNET_CACHE.set_max_bytes(model_cache_bytes)
+    if not options["image_cache"]:
+        nodes.IMAGE_CACHE.set_max_bytes(0)
+    if not options["prompt_cache"]:
+        prompt_cache.MEMORY_CACHE.set_max_bytes(0)
+    prompt_cache.set_disk_cache(options["prompt_cache"] and options["disk_cache"])
+    sample_cache.set_enabled(options["sample_cache"])
+    sample_cache.set_disk_cache(options["sample_cache"] and options["disk_cache"])
+    uint8_image.set_enabled(options["uint8_images"])
+    image_writer.set_async(options["async_save"])
+    store = StageStore(os.path.join(directory, "stages")) if options["resume"] else None
+
+    if threads is not None:
+        torch.set_num_threads(threads)
+    torch.manual_seed(0)
+    timings = {stage: [] for stage in workflow.STAGES}
+    time_stages(workflow, timings)
+
+    def batch(first, count):
+        return [dict(workflow.DEFAULT_JOB, job_id="benchmark_{:03}".format(index), width=width, height=height,
+                     product_image=os.path.basename(PRODUCT_IMAGE), background_image=backgrounds[index % len(backgrounds)],
+                     seed=index % options["unique_jobs"], filename_prefix="benchmark")
+                for index in range(first, first + count)]
+
+    def run(batch_jobs):
+        failed = workflow.run_batch(batch_jobs, models, dedupe=options["dedupe"], store=store, pipeline=options["pipeline"])
+        writes = image_writer.wait()
+        if len(failed) > 0 or any(w.error is not None for w in writes):
+            raise RuntimeError("Benchmark jobs failed: {}".format(", ".join(failed)))
+
+    with torch.inference_mode():
+        start = time.perf_counter()
+        node_mappings = MemoizingNodeMappings(nodes.NODE_CLASS_MAPPINGS) if options["dedupe"] else nodes.NODE_CLASS_MAPPINGS
+        models = workflow.load_models(node_mappings)
+        load_seconds = time.perf_counter() - start
+
+        if warmup > 0:
+            run(batch(0, warmup))
+        for values in timings.values():
+            values.clear()
+        start = time.perf_counter()
+        run(batch(warmup, jobs))
+        seconds = time.perf_counter() - start
+
+    return {
+        "resolution": "{}x{}".format(width, height),
+        "jobs": jobs,
+        "options": options,
+        "threads": torch.get_num_threads(),
+        "load_seconds": load_seconds,
+        "stage_seconds": {stage: statistics.median(values) if len(values) > 0 else 0.0 for stage, values in timings.items()},
+        "total_seconds": seconds / jobs,
+        "banners_per_minute": 60 * jobs / seconds,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def format_results(results):
+    stages = list(results[0]["stage_seconds"].keys())
+    header = "{:<11}".format("Resolution") + "".join("{:>16}".format(s) for s in stages) + "{:>10}{:>14}{:>14}".format("Banner s", "Banners/min", "Peak RSS MB")
+    lines = [header]
+    for r in results:
+        lines.append("{:<11}".format(r["resolution"]) + "".join("{:>16.3f}".format(r["stage_seconds"][s]) for s in stages) +
+                     "{:>10.2f}{:>14.1f}{:>14.0f}".format(r["total_seconds"], r["banners_per_minute"], r["peak_rss_bytes"] / (1024 * 1024)))
+    return "\n".join(lines)
+
+
+def parse_resolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the banner workflow on CPU with stand-in models.")
+    parser.add_argument("--resolutions", default=DEFAULT_RESOLUTIONS, help="Comma separated WIDTHxHEIGHT banner sizes.")
+    parser.add_argument("--jobs", type=int, default=3, help="Timed banners per resolution.")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed banners rendered first at every resolution.")
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads, defaults to the torch default.")
+    parser.add_argument("--unique-jobs", type=int, default=None, help="Number of different seeds, jobs after that repeat earlier ones. Defaults to all different.")
+    for flag, description in OPTIONS:
+        parser.add_argument(flag, action="store_true", help=description)
+    parser.add_argument("--json", default=None, help="Also write the results to this json file.")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        width, height = parse_resolution(args.child)
+        options = {option_name(flag): getattr(args, option_name(flag)) for flag, _ in OPTIONS}
+        options["unique_jobs"] = args.unique_jobs or args.warmup + args.jobs
+        with tempfile.TemporaryDirectory() as directory:
+            result = run_resolution(width, height, args.jobs, args.warmup, args.threads, options, directory)
+        with open(args.child_output, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    results = []
+    for resolution in args.resolutions.split(","):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = os.path.join(temp_dir, "result.json")
+            command = [sys.executable, os.path.abspath(__file__), "--child", resolution, "--child-output", output,
+                       "--jobs", str(args.jobs), "--warmup", str(args.warmup)]
+            if args.threads is not None:
+                command += ["--threads", str(args.threads)]
+            if args.unique_jobs is not None:
+                command += ["--unique-jobs", str(args.unique_jobs)]
+            command += [flag for flag, _ in OPTIONS if getattr(args, option_name(flag))]
+            print("Benchmarking {}...".format(resolution), flush=True)
+            completed = subprocess.run(command, cwd=REPO_DIR, stdout=subprocess.DEVNULL)
+            if completed.returncode != 0:
+                print("Benchmark of {} failed with exit code {}".format(resolution, completed.returncode))
+                continue
+            with open(output, "r", encoding="utf-8") as f:
+                results.append(json.load(f))
+
+    if len(results) == 0:
+        return 1
+    print(format_results(results))
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
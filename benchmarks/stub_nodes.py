@@ -0,0 +1,544 @@
+"""
+Tiny, randomly initialized stand-ins for the models and the external node packs of workflow_bb_hackathon.py.
+
+install() puts small placeholder files where the workflow looks for its checkpoints, LoRA, ControlNet,
+Flux UNet and text encoders and replaces the functions of comfy that turn such files into models, so
+the real loader nodes of nodes.py (and their caches) build a few small convolutions instead. The
+diffusion models are real comfy models with a tiny UNet, so KSampler, the custom sampler nodes and
+ControlNet conditioning run through comfy's sampling code. Text encoders, VAE and background removal
+are small torch modules. The nodes of the external node packs (and the VAE loader) are replaced by
+plain torch implementations of what they compute, see STUB_NODE_CLASS_MAPPINGS. Every other node,
+image loading and saving included, is the real one.
+
+The stubs are meant for benchmarking the structure of the workflow (scheduling, caching, tensor
+traffic), not for producing banners.
+"""
+import os
+
+import torch
+import torch.nn.functional as F
+import safetensors.torch
+
+import comfy.controlnet
+import comfy.model_base
+import comfy.model_patcher
+import comfy.sd
+import comfy.supported_models
+import folder_paths
+
+#latent channels of the stand-in diffusion models, the SD1.5 latent format of comfy
+SD_LATENT_CHANNELS = 4
+CONDITIONING_DIM = 64
+CPU = torch.device("cpu")
+
+
+def _generator(seed):
+    return torch.Generator().manual_seed(seed % (2 ** 63))
+
+
+def _nchw(image):
+    return image.movedim(-1, 1)
+
+
+def _nhwc(samples):
+    return samples.movedim(1, -1)
+
+
+def _resize(image, width, height, method="bilinear"):
+    mode = "bicubic" if method in ("lanczos", "bicubic") else "bilinear"
+    return _nhwc(F.interpolate(_nchw(image), size=(height, width), mode=mode, align_corners=False, antialias=True)).clamp(0, 1)
+
+
+def _gaussian_blur(samples, sigma, radius=None):
+    """Separable gaussian blur of NCHW samples."""
+    if radius is None:
+        radius = max(1, int(sigma * 3))
+    if sigma <= 0 or radius <= 0:
+        return samples
+    x = torch.arange(-radius, radius + 1, dtype=samples.dtype)
+    kernel = torch.exp(-(x * x) / (2 * sigma * sigma))
+    kernel = kernel / kernel.sum()
+    channels = samples.shape[1]
+    padded = F.pad(samples, (radius, radius, 0, 0), mode="reflect" if samples.shape[-1] > radius else "replicate")
+    samples = F.conv2d(padded, kernel.view(1, 1, 1, -1).repeat(channels, 1, 1, 1), groups=channels)
+    padded = F.pad(samples, (0, 0, radius, radius), mode="reflect" if samples.shape[-2] > radius else "replicate")
+    return F.conv2d(padded, kernel.view(1, 1, -1, 1).repeat(channels, 1, 1, 1), groups=channels)
+
+
+def _luminance(image):
+    return image[..., 0] * 0.299 + image[..., 1] * 0.587 + image[..., 2] * 0.114
+
+
+class StubTextEncoder(torch.nn.Module):
+    def __init__(self, width=CONDITIONING_DIM):
+        super().__init__()
+        self.embedding = torch.nn.Embedding(256, width)
+        self.mlp = torch.nn.Sequential(torch.nn.Linear(width, width * 4), torch.nn.GELU(), torch.nn.Linear(width * 4, width))
+
+    def forward(self, tokens):
+        x = self.embedding(tokens)
+        cond = x + self.mlp(x)
+        return cond, cond.mean(dim=1)
+
+
+class StubCLIP:
+    """CLIP of the loaders: byte tokens and a small encoder, with the patcher and source tag of comfy.sd.CLIP."""
+    def __init__(self, cond_stage_model=None, patcher=None):
+        self.cond_stage_model = StubTextEncoder() if cond_stage_model is None else cond_stage_model
+        self.patcher = comfy.model_patcher.ModelPatcher(self.cond_stage_model, load_device=CPU, offload_device=CPU) if patcher is None else patcher
+        self.layer_idx = None
+
+    def clone(self):
+        return StubCLIP(self.cond_stage_model, self.patcher.clone())
+
+    def tokenize(self, text):
+        tokens = list(text.encode("utf-8")[:77])
+        return tokens + [0] * (77 - len(tokens))
+
+    def encode_from_tokens(self, tokens, return_pooled=False, return_dict=False):
+        cond, pooled = self.cond_stage_model(torch.tensor([tokens]))
+        if return_dict:
+            return {"cond": cond, "pooled_output": pooled}
+        return (cond, pooled) if return_pooled else cond
+
+
+class StubVAE(torch.nn.Module):
+    """8x down/upsampling autoencoder."""
+    def __init__(self, latent_channels=SD_LATENT_CHANNELS, width=16):
+        super().__init__()
+        self.latent_channels = latent_channels
+        self.encoder = torch.nn.Sequential(
+            torch.nn.Conv2d(3, width, 3, stride=2, padding=1), torch.nn.SiLU(),
+            torch.nn.Conv2d(width, width, 3, stride=2, padding=1), torch.nn.SiLU(),
+            torch.nn.Conv2d(width, latent_channels, 3, stride=2, padding=1))
+        self.decoder = torch.nn.Sequential(
+            torch.nn.ConvTranspose2d(latent_channels, width, 4, stride=2, padding=1), torch.nn.SiLU(),
+            torch.nn.ConvTranspose2d(width, width, 4, stride=2, padding=1), torch.nn.SiLU(),
+            torch.nn.ConvTranspose2d(width, 3, 4, stride=2, padding=1))
+
+    def encode(self, pixels):
+        h = (pixels.shape[1] // 8) * 8
+        w = (pixels.shape[2] // 8) * 8
+        return self.encoder(_nchw(pixels[:, :h, :w, :3]) * 2 - 1)
+
+    def decode(self, samples):
+        return _nhwc(torch.sigmoid(self.decoder(samples)))
+
+
+def stub_diffusion_model(width=32):
+    """Returns a ModelPatcher of an SD1.5 type comfy model with a one level UNet of the given width (a multiple of 32)."""
+    unet_config = {
+        "image_size": 32, "in_channels": SD_LATENT_CHANNELS, "out_channels": SD_LATENT_CHANNELS, "model_channels": width,
+        "num_res_blocks": [1], "channel_mult": [1], "transformer_depth": [1], "transformer_depth_output": [1, 1],
+        "transformer_depth_middle": 1, "context_dim": CONDITIONING_DIM, "use_spatial_transformer": True,
+        "use_linear_in_transformer": False, "adm_in_channels": None, "use_temporal_attention": False,
+    }
+    model_config = comfy.supported_models.SD15(unet_config)
+    model_config.unet_config["num_heads"] = 1
+    model_config.set_inference_dtype(torch.float32, None)
+    model = comfy.model_base.BaseModel(model_config, device=CPU)
+    #comfy creates the weights uninitialized, loading a checkpoint would fill them
+    with torch.no_grad():
+        for parameter in model.parameters():
+            parameter.normal_(0, 0.02)
+    return comfy.model_patcher.ModelPatcher(model, load_device=CPU, offload_device=CPU)
+
+
+class StubControlNetModel(torch.nn.Module):
+    def __init__(self, width=32):
+        super().__init__()
+        self.hint = torch.nn.Conv2d(3, width, 8, stride=8)
+        self.mix = torch.nn.Conv2d(width, width, 3, padding=1)
+
+    def forward(self, hint):
+        return self.mix(F.silu(self.hint(hint)))
+
+
+class StubControlNet(comfy.controlnet.ControlBase):
+    """ControlNet adding features of the hint to the middle block of the stand-in UNet at every step."""
+    def __init__(self, control_model=None):
+        super().__init__()
+        self.control_model = StubControlNetModel() if control_model is None else control_model
+
+    def copy(self):
+        c = StubControlNet(self.control_model)
+        self.copy_to(c)
+        return c
+
+    def get_control(self, x_noisy, t, cond, batched_number, *args, **kwargs):
+        hint = self.cond_hint_original[:, :3].to(x_noisy)
+        hint = F.interpolate(hint, size=(x_noisy.shape[2] * 8, x_noisy.shape[3] * 8), mode="bilinear", align_corners=False)
+        features = self.control_model(hint) * self.strength
+        return {"middle": [features.expand(x_noisy.shape[0], -1, -1, -1)]}
+
+
+class StubBackgroundRemoval(torch.nn.Module):
+    """Predicts a foreground mask at 1024x1024 like RMBG-1.4 and resizes it back."""
+    def __init__(self, width=8):
+        super().__init__()
+        self.net = torch.nn.Sequential(
+            torch.nn.Conv2d(3, width, 3, stride=2, padding=1), torch.nn.SiLU(),
+            torch.nn.Conv2d(width, width, 3, padding=1), torch.nn.SiLU(),
+            torch.nn.Conv2d(width, 1, 3, padding=1))
+
+    def forward(self, image):
+        samples = F.interpolate(_nchw(image[..., :3]), size=(1024, 1024), mode="bilinear", align_corners=False)
+        mask = torch.sigmoid(self.net(samples))
+        return F.interpolate(mask, size=image.shape[1:3], mode="bilinear", align_corners=False)[:, 0]
+
+
+#(folder, file) of every model the workflow loads, install() creates them as placeholders
+MODEL_FILES = [
+    ("checkpoints", "epicrealism_naturalSinRC1VAE.safetensors"),
+    ("checkpoints", "juggernautXL_v9Rdphoto2Lightning.safetensors"),
+    ("loras", "mjv6.safetensors"),
+    ("controlnet", "SDXL\\controlnet-canny-sdxl-1.0\\diffusion_pytorch_model_V2.safetensors"),
+    ("diffusion_models", "iclight_sd15_fc_unet_ldm.safetensors"),
+    ("diffusion_models", "flux1-schnell.safetensors"),
+    ("clip", "t5xxl_fp16.safetensors"),
+    ("clip", "clip_l.safetensors"),
+    ("vae", "diffusion_pytorch_model.safetensors"),
+]
+
+
+def _load_checkpoint(ckpt_path, output_vae=True, output_clip=True, **kwargs):
+    return (stub_diffusion_model(), StubCLIP() if output_clip else None, StubVAE() if output_vae else None, None)
+
+
+def _load_diffusion_model(unet_path, model_options={}):
+    return stub_diffusion_model(width=64)
+
+
+def _load_clip(ckpt_paths, embedding_directory=None, clip_type=None, **kwargs):
+    return StubCLIP()
+
+
+def _load_controlnet(ckpt_path, model=None, **kwargs):
+    return StubControlNet()
+
+
+def _load_lora_for_models(model, clip, lora, strength_model, strength_clip):
+    #the placeholder holds no LoRA keys, like a LoRA for another architecture it patches nothing
+    return (None if model is None else model.clone(), None if clip is None else clip.clone())
+
+
+def install(directory):
+    """
+    Creates the placeholder model files in directory, registers them with folder_paths and makes the
+    comfy loading functions build stand-in models. Only meant for a benchmark process.
+    """
+    generator = torch.Generator().manual_seed(0)
+    for folder, name in MODEL_FILES:
+        path = os.path.join(directory, folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.isfile(path):
+            safetensors.torch.save_file({"placeholder": torch.randn((16,), generator=generator)}, path)
+        folder_paths.add_model_folder_path(folder, os.path.join(directory, folder))
+
+    comfy.sd.load_checkpoint_guess_config = _load_checkpoint
+    comfy.sd.load_diffusion_model = _load_diffusion_model
+    comfy.sd.load_clip = _load_clip
+    comfy.sd.load_lora_for_models = _load_lora_for_models
+    comfy.controlnet.load_controlnet = _load_controlnet
+
+
+class Node:
+    """Base of the stubs, RETURN_TYPES and INPUT_TYPES are omitted since the workflow calls the nodes directly."""
+    pass
+
+
+class LoadAndApplyICLightUnet(Node):
+    FUNCTION = "load"
+
+    def load(self, model_path, model):
+        #IC-Light adds its UNet as patches of the model, a diff patch of the input convolution stands in for them
+        model = model.clone()
+        key = "diffusion_model.input_blocks.0.0.weight"
+        weight = model.model_state_dict()[key]
+        model.add_patches({key: (torch.randn(weight.shape, generator=_generator(len(model_path))) * 0.01,)}, 1.0)
+        return (model,)
+
+
+class VAELoader(Node):
+    """The VAE loader of nodes.py builds comfy.sd.VAE from the file, the stand-in VAE replaces the node instead."""
+    FUNCTION = "load_vae"
+
+    def load_vae(self, vae_name):
+        return (StubVAE(),)
+
+
+class CRImageSize(Node):
+    FUNCTION = "ImageSize"
+
+    def ImageSize(self, width, height, upscale_factor):
+        return (width, height, upscale_factor, "")
+
+
+class ImageResizePlus(Node):
+    FUNCTION = "execute"
+
+    def execute(self, width, height, interpolation, method, condition, multiple_of, image):
+        ih, iw = image.shape[1:3]
+        if method == "fill / crop":
+            ratio = max(width / iw, height / ih)
+        else:
+            ratio = min(width / iw, height / ih)
+        new_w, new_h = max(1, round(iw * ratio)), max(1, round(ih * ratio))
+        out = _resize(image, new_w, new_h, interpolation)
+        if method == "fill / crop":
+            x, y = (new_w - width) // 2, (new_h - height) // 2
+            out = out[:, y:y + height, x:x + width]
+        else:
+            x, y = (width - new_w) // 2, (height - new_h) // 2
+            out = _nhwc(F.pad(_nchw(out), (x, width - new_w - x, y, height - new_h - y)))
+        return (out, width, height)
+
+
+class LayerColorExposure(Node):
+    FUNCTION = "color_correct_exposure"
+
+    def color_correct_exposure(self, exposure, image):
+        rgb = (image[..., :3] * (2 ** (exposure / 32))).clamp(0, 1)
+        return (torch.cat((rgb, image[..., 3:]), dim=-1),)
+
+
+class ImageBlank(Node):
+    FUNCTION = "blank_image"
+
+    def blank_image(self, width, height, red, green, blue):
+        color = torch.tensor([red, green, blue], dtype=torch.float32) / 255
+        return (color.expand(1, height, width, 3).clone(),)
+
+
+class LogicBooleanPrimitive(Node):
+    FUNCTION = "do"
+
+    def do(self, boolean):
+        return (boolean,)
+
+
+class CRSetValueOnBoolean(Node):
+    FUNCTION = "set_value"
+
+    def set_value(self, boolean, value_if_true, value_if_false):
+        value = value_if_true if boolean else value_if_false
+        return (value, float(value))
+
+
+class CRImageInputSwitch(Node):
+    FUNCTION = "switch"
+
+    def switch(self, Input, image1=None, image2=None):
+        return (image1 if Input == 1 else image2, "")
+
+
+class CRText(Node):
+    FUNCTION = "text_multiline"
+
+    def text_multiline(self, text):
+        return (text, "")
+
+
+class EasyImageRemBg(Node):
+    FUNCTION = "remove"
+    model = None
+
+    def remove(self, rem_mode, image_output, save_prefix, torchscript_jit, images):
+        if EasyImageRemBg.model is None:
+            EasyImageRemBg.model = StubBackgroundRemoval()
+        mask = EasyImageRemBg.model(images)
+        return (torch.cat((images[..., :3], mask.unsqueeze(-1)), dim=-1), mask)
+
+
+class ImageBlendAdvanceV2(Node):
+    FUNCTION = "image_blend_advance_v2"
+
+    def image_blend_advance_v2(self, invert_mask, blend_mode, opacity, x_percent, y_percent, mirror, scale, aspect_ratio, rotate,
+                               transform_method, anti_aliasing, background_image, layer_image, layer_mask=None):
+        bh, bw = background_image.shape[1:3]
+        lh, lw = layer_image.shape[1:3]
+        new_w = max(1, min(bw, int(lw * scale * aspect_ratio)))
+        new_h = max(1, min(bh, int(lh * scale)))
+        layer = _resize(layer_image, new_w, new_h, transform_method)
+        x = min(max(0, int(bw * x_percent / 100 - new_w / 2)), bw - new_w)
+        y = min(max(0, int(bh * y_percent / 100 - new_h / 2)), bh - new_h)
+        mask = torch.zeros((1, bh, bw))
+        if layer.shape[-1] > 3:
+            mask[:, y:y + new_h, x:x + new_w] = layer[..., 3] * (opacity / 100)
+        else:
+            mask[:, y:y + new_h, x:x + new_w] = opacity / 100
+        placed = background_image[..., :3].clone()
+        placed[:, y:y + new_h, x:x + new_w] = layer[..., :3]
+        out = background_image[..., :3] * (1 - mask.unsqueeze(-1)) + placed * mask.unsqueeze(-1)
+        return (out, mask)
+
+
+class LayerColorAutoAdjust(Node):
+    FUNCTION = "auto_adjust"
+
+    def auto_adjust(self, strength, brightness, contrast, saturation, red, green, blue, image, mask=None):
+        low = image.amin(dim=(1, 2), keepdim=True)
+        high = image.amax(dim=(1, 2), keepdim=True)
+        stretched = ((image - low) / (high - low).clamp(min=1e-5)).clamp(0, 1)
+        return (image + (stretched - image) * (strength / 100),)
+
+
+class CannyEdgePreprocessor(Node):
+    FUNCTION = "execute"
+
+    def execute(self, image, low_threshold=100, high_threshold=200, resolution=512):
+        gray = _gaussian_blur(_luminance(image).unsqueeze(1), 1.4)
+        kx = torch.tensor([[-1.0, 0, 1], [-2, 0, 2], [-1, 0, 1]]).view(1, 1, 3, 3)
+        gx = F.conv2d(gray, kx, padding=1)
+        gy = F.conv2d(gray, kx.transpose(2, 3), padding=1)
+        magnitude = torch.sqrt(gx * gx + gy * gy) * 255
+        edges = torch.where(magnitude > high_threshold, 1.0, torch.where(magnitude > low_threshold, 0.5, 0.0))
+        return (_nhwc(edges).expand(-1, -1, -1, 3).contiguous(),)
+
+
+class GrowMaskWithBlur(Node):
+    FUNCTION = "expand_mask"
+
+    def expand_mask(self, mask, expand, tapered_corners, flip_input, blur_radius, incremental_expandrate, lerp_alpha, decay_factor, fill_holes=False):
+        m = mask.unsqueeze(1)
+        if flip_input:
+            m = 1 - m
+        for _ in range(abs(expand)):
+            if expand > 0:
+                m = F.max_pool2d(m, 3, stride=1, padding=1)
+            else:
+                m = -F.max_pool2d(-m, 3, stride=1, padding=1)
+        if blur_radius > 0:
+            m = _gaussian_blur(m, blur_radius)
+        m = m[:, 0].clamp(0, 1)
+        return (m, 1 - m)
+
+
+class ICLightConditioning(Node):
+    FUNCTION = "encode"
+
+    def encode(self, positive, negative, vae, foreground, multiplier, opt_background=None):
+        concat = foreground["samples"] * multiplier
+        out = []
+        for conditioning in (positive, negative):
+            out.append([[cond, dict(options, concat_latent_image=concat)] for cond, options in conditioning])
+        return (out[0], out[1], {"samples": torch.zeros_like(foreground["samples"])})
+
+
+class ImageSelectChannel(Node):
+    FUNCTION = "select_channel"
+
+    def select_channel(self, image, channel="red"):
+        index = {"red": 0, "green": 1, "blue": 2}[channel]
+        return (image[..., index:index + 1].expand(-1, -1, -1, 3).contiguous(),)
+
+
+class LayerColorBrightnessContrast(Node):
+    FUNCTION = "color_correct_brightness_and_contrast"
+
+    def color_correct_brightness_and_contrast(self, image, brightness, contrast, saturation):
+        out = image * brightness
+        mean = out.mean(dim=(1, 2, 3), keepdim=True)
+        out = (out - mean) * contrast + mean
+        gray = _luminance(out).unsqueeze(-1)
+        return ((gray + (out - gray) * saturation).clamp(0, 1),)
+
+
+class ColorBlend(Node):
+    FUNCTION = "blend"
+
+    def blend(self, base_image, blend_image, mode):
+        h = min(base_image.shape[1], blend_image.shape[1])
+        w = min(base_image.shape[2], blend_image.shape[2])
+        base, blend = base_image[:, :h, :w, :3], blend_image[:, :h, :w, :3]
+        return ((base - _luminance(base).unsqueeze(-1) + _luminance(blend).unsqueeze(-1)).clamp(0, 1),)
+
+
+class ImageBlend(Node):
+    FUNCTION = "image_blend"
+
+    def image_blend(self, image_a, image_b, blend_percentage):
+        h = min(image_a.shape[1], image_b.shape[1])
+        w = min(image_a.shape[2], image_b.shape[2])
+        return (image_a[:, :h, :w, :3] * (1 - blend_percentage) + image_b[:, :h, :w, :3] * blend_percentage,)
+
+
+class DetailTransfer(Node):
+    FUNCTION = "process"
+
+    def process(self, target, source, mode, blur_sigma, blend_factor, mask=None):
+        h = min(target.shape[1], source.shape[1])
+        w = min(target.shape[2], source.shape[2])
+        target, source = target[:, :h, :w, :3], source[:, :h, :w, :3]
+        detail = source - _nhwc(_gaussian_blur(_nchw(source), blur_sigma))
+        out = (target + detail * blend_factor).clamp(0, 1)
+        if mask is not None:
+            m = mask[:, :h, :w].unsqueeze(-1)
+            out = out * m + target * (1 - m)
+        return (out,)
+
+
+class RestoreDetail(Node):
+    FUNCTION = "batch_normalize"
+
+    def batch_normalize(self, images, detail, mode, blur_type, blur_size, factor):
+        h = min(images.shape[1], detail.shape[1])
+        w = min(images.shape[2], detail.shape[2])
+        images, detail = images[:, :h, :w, :3], detail[:, :h, :w, :3]
+        blurred = _nhwc(_gaussian_blur(_nchw(detail), blur_size / 3, blur_size))
+        return ((images + (detail - blurred) * factor).clamp(0, 1),)
+
+
+class LayerColorColorAdapter(Node):
+    FUNCTION = "color_adapter"
+
+    def color_adapter(self, image, color_ref_image, opacity):
+        ref = color_ref_image[..., :3]
+        mean, std = image.mean(dim=(1, 2), keepdim=True), image.std(dim=(1, 2), keepdim=True)
+        ref_mean, ref_std = ref.mean(dim=(1, 2), keepdim=True), ref.std(dim=(1, 2), keepdim=True)
+        adapted = ((image - mean) / std.clamp(min=1e-5) * ref_std + ref_mean).clamp(0, 1)
+        return (image + (adapted - image) * (opacity / 100),)
+
+
+class PreviewNode(Node):
+    """LayerMask: MaskPreview and Image Comparer only send previews to the web UI."""
+    FUNCTION = "preview"
+    OUTPUT_NODE = True
+
+    def preview(self, **kwargs):
+        return {"ui": {"images": []}}
+
+    def mask_preview(self, mask):
+        return self.preview(mask=mask)
+
+    def compare_images(self, image_a=None, image_b=None):
+        return self.preview(image_a=image_a, image_b=image_b)
+
+
+STUB_NODE_CLASS_MAPPINGS = {
+    "LoadAndApplyICLightUnet": LoadAndApplyICLightUnet,
+    "VAELoader": VAELoader,
+    "CR Image Size": CRImageSize,
+    "ImageResize+": ImageResizePlus,
+    "LayerColor: Exposure": LayerColorExposure,
+    "Image Blank": ImageBlank,
+    "Logic Boolean Primitive": LogicBooleanPrimitive,
+    "CR Set Value On Boolean": CRSetValueOnBoolean,
+    "CR Image Input Switch": CRImageInputSwitch,
+    "CR Text": CRText,
+    "easy imageRemBg": EasyImageRemBg,
+    "LayerUtility: ImageBlendAdvance V2": ImageBlendAdvanceV2,
+    "LayerColor: AutoAdjust": LayerColorAutoAdjust,
+    "CannyEdgePreprocessor": CannyEdgePreprocessor,
+    "GrowMaskWithBlur": GrowMaskWithBlur,
+    "ICLightConditioning": ICLightConditioning,
+    "Image Select Channel": ImageSelectChannel,
+    "LayerColor: Brightness & Contrast": LayerColorBrightnessContrast,
+    "Color Blend": ColorBlend,
+    "Image Blend": ImageBlend,
+    "DetailTransfer": DetailTransfer,
+    "RestoreDetail": RestoreDetail,
+    "LayerColor: ColorAdapter": LayerColorColorAdapter,
+    "LayerMask: MaskPreview": PreviewNode,
+    "Image Comparer (rgthree)": PreviewNode,
+}
@@ -0,0 +1,55 @@
+import logging
+
+from aiohttp import web
+
+
+class HeadlessPromptServer:
+    """
+    Stand-in for server.PromptServer.instance when nodes are only executed from a script.
+
+    Custom node packs register their HTTP routes and look up PromptServer.instance while they are
+    imported. This provides the attributes they touch without building the aiohttp application
+    stack, the user and model managers and the prompt queue of the real server. Messages that
+    nodes send to the web UI are dropped.
+    """
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.routes = web.RouteTableDef()
+        self.app = web.Application()
+        self.sockets = {}
+        self.client_id = None
+        self.last_node_id = None
+        self.last_prompt_id = None
+        self.number = 0
+        self.prompt_queue = None
+        self.supports = ["custom_nodes_from_web"]
+        self.on_prompt_handlers = []
+
+    def add_on_prompt_handler(self, handler):
+        self.on_prompt_handlers.append(handler)
+
+    def trigger_on_prompt(self, json_data):
+        for handler in self.on_prompt_handlers:
+            json_data = handler(json_data)
+        return json_data
+
+    def send_sync(self, event, data, sid=None):
+        logging.debug("Headless server dropped {} message".format(event))
+
+    async def send(self, event, data, sid=None):
+        self.send_sync(event, data, sid)
+
+    def send_progress_text(self, text, node_id, sid=None):
+        pass
+
+    def queue_updated(self):
+        pass
+
+
+def init_headless_server():
+    """Installs a HeadlessPromptServer as server.PromptServer.instance unless a real server exists."""
+    import server
+
+    if getattr(server.PromptServer, "instance", None) is None:
+        server.PromptServer.instance = HeadlessPromptServer()
+    return server.PromptServer.instance
@@ -0,0 +1,267 @@
+import concurrent.futures
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+import torch
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+import uint8_image
+
+#SaveImage hands its files to the writer pool instead of encoding them on the calling thread
+ASYNC_SAVE = os.environ.get("PROMOGENIE_ASYNC_SAVE", "0") == "1"
+WRITER_THREADS = int(os.environ.get("PROMOGENIE_IMAGE_WRITER_THREADS", "2"))
+
+
+def quantize_images(images):
+    """
+    Converts a batch of IMAGE tensors to a [B, H, W, C] uint8 numpy array in one vectorized op.
+
+    Values are scaled by 255, clamped and truncated like np.clip(255. * i, 0, 255).astype(np.uint8),
+    and only the uint8 result is copied off the device. The pixels of a UInt8Image are used as they are.
+    """
+    data = uint8_image.uint8_data(images)
+    if data is not None:
+        return data.cpu().numpy()
+    return torch.clamp(images * 255., 0, 255).to(torch.uint8).cpu().numpy()
+
+
+FORMATS = ["png", "jpeg", "webp", "webp_lossless"]
+EXTENSIONS = {"png": "png", "jpeg": "jpg", "webp": "webp", "webp_lossless": "webp"}
+#zlib strategies of the PNG encoder, rle and huffman_only compress photos about as well as the default at a fraction of the time
+PNG_STRATEGIES = {"default": None, "filtered": 1, "huffman_only": 2, "rle": 3, "fixed": 4}
+#Pillow refuses EXIF longer than a JPEG APP1 marker can hold
+JPEG_MAX_EXIF_BYTES = 65533
+
+
+def encoder_options(format="png", quality=90, png_compress_level=4, png_strategy="default", webp_method=4):
+    """
+    Returns the file extension and the PIL.Image.save keyword arguments of an output format.
+
+    quality is the JPEG and lossy WebP quality, for lossless WebP it is the compression effort.
+    webp_method trades WebP encoding speed (0) for size (6). JPEGs are written progressive with
+    optimized Huffman tables.
+    """
+    if format == "png":
+        save_kwargs = {"format": "PNG", "compress_level": png_compress_level}
+        if PNG_STRATEGIES[png_strategy] is not None:
+            save_kwargs["compress_type"] = PNG_STRATEGIES[png_strategy]
+        return "png", save_kwargs
+    if format == "jpeg":
+        return "jpg", {"format": "JPEG", "quality": quality, "progressive": True, "optimize": True}
+    if format == "webp":
+        return "webp", {"format": "WEBP", "quality": quality, "method": webp_method}
+    if format == "webp_lossless":
+        return "webp", {"format": "WEBP", "lossless": True, "quality": quality, "method": webp_method}
+    raise ValueError("Unknown image format {}, expected one of {}".format(format, ", ".join(FORMATS)))
+
+
+def image_metadata(format, prompt=None, extra_pnginfo=None):
+    """
+    Returns the PIL.Image.save keyword arguments embedding the prompt and workflow in a file.
+
+    PNGs get text chunks, JPEG and WebP files get EXIF tags in the layout of ComfyUI's animated WebP
+    node: the prompt in 0x0110 and the extra info from 0x010f downwards. Entries that would push the
+    EXIF of a JPEG past 64 KB are left out with a warning.
+    """
+    if format == "png":
+        metadata = PngInfo()
+        if prompt is not None:
+            metadata.add_text("prompt", json.dumps(prompt))
+        if extra_pnginfo is not None:
+            for x in extra_pnginfo:
+                metadata.add_text(x, json.dumps(extra_pnginfo[x]))
+        return {"pnginfo": metadata}
+
+    exif = Image.Exif()
+    entries = []
+    if prompt is not None:
+        entries.append((0x0110, "prompt", "prompt:{}".format(json.dumps(prompt))))
+    if extra_pnginfo is not None:
+        tag = 0x010f
+        for x in extra_pnginfo:
+            entries.append((tag, x, "{}:{}".format(x, json.dumps(extra_pnginfo[x]))))
+            tag -= 1
+    for tag, name, value in entries:
+        exif[tag] = value
+        #the EXIF of a JPEG has to fit one marker segment, a full workflow often doesn't
+        if format == "jpeg" and len(exif.tobytes()) > JPEG_MAX_EXIF_BYTES:
+            del exif[tag]
+            logging.warning("Not embedding {} in the JPEG, it doesn't fit the {} bytes of EXIF a JPEG can hold".format(name, JPEG_MAX_EXIF_BYTES))
+    return {"exif": exif.tobytes()}
+
+
+def save_array(array, path, **save_kwargs):
+    """Writes a uint8 [H, W, C] array to path, the alpha channel is dropped for JPEG which has none."""
+    img = Image.fromarray(array)
+    if img.mode == "RGBA" and save_kwargs.get("format", None) == "JPEG":
+        img = img.convert("RGB")
+    img.save(path, **save_kwargs)
+
+
+class WriteResult:
+    def __init__(self, path, seconds, size, error=None):
+        self.path = path
+        self.seconds = seconds
+        self.size = size
+        self.error = error
+
+
+class ImageWriter:
+    """
+    Encodes and writes images on a bounded pool of threads.
+
+    submit() returns as soon as the image is queued. At most max_pending images are queued or being
+    written at a time, submit() blocks beyond that so a fast producer can't pile up decoded images in
+    memory. Every finished write produces a WriteResult that is passed to the listeners and kept until
+    wait() returns it.
+    """
+    def __init__(self, workers=2, max_pending=8):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="image-writer")
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Condition()
+        self._pending = {}
+        self._results = []
+        self._listeners = []
+
+    def add_listener(self, fn):
+        """Calls fn(result) from the writer thread whenever a write finished or failed."""
+        self._listeners.append(fn)
+
+    def is_pending(self, path):
+        """Returns True if path is queued or being written, such files aren't on disk yet."""
+        with self._lock:
+            return os.path.abspath(path) in self._pending
+
+    def submit(self, array, path, **save_kwargs):
+        """Queues writing a uint8 [H, W, C] array to path, save_kwargs are passed to PIL.Image.save."""
+        self._slots.acquire()
+        path = os.path.abspath(path)
+        try:
+            future = self._executor.submit(self._write, array, path, save_kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending[path] = future
+        collected = getattr(_collecting, "futures", None)
+        if collected is not None:
+            collected.append(future)
+        future.add_done_callback(lambda f: self._done(path, f))
+        return future
+
+    def _write(self, array, path, save_kwargs):
+        start = time.perf_counter()
+        save_array(array, path, **save_kwargs)
+        return WriteResult(path, time.perf_counter() - start, os.path.getsize(path))
+
+    def _done(self, path, future):
+        error = future.exception()
+        result = future.result() if error is None else WriteResult(path, 0.0, 0, error)
+        if error is not None:
+            logging.error("Could not write {}: {}".format(path, error))
+        else:
+            logging.debug("Wrote {} ({:.1f} KB) in {:.2f}s".format(path, result.size / 1024, result.seconds))
+        try:
+            for fn in self._listeners:
+                fn(result)
+        finally:
+            with self._lock:
+                if self._pending.get(path, None) is future:
+                    del self._pending[path]
+                self._results.append(result)
+                self._lock.notify_all()
+            self._slots.release()
+
+    def wait(self, timeout=None):
+        """Waits until every queued image is written and returns the WriteResults since the last wait()."""
+        with self._lock:
+            self._lock.wait_for(lambda: len(self._pending) == 0, timeout=timeout)
+            results = self._results
+            self._results = []
+        return results
+
+    def shutdown(self):
+        self.wait()
+        self._executor.shutdown(wait=True)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+_collecting = threading.local()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ImageWriter(workers=WRITER_THREADS)
+        return _writer
+
+
+def set_async(enabled):
+    """Enables or disables writing the files of SaveImage and PreviewImage on the writer pool."""
+    global ASYNC_SAVE
+    ASYNC_SAVE = enabled
+
+
+def wait(timeout=None):
+    """Waits for the writer pool, returns the WriteResults since the last wait() or [] if it was never used."""
+    with _writer_lock:
+        writer = _writer
+    if writer is None:
+        return []
+    return writer.wait(timeout)
+
+
+@contextlib.contextmanager
+def collect_writes():
+    """Collects the futures of the images submitted from this thread inside the block into the yielded list."""
+    previous = getattr(_collecting, "futures", None)
+    futures = []
+    _collecting.futures = futures
+    try:
+        yield futures
+    finally:
+        _collecting.futures = previous
+        if previous is not None:
+            previous.extend(futures)
+
+
+def when_written(futures, fn):
+    """
+    Calls fn() once all futures (of collect_writes() or of earlier when_written() calls) are done and
+    returns a future of its result. If one of them failed the returned future fails with its error and
+    fn isn't called. fn runs on the thread that finished the last future, right away if all are done.
+    """
+    futures = list(futures)
+    result = concurrent.futures.Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def finish():
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if len(errors) > 0:
+            result.set_exception(errors[0])
+            return
+        try:
+            result.set_result(fn())
+        except Exception as e:
+            result.set_exception(e)
+
+    def done(future):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            finish()
+
+    if len(futures) == 0:
+        finish()
+    for future in futures:
+        future.add_done_callback(done)
+    return result
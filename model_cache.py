@@ -0,0 +1,407 @@
+import collections
+import functools
+import hashlib
+import logging
+import marshal
+import os
+import threading
+import types
+import weakref
+
+import torch
+
+import folder_paths
+
+
+def file_fingerprint(path):
+    """
+    Returns a cheap fingerprint of a model file: the resolved path, its size and its modification time.
+    Replacing or re-downloading the file changes the fingerprint so stale entries are never returned.
+    """
+    real_path = os.path.realpath(path)
+    st = os.stat(real_path)
+    return (real_path, st.st_size, st.st_mtime_ns)
+
+
+class FileDigestCache:
+    """
+    Remembers the content digest of files so unchanged files are not read again.
+
+    Digests are keyed by the resolved path and validated against the size, modification time and
+    inode of the file, a file is only hashed again (streamed in chunks with blake2b) when one of them
+    changed. At most max_entries files are remembered, least recently used first out.
+    """
+    def __init__(self, max_entries=4096, chunk_size=1024 * 1024):
+        self.max_entries = max_entries
+        self.chunk_size = chunk_size
+        self.hits = 0
+        self.misses = 0
+        self.bytes_hashed = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def digest(self, path):
+        """Returns the hex digest of the content of the file at path."""
+        real_path = os.path.realpath(path)
+        st = os.stat(real_path)
+        key = (st.st_size, st.st_mtime_ns, st.st_ino)
+        with self._lock:
+            entry = self._entries.get(real_path, None)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(real_path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        m = hashlib.blake2b(digest_size=16)
+        size = 0
+        with open(real_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                m.update(chunk)
+                size += len(chunk)
+        digest = m.hexdigest()
+
+        with self._lock:
+            self.bytes_hashed += size
+            self._entries[real_path] = (key, digest)
+            self._entries.move_to_end(real_path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return digest
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / max(1, self.hits + self.misses),
+                "bytes_hashed": self.bytes_hashed,
+            }
+
+    def format_stats(self):
+        s = self.stats()
+        return "File digests: {} hits, {} misses ({:.0%} hit rate), {:.1f} MB hashed, {} files".format(
+            s["hits"], s["misses"], s["hit_rate"], s["bytes_hashed"] / (1024 * 1024), s["entries"])
+
+
+def get_cache_directory(name):
+    """Returns the directory for a persistent cache, PROMOGENIE_CACHE_DIR overrides the default ComfyUI/cache location."""
+    base = os.environ.get("PROMOGENIE_CACHE_DIR", os.path.join(folder_paths.base_path, "cache"))
+    path = os.path.join(base, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def prune_cache_directory(path, max_bytes):
+    """
+    Deletes the least recently used files of an on disk cache until it takes at most max_bytes.
+
+    Recency is the modification time, caches call touch() on the files they read. Returns the number
+    of bytes freed.
+    """
+    entries = []
+    for entry in os.scandir(path):
+        if entry.is_file() and not entry.name.endswith(".tmp"):
+            st = entry.stat()
+            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+    total = sum(e[1] for e in entries)
+    freed = 0
+    for _, size, file_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(file_path)
+        except OSError:
+            continue
+        total -= size
+        freed += size
+    if freed > 0:
+        logging.debug("Removed {:.1f} MB of old cache files from {}".format(freed / (1024 * 1024), path))
+    return freed
+
+
+def touch(path):
+    """Marks a cache file as recently used for prune_cache_directory."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def tag_source(model, fingerprint):
+    """Records which files a model was built from, the tag is shared by all clones of the model."""
+    if model is not None:
+        model.source_fingerprint = fingerprint
+
+
+def get_source(model):
+    return getattr(model, "source_fingerprint", None)
+
+
+#id(tensor) -> (weakref, version, digest), tensors can't be WeakKeyDictionary keys since their == is elementwise
+_tensor_digests = {}
+
+def _forget_tensor_digest(ref, key):
+    entry = _tensor_digests.get(key, None)
+    if entry is not None and entry[0] is ref:
+        del _tensor_digests[key]
+
+def tag_tensor_sources(tensors, fingerprint):
+    """
+    Records the file and key every tensor of a loaded state dict came from. tensor_digest identifies
+    tagged tensors by that instead of hashing their content, they must not be modified in place.
+    """
+    for key, t in tensors.items():
+        if isinstance(t, torch.Tensor):
+            tag_source(t, (fingerprint, key))
+
+
+def tag_patch_sources(model, fingerprint, base=None):
+    """
+    Tags the tensors of the patches that were added to model (a ModelPatcher) on top of base with the
+    file they were loaded from, for patches applied by loaders that don't go through tag_tensor_sources.
+    """
+    def tag(value, path):
+        if isinstance(value, torch.Tensor):
+            if get_source(value) is None:
+                tag_source(value, (fingerprint,) + path)
+        elif isinstance(value, (list, tuple)):
+            for i, v in enumerate(value):
+                tag(v, path + (i,))
+
+    for key, entries in model.patches.items():
+        start = len(base.patches.get(key, [])) if base is not None else 0
+        for index in range(start, len(entries)):
+            tag(entries[index], (repr(key), index))
+
+
+def has_untagged_tensors(obj, depth=0):
+    """
+    Returns True if obj (for example the patches of a ModelPatcher) holds tensors without a source tag,
+    those would have to be hashed in full by structure_digest.
+    """
+    if isinstance(obj, torch.Tensor):
+        return get_source(obj) is None
+    if depth >= 8:
+        return False
+    if isinstance(obj, dict):
+        return any(has_untagged_tensors(v, depth + 1) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(has_untagged_tensors(v, depth + 1) for v in obj)
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        return any(has_untagged_tensors(v, depth + 1) for v in vars(obj).values())
+    return False
+
+
+def tensor_digest(t):
+    """
+    Returns a hex digest of the dtype, shape and content of a tensor.
+    Tensors tagged with the file they were loaded from are identified by it without reading them.
+    Other digests are remembered per tensor until it is modified in place. Tensors created in inference
+    mode have no version counter so in place changes can't be detected, they are hashed every time.
+    """
+    source = get_source(t)
+    if source is not None:
+        m = hashlib.blake2b(digest_size=16)
+        m.update("source:{!r}{}{}".format(source, t.dtype, tuple(t.shape)).encode())
+        return m.hexdigest()
+    inference = t.is_inference()
+    cached = None if inference else _tensor_digests.get(id(t), None)
+    if cached is not None and cached[0]() is t and cached[1] == t._version:
+        return cached[2]
+    data = t.detach().cpu().contiguous()
+    m = hashlib.blake2b(digest_size=16)
+    m.update("{}{}".format(data.dtype, tuple(data.shape)).encode())
+    m.update(data.reshape(-1).view(torch.uint8).numpy())
+    digest = m.hexdigest()
+    if inference:
+        return digest
+    key = id(t)
+    _tensor_digests[key] = (weakref.ref(t, lambda ref: _forget_tensor_digest(ref, key)), t._version, digest)
+    return digest
+
+
+class Unhashable(Exception):
+    pass
+
+#(type, fn) pairs, fn returns the parts of an object that identify it for structure_digest
+_digest_handlers = []
+
+def register_digest(cls, fn):
+    """Registers how structure_digest hashes instances of cls, for objects that can't be hashed through their attributes."""
+    _digest_handlers.append((cls, fn))
+
+def require_source(model):
+    """Returns the source fingerprint of model, raises Unhashable for models that weren't created by a known loader."""
+    source = None if model is None else get_source(model)
+    if source is None:
+        raise Unhashable("{} has no source fingerprint".format(type(model).__name__))
+    return source
+
+def structure_digest(obj, m=None):
+    """
+    Returns a hex digest of nested lists, tuples, dicts, tensors and plain values, for example model patches.
+    Objects are hashed through their attributes. Raises Unhashable for anything that can't be hashed reliably.
+    """
+    top = m is None
+    if top:
+        m = hashlib.blake2b(digest_size=16)
+    _update_digest(m, obj, set(), 0)
+    if top:
+        return m.hexdigest()
+
+def _update_digest(m, obj, visiting, depth):
+    if depth > 32:
+        raise Unhashable("structure too deep")
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        m.update("{}:{!r};".format(type(obj).__name__, obj).encode())
+    elif isinstance(obj, torch.Tensor):
+        m.update("tensor:{};".format(tensor_digest(obj)).encode())
+    elif isinstance(obj, (torch.device, torch.dtype)):
+        m.update("{};".format(obj).encode())
+    elif isinstance(obj, functools.partial):
+        m.update(b"partial:")
+        _update_digest(m, (obj.func, obj.args, obj.keywords), visiting, depth + 1)
+    elif isinstance(obj, types.MethodType):
+        #the same method of two instances computes different things, hash the instance too
+        m.update(b"method:")
+        _update_digest(m, (obj.__func__, obj.__self__), visiting, depth + 1)
+    elif isinstance(obj, types.FunctionType):
+        #closures and default arguments hold values that only show up when the function is called
+        if obj.__closure__:
+            raise Unhashable("{} is a closure".format(obj.__qualname__))
+        m.update("fn:{}.{};".format(obj.__module__, obj.__qualname__).encode())
+        #lambdas of one scope share their name
+        m.update(hashlib.blake2b(marshal.dumps(obj.__code__), digest_size=16).digest())
+        _update_digest(m, (obj.__defaults__, obj.__kwdefaults__), visiting, depth + 1)
+    elif isinstance(obj, type) or (isinstance(obj, types.BuiltinFunctionType) and isinstance(getattr(obj, "__self__", None), (types.ModuleType, type(None)))):
+        m.update("fn:{}.{};".format(getattr(obj, "__module__", ""), obj.__qualname__).encode())
+    else:
+        if id(obj) in visiting:
+            raise Unhashable("reference cycle")
+        visiting.add(id(obj))
+        handler = next((fn for cls, fn in _digest_handlers if isinstance(obj, cls)), None)
+        if handler is not None:
+            m.update("{}:".format(type(obj).__qualname__).encode())
+            _update_digest(m, handler(obj), visiting, depth + 1)
+        elif isinstance(obj, (list, tuple)):
+            m.update("{}[{}]".format(type(obj).__name__, len(obj)).encode())
+            for v in obj:
+                _update_digest(m, v, visiting, depth + 1)
+        elif isinstance(obj, dict):
+            m.update("dict[{}]".format(len(obj)).encode())
+            for k in sorted(obj.keys(), key=repr):
+                _update_digest(m, k, visiting, depth + 1)
+                _update_digest(m, obj[k], visiting, depth + 1)
+        elif get_source(obj) is not None:
+            m.update("source:{!r};".format(get_source(obj)).encode())
+        elif hasattr(obj, "__dict__") and not isinstance(obj, torch.nn.Module):
+            m.update("obj:{}.{}".format(type(obj).__module__, type(obj).__qualname__).encode())
+            _update_digest(m, vars(obj), visiting, depth + 1)
+        else:
+            raise Unhashable("can't hash {}".format(type(obj).__name__))
+        visiting.discard(id(obj))
+
+
+def budget_from_env(name, default_mb):
+    """Reads a cache budget in megabytes from the environment and returns it in bytes."""
+    value = os.environ.get(name, "")
+    try:
+        mb = float(value) if value != "" else default_mb
+    except ValueError:
+        logging.warning("Invalid value for {}: {}, using {} MB".format(name, value, default_mb))
+        mb = default_mb
+    return int(mb * 1024 * 1024)
+
+
+class LRUCache:
+    """
+    A thread safe least recently used cache with a byte budget.
+
+    Every entry is stored with the number of bytes it is accounted for. When the budget is exceeded
+    the least recently used entries are evicted. A budget of 0 disables the cache.
+    """
+    def __init__(self, name, max_bytes):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                if self.max_bytes > 0:
+                    logging.info("{} cache: entry of {:.1f} MB exceeds the budget of {:.1f} MB, not caching".format(self.name, size / (1024 * 1024), self.max_bytes / (1024 * 1024)))
+                return
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            self._evict()
+
+    def get_or_load(self, key, loader, size_fn):
+        """Returns the cached value for key, calling loader() and caching its result on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.put(key, value, size_fn(value))
+        return value
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and len(self._entries) > 0:
+            key, (value, size) = self._entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+            logging.debug("{} cache: evicted {}".format(self.name, key))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def format_stats(self):
+        s = self.stats()
+        return "{} cache: {} hits, {} misses, {} evictions, {} entries using {:.1f}/{:.1f} MB".format(
+            s["name"], s["hits"], s["misses"], s["evictions"], s["entries"], s["bytes"] / (1024 * 1024), s["max_bytes"] / (1024 * 1024))
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import model_cache
+
+#bump when the stored layout changes so old manifests are ignored
+MANIFEST_VERSION = 1
+
+#directories of node packs that don't contain python code the pack could import
+_SKIP_DIRECTORIES = {"__pycache__", ".git", "node_modules", "web", "js", "docs", "examples", "example_workflows"}
+
+
+class LazyNodeClassMappings(dict):
+    """
+    NODE_CLASS_MAPPINGS that imports the module providing a node the first time the node is looked up.
+
+    Modules are registered with add_provider(names, loader) from their manifest entry instead of being
+    imported. Their names are reported by `in` and resolved by [] and get(), but they only show up in
+    keys(), items() and iteration once the module was imported. load_all() imports every pending module.
+
+    loader is called with the set of names that it still provides, names that were registered by another
+    module in the meantime are not overwritten.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._providers = {}
+        self._lock = threading.RLock()
+
+    def add_provider(self, names, loader):
+        with self._lock:
+            for name in names:
+                self._providers[name] = loader
+
+    def lazy_names(self):
+        """Returns the names of the nodes whose module hasn't been imported yet."""
+        return set(self._providers)
+
+    def load(self, name):
+        """Imports the module providing name if it is pending, returns False if there is no such node."""
+        with self._lock:
+            if dict.__contains__(self, name):
+                return True
+            loader = self._providers.get(name, None)
+            if loader is None:
+                return False
+            names = {n for n, l in self._providers.items() if l is loader}
+            for n in names:
+                del self._providers[n]
+            loader(names)
+            return dict.__contains__(self, name)
+
+    def load_all(self):
+        while len(self._providers) > 0:
+            self.load(next(iter(self._providers)))
+
+    def __missing__(self, name):
+        if self.load(name):
+            return dict.__getitem__(self, name)
+        raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        with self._lock:
+            self._providers.pop(name, None)
+            dict.__setitem__(self, name, value)
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self._providers
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+
+def source_key(module_path):
+    """
+    Returns a key that changes whenever the python source of a node module or node pack changes.
+
+    Packs are keyed by the size and modification time of every .py file below the pack directory so
+    nothing has to be read, directories without python code (web, docs, .git, ...) are skipped.
+    """
+    if os.path.isfile(module_path):
+        return repr(model_cache.file_fingerprint(module_path))
+
+    m = hashlib.blake2b(digest_size=16)
+    root = os.path.realpath(module_path)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in _SKIP_DIRECTORIES)
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                st = os.stat(os.path.join(dirpath, filename))
+                m.update("{}\0{}\0{}\0".format(os.path.relpath(os.path.join(dirpath, filename), root), st.st_size, st.st_mtime_ns).encode())
+    return m.hexdigest()
+
+
+class NodeManifest:
+    """
+    Persistent record of the nodes every node module provides, stored as json in the cache directory.
+
+    An entry is only valid while the source of the module is unchanged (see source_key) so editing or
+    updating a node pack makes it be imported and recorded again.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(model_cache.get_cache_directory("nodes"), "manifest.json")
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self._sources = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version", None) == MANIFEST_VERSION:
+                    self.entries = data["modules"]
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning("Ignoring unreadable node manifest {}: {}".format(path, e))
+
+    def source(self, module_path):
+        """Returns the source_key of module_path, computed once per manifest instance since packs are walked."""
+        key = self._sources.get(module_path, None)
+        if key is None:
+            key = source_key(module_path)
+            self._sources[module_path] = key
+        return key
+
+    def lookup(self, module_path):
+        """Returns the entry of module_path or None if it is unknown or its source changed."""
+        entry = self.entries.get(os.path.realpath(module_path), None)
+        if entry is None or entry["source"] != self.source(module_path):
+            return None
+        return entry
+
+    def record(self, module_path, extension_name, node_names, display_names, web_directory=None):
+        entry = {
+            "source": self.source(module_path),
+            "extension": extension_name,
+            "nodes": sorted(node_names),
+            "display_names": {k: v for k, v in display_names.items() if isinstance(k, str) and isinstance(v, str)},
+            "web_directory": web_directory,
+        }
+        with self._lock:
+            self.entries[os.path.realpath(module_path)] = entry
+            self.dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump({"version": MANIFEST_VERSION, "modules": self.entries}, f, indent=1, sort_keys=True)
+                os.replace(temp_path, self.path)
+                self.dirty = False
+            except OSError as e:
+                logging.warning("Could not write node manifest {}: {}".format(self.path, e))
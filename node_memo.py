@@ -0,0 +1,61 @@
+import logging
+import time
+
+from node_wrapper import WrappedNodeMappings
+
+
+class MemoizingNodeMappings(WrappedNodeMappings):
+    """
+    Wraps NODE_CLASS_MAPPINGS so that repeated pure node calls within a run are only executed once.
+
+    Looking up a node returns its class wrapped so that instances memoize calls of the node FUNCTION.
+    A call is identified by the node class, the function and its inputs: plain values (strings, numbers,
+    booleans) are compared by value and everything else (tensors, models, conditioning) by identity.
+    Inputs are kept referenced by the cache so identities stay valid for its whole lifetime.
+
+    OUTPUT_NODE and NOT_IDEMPOTENT nodes are never memoized since they have side effects.
+    """
+    def __init__(self, node_class_mappings):
+        super().__init__(node_class_mappings, self.call)
+        self.cache = {}
+        self.calls = 0
+        self.deduped = []
+
+    def is_memoizable(self, node):
+        node_cls = type(node)
+        return not getattr(node_cls, "OUTPUT_NODE", False) and not getattr(node_cls, "NOT_IDEMPOTENT", False)
+
+    def call(self, class_name, node, function_name, function, args, kwargs):
+        if not self.is_memoizable(node):
+            return function(*args, **kwargs)
+        key = (class_name, function_name, input_key(args), input_key(sorted(kwargs.items())))
+        self.calls += 1
+        entry = self.cache.get(key, None)
+        if entry is not None:
+            output, duration, _ = entry
+            self.deduped.append((class_name, function_name, duration))
+            logging.info("Reused output of {}.{}, saved {:.3f} seconds".format(class_name, function_name, duration))
+            return output
+
+        start = time.perf_counter()
+        output = function(*args, **kwargs)
+        self.cache[key] = (output, time.perf_counter() - start, (args, kwargs))
+        return output
+
+    def saved_seconds(self):
+        return sum(d[2] for d in self.deduped)
+
+    def summary(self):
+        return "Deduplicated {} of {} node calls, saved {:.2f} seconds".format(len(self.deduped), self.calls, self.saved_seconds())
+
+    def clear(self):
+        self.cache.clear()
+
+
+def input_key(value):
+    """Builds a hashable key for a node input, plain values by value and everything else by identity."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return (type(value), value)
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(input_key(v) for v in value))
+    return ("id", id(value))
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import psutil
+import torch
+
+from node_wrapper import wrap_node_mappings
+from uint8_image import UInt8Image
+
+
+class NodeTracer:
+    """
+    Records every node call made through its node mappings and exports them as a Chrome trace.
+
+    Each call becomes a complete ("X") event with the node class and function, the thread it ran on,
+    the shapes and dtypes of its tensor inputs and outputs, the bytes of its output tensors, the change
+    of the CUDA memory allocated (when CUDA is used) and the process RSS after the call. RSS is also
+    emitted as a counter track. The file opens in chrome://tracing and https://ui.perfetto.dev.
+
+    RSS misses CPU tensors that reuse freed memory. With profile_memory the CPU allocations of every
+    call are recorded with torch.profiler as well, which slows the nodes down. Only one profiler can
+    run per process, calls overlapping a profiled call on another thread are recorded without them.
+    """
+    def __init__(self, profile_memory=False):
+        self.events = []
+        self.profile_memory = profile_memory
+        self._profiler_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._process = psutil.Process()
+        self._start = time.perf_counter()
+        self._threads = {}
+
+    def node_mappings(self, node_mappings):
+        """Wraps node mappings so that every node FUNCTION call is traced."""
+        return wrap_node_mappings(node_mappings, self.call)
+
+    def _timestamp(self, t):
+        return (t - self._start) * 1e6
+
+    def _start_memory_profile(self):
+        if not self.profile_memory or not self._profiler_lock.acquire(blocking=False):
+            return None
+        try:
+            profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], profile_memory=True)
+            profiler.start()
+        except BaseException:
+            self._profiler_lock.release()
+            raise
+        return profiler
+
+    def _stop_memory_profile(self, profiler):
+        """Returns the bytes allocated by the call and the change of allocated bytes, both on the CPU."""
+        try:
+            profiler.stop()
+            usage = [e.self_cpu_memory_usage for e in profiler.events() if e.self_cpu_memory_usage != 0]
+        finally:
+            self._profiler_lock.release()
+        return sum(u for u in usage if u > 0), sum(usage)
+
+    def call(self, class_name, node, function_name, function, args, kwargs):
+        cuda = torch.cuda.is_available() and torch.cuda.is_initialized()
+        allocated_before = torch.cuda.memory_allocated() if cuda else 0
+        rss_before = self._process.memory_info().rss
+        profiler = self._start_memory_profile()
+        start = time.perf_counter()
+        error = None
+        try:
+            output = function(*args, **kwargs)
+            return output
+        except Exception as e:
+            output = None
+            error = e
+            raise
+        finally:
+            end = time.perf_counter()
+            cpu_allocations = None if profiler is None else self._stop_memory_profile(profiler)
+            rss = self._process.memory_info().rss
+            event_args = {
+                "function": function_name,
+                "inputs": {k: describe(v) for k, v in kwargs.items()},
+                "outputs": describe(output),
+                "output_bytes": tensor_bytes(output),
+                "rss_bytes": rss,
+                "rss_delta_bytes": rss - rss_before,
+            }
+            if len(args) > 0:
+                event_args["args"] = [describe(v) for v in args]
+            if cuda:
+                event_args["cuda_allocated_delta_bytes"] = torch.cuda.memory_allocated() - allocated_before
+            if cpu_allocations is not None:
+                event_args["cpu_allocated_bytes"], event_args["cpu_allocated_delta_bytes"] = cpu_allocations
+            if error is not None:
+                event_args["error"] = "{}: {}".format(type(error).__name__, error)
+
+            thread = threading.current_thread()
+            with self._lock:
+                self._threads[thread.ident] = thread.name
+                self.events.append({"name": class_name, "cat": "node", "ph": "X", "pid": os.getpid(), "tid": thread.ident,
+                                    "ts": self._timestamp(start), "dur": (end - start) * 1e6, "args": event_args})
+                self.events.append({"name": "RSS", "ph": "C", "pid": os.getpid(), "ts": self._timestamp(end), "args": {"MB": rss / (1024 * 1024)}})
+
+    def write(self, path):
+        with self._lock:
+            events = list(self.events)
+            events.append({"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": "PromoGenie"}})
+            for ident, name in self._threads.items():
+                events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": ident, "args": {"name": name}})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        logging.info("Wrote node trace with {} node calls to {}".format(sum(1 for e in events if e["ph"] == "X"), path))
+
+
+def describe(value, depth=0):
+    """Returns a json friendly description of a node input or output: shape and dtype of tensors, plain values as they are."""
+    if isinstance(value, torch.Tensor):
+        return {"shape": list(value.shape), "dtype": str(value.dtype).replace("torch.", ""), "device": str(value.device)}
+    if isinstance(value, UInt8Image):
+        return {"shape": list(value.shape), "dtype": "uint8 image", "device": str(value.device)}
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= 80 else value[:77] + "..."
+    if depth >= 3:
+        return type(value).__name__
+    if isinstance(value, dict):
+        return {str(k): describe(v, depth + 1) for k, v in value.items() if isinstance(v, (torch.Tensor, bool, int, float, str, list, tuple, dict))}
+    if isinstance(value, (list, tuple)):
+        if len(value) > 8:
+            return "{}[{}]".format(type(value).__name__, len(value))
+        return [describe(v, depth + 1) for v in value]
+    return type(value).__name__
+
+
+def tensor_bytes(value, depth=0):
+    """Returns the bytes of the tensors in a node output."""
+    if isinstance(value, (torch.Tensor, UInt8Image)):
+        return value.nbytes
+    if depth >= 3:
+        return 0
+    if isinstance(value, dict):
+        return sum(tensor_bytes(v, depth + 1) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(tensor_bytes(v, depth + 1) for v in value)
+    return 0
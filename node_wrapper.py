@@ -0,0 +1,46 @@
+class WrappedNodeMappings:
+    """
+    Node mappings facade passing every node FUNCTION call through around_call.
+
+    Looking up a node returns a factory for instances whose FUNCTION attribute calls
+    around_call(class_name, node, function_name, function, args, kwargs) instead, around_call is
+    expected to call function(*args, **kwargs) itself. Other node attributes and attributes of the
+    mappings (summary() of wrapped memoizing mappings) are forwarded, so wrappers can be stacked.
+    """
+    def __init__(self, node_class_mappings, around_call):
+        self.node_class_mappings = node_class_mappings
+        self.around_call = around_call
+
+    def __getitem__(self, name):
+        create_node = self.node_class_mappings[name]
+
+        def create(*args, **kwargs):
+            return WrappedNode(self.around_call, name, create_node(*args, **kwargs))
+        return create
+
+    def __contains__(self, name):
+        return name in self.node_class_mappings
+
+    def __getattr__(self, name):
+        return getattr(self.node_class_mappings, name)
+
+
+class WrappedNode:
+    def __init__(self, around_call, class_name, node):
+        self._around_call = around_call
+        self._class_name = class_name
+        self._node = node
+
+    def __getattr__(self, name):
+        attr = getattr(self._node, name)
+        if name != getattr(self._node, "FUNCTION", None):
+            return attr
+
+        def wrapped(*args, **kwargs):
+            return self._around_call(self._class_name, self._node, name, attr, args, kwargs)
+        return wrapped
+
+
+def wrap_node_mappings(node_class_mappings, around_call):
+    """Wraps node mappings so that every node FUNCTION call goes through around_call, see WrappedNodeMappings."""
+    return WrappedNodeMappings(node_class_mappings, around_call)
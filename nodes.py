@@ -3,17 +3,16 @@ import torch
 import os
 import sys
 import json
-import hashlib
 import traceback
 import math
 import time
 import random
 import logging
 
-from PIL import Image, ImageOps, ImageSequence, ImageFile
-from PIL.PngImagePlugin import PngInfo
+from PIL import Image, ImageOps, ImageFile
 
 import numpy as np
+import psutil
 import safetensors.torch
 
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "comfy"))
@@ -24,17 +23,26 @@ import comfy.sample
 import comfy.sd
 import comfy.utils
 import comfy.controlnet
+import comfy.model_patcher
 
 import comfy.clip_vision
 
 import comfy.model_management
 from comfy.cli_args import args
 
+import concurrent.futures
+import functools
 import importlib
 
 import folder_paths
+import image_writer
 import latent_preview
 import node_helpers
+import model_cache
+import node_manifest
+import prompt_cache
+import sample_cache
+import uint8_image
 
 def before_node_execution():
     comfy.model_management.throw_exception_if_processing_interrupted()
@@ -44,6 +52,46 @@ def interrupt_processing(value=True):
 
 MAX_RESOLUTION=16384
 
+#loaded (MODEL, CLIP, VAE) triples keyed by checkpoint file fingerprint, accounted by file size
+#off unless configured, the server already keeps the models of the current graph, the batch runner enables it
+CHECKPOINT_CACHE = model_cache.LRUCache("Checkpoint", model_cache.budget_from_env("PROMOGENIE_CHECKPOINT_CACHE_MB", 0))
+#loaded controlnets keyed by file fingerprint, loaders hand out copies that share the weights
+#off unless configured like CHECKPOINT_CACHE, the batch runner enables it
+CONTROLNET_CACHE = model_cache.LRUCache("ControlNet", model_cache.budget_from_env("PROMOGENIE_CONTROLNET_CACHE_MB", 0))
+#decoded LoadImage outputs keyed by file fingerprint, campaigns reuse the same backgrounds for many products
+IMAGE_CACHE = model_cache.LRUCache("Image", model_cache.budget_from_env("PROMOGENIE_IMAGE_CACHE_MB", 1024))
+#content digests of the input files for IS_CHANGED, only files whose size, mtime or inode changed are read again
+FILE_DIGESTS = model_cache.FileDigestCache()
+
+#ModelPatcher state that changes what the model computes but isn't covered by its digest, patchers using any of it aren't cached
+_UNHASHED_PATCHER_STATE = ("additional_models", "callbacks", "wrappers", "injections", "hook_patches", "current_hooks", "forced_hooks", "weight_wrapper_patches")
+
+def _is_empty(value):
+    if value is None:
+        return True
+    if isinstance(value, dict):
+        return all(_is_empty(v) for v in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return all(_is_empty(v) for v in value)
+    return False
+
+def _model_patcher_digest(m):
+    for name in _UNHASHED_PATCHER_STATE:
+        if not _is_empty(getattr(m, name, None)):
+            raise model_cache.Unhashable("ModelPatcher has {}".format(name))
+    return (model_cache.require_source(m.model), m.patches, m.object_patches, m.model_options)
+
+#models and controlnets are identified by the files they were loaded from and what was applied on top of them
+model_cache.register_digest(comfy.model_patcher.ModelPatcher, _model_patcher_digest)
+
+def _control_digest(c):
+    control_model = getattr(c, "control_model", getattr(c, "t2i_model", None))
+    control_weights = getattr(c, "control_weights", None)
+    source = model_cache.require_source(control_model) if control_weights is None else None
+    return (source, control_weights, c.cond_hint_original, c.strength, c.timestep_percent_range, c.previous_controlnet, getattr(c, "extra_concat_orig", None))
+
+model_cache.register_digest(comfy.controlnet.ControlBase, _control_digest)
+
 class CLIPTextEncode:
     @classmethod
     def INPUT_TYPES(s):
@@ -61,9 +109,17 @@ class CLIPTextEncode:
     DESCRIPTION = "Encodes a text prompt using a CLIP model into an embedding that can be used to guide the diffusion model towards generating specific images."
 
     def encode(self, clip, text):
+        key = prompt_cache.prompt_key(clip, text)
+        if key is not None:
+            cached = prompt_cache.load(key)
+            if cached is not None:
+                return ([cached], )
+
         tokens = clip.tokenize(text)
         output = clip.encode_from_tokens(tokens, return_pooled=True, return_dict=True)
         cond = output.pop("cond")
+        if key is not None:
+            prompt_cache.store(key, cond, output)
         return ([[cond, output]], )
 
 class ConditioningCombine:
@@ -490,10 +546,7 @@ class LoadLatent:
     @classmethod
     def IS_CHANGED(s, latent):
         image_path = folder_paths.get_annotated_filepath(latent)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return FILE_DIGESTS.digest(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, latent):
@@ -537,8 +590,20 @@ class CheckpointLoaderSimple:
 
     def load_checkpoint(self, ckpt_name):
         ckpt_path = folder_paths.get_full_path_or_raise("checkpoints", ckpt_name)
+        key = model_cache.file_fingerprint(ckpt_path)
+        out = CHECKPOINT_CACHE.get(key)
+        if out is not None:
+            logging.info("Reusing loaded checkpoint {}".format(ckpt_name))
+            return out
+
         out = comfy.sd.load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, embedding_directory=folder_paths.get_folder_paths("embeddings"))
-        return out[:3]
+        out = out[:3]
+        if out[0] is not None:
+            model_cache.tag_source(out[0].model, key)
+        if out[1] is not None:
+            model_cache.tag_source(out[1].cond_stage_model, key)
+        CHECKPOINT_CACHE.put(key, out, key[1])
+        return out
 
 class DiffusersLoader:
     @classmethod
@@ -637,6 +702,8 @@ class LoraLoader:
 
         if lora is None:
             lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
+            #the patches reference these tensors, cache keys then hash the file fingerprint instead of the weights
+            model_cache.tag_tensor_sources(lora, model_cache.file_fingerprint(lora_path))
             self.loaded_lora = (lora_path, lora)
 
         model_lora, clip_lora = comfy.sd.load_lora_for_models(model, clip, lora, strength_model, strength_clip)
@@ -756,8 +823,13 @@ class ControlNetLoader:
 
     def load_controlnet(self, control_net_name):
         controlnet_path = folder_paths.get_full_path_or_raise("controlnet", control_net_name)
-        controlnet = comfy.controlnet.load_controlnet(controlnet_path)
-        return (controlnet,)
+        key = model_cache.file_fingerprint(controlnet_path)
+        controlnet = CONTROLNET_CACHE.get(key)
+        if controlnet is None:
+            controlnet = comfy.controlnet.load_controlnet(controlnet_path)
+            model_cache.tag_source(getattr(controlnet, "control_model", getattr(controlnet, "t2i_model", None)), key)
+            CONTROLNET_CACHE.put(key, controlnet, key[1])
+        return (controlnet.copy(),)
 
 class DiffControlNetLoader:
     @classmethod
@@ -772,8 +844,18 @@ class DiffControlNetLoader:
 
     def load_controlnet(self, model, control_net_name):
         controlnet_path = folder_paths.get_full_path_or_raise("controlnet", control_net_name)
-        controlnet = comfy.controlnet.load_controlnet(controlnet_path, model)
-        return (controlnet,)
+        #diff controlnets are built on top of the model weights, the key covers the model's source and patches
+        #so clones of the same model share the entry, models that can't be identified aren't cached
+        try:
+            key = model_cache.file_fingerprint(controlnet_path) + (model_cache.structure_digest(model),)
+        except model_cache.Unhashable as e:
+            logging.debug("Not caching diff controlnet {}: {}".format(control_net_name, e))
+            return (comfy.controlnet.load_controlnet(controlnet_path, model),)
+        controlnet = CONTROLNET_CACHE.get(key)
+        if controlnet is None:
+            controlnet = comfy.controlnet.load_controlnet(controlnet_path, model)
+            CONTROLNET_CACHE.put(key, controlnet, key[1])
+        return (controlnet.copy(),)
 
 
 class ControlNetApply:
@@ -877,6 +959,7 @@ class UNETLoader:
 
         unet_path = folder_paths.get_full_path_or_raise("diffusion_models", unet_name)
         model = comfy.sd.load_diffusion_model(unet_path, model_options=model_options)
+        model_cache.tag_source(model.model, (model_cache.file_fingerprint(unet_path), weight_dtype))
         return (model,)
 
 class CLIPLoader:
@@ -902,6 +985,7 @@ class CLIPLoader:
 
         clip_path = folder_paths.get_full_path_or_raise("clip", clip_name)
         clip = comfy.sd.load_clip(ckpt_paths=[clip_path], embedding_directory=folder_paths.get_folder_paths("embeddings"), clip_type=clip_type)
+        model_cache.tag_source(clip.cond_stage_model, (model_cache.file_fingerprint(clip_path), type))
         return (clip,)
 
 class DualCLIPLoader:
@@ -927,6 +1011,7 @@ class DualCLIPLoader:
             clip_type = comfy.sd.CLIPType.FLUX
 
         clip = comfy.sd.load_clip(ckpt_paths=[clip_path1, clip_path2], embedding_directory=folder_paths.get_folder_paths("embeddings"), clip_type=clip_type)
+        model_cache.tag_source(clip.cond_stage_model, (model_cache.file_fingerprint(clip_path1), model_cache.file_fingerprint(clip_path2), type))
         return (clip,)
 
 class CLIPVisionLoader:
@@ -1250,6 +1335,63 @@ class LatentFlip:
 
         return (s,)
 
+def latent_feather_mask(height, width, feather, top=True, bottom=True, left=True, right=True, dtype=torch.float32, device=None):
+    """
+    Returns the [height, width] feather mask of LatentComposite: the selected edges ramp linearly over
+    feather latent pixels, row t from the edge is scaled by (t + 1) / feather, and ramps of crossing
+    edges multiply.
+    """
+    def ramp(size, start, end):
+        factors = torch.ones(size, dtype=torch.float64)
+        steps = torch.arange(min(feather, size), dtype=torch.float64)
+        #the old loop multiplied the float32 mask by each factor as a float32 scalar, round them the same way
+        edge = ((1.0 / feather) * (steps + 1)).to(torch.float32).to(torch.float64)
+        if start:
+            factors[:len(steps)] *= edge
+        if end:
+            factors[size - len(steps):] *= edge.flip(0)
+        return factors.to(torch.float32)
+
+    rows = ramp(height, top, bottom)
+    cols = ramp(width, left, right)
+    return (rows[:, None] * cols[None, :]).to(dtype=dtype, device=device)
+
+
+def composite_latents(destination, sources):
+    """
+    Pastes several latents into a single copy of destination.
+
+    sources is an iterable of (samples, x, y, feather) with samples a LATENT dict or a tensor and x, y
+    and feather in pixels like the inputs of LatentComposite. Sources are pasted in order, each one
+    blended in place into the output with its feather mask, only the destination is copied once.
+    Sources are cropped to the destination.
+
+    Returns:
+        dict: a copy of destination with the composited samples.
+    """
+    samples_out = destination.copy()
+    s = destination["samples"].clone()
+    for samples_from, x, y, feather in sources:
+        if isinstance(samples_from, dict):
+            samples_from = samples_from["samples"]
+        x = x // 8
+        y = y // 8
+        feather = feather // 8
+        samples_from = samples_from[:, :, :s.shape[2] - y, :s.shape[3] - x].to(device=s.device)
+        region = s[:, :, y:y + samples_from.shape[2], x:x + samples_from.shape[3]]
+        if feather == 0:
+            region.copy_(samples_from)
+            continue
+
+        mask = latent_feather_mask(samples_from.shape[2], samples_from.shape[3], feather,
+                                   top=y != 0, bottom=y + samples_from.shape[2] < s.shape[2],
+                                   left=x != 0, right=x + samples_from.shape[3] < s.shape[3],
+                                   dtype=torch.float32, device=s.device)
+        region.mul_(1.0 - mask).add_(samples_from * mask)
+    samples_out["samples"] = s
+    return samples_out
+
+
 class LatentComposite:
     @classmethod
     def INPUT_TYPES(s):
@@ -1265,32 +1407,7 @@ class LatentComposite:
     CATEGORY = "latent"
 
     def composite(self, samples_to, samples_from, x, y, composite_method="normal", feather=0):
-        x =  x // 8
-        y = y // 8
-        feather = feather // 8
-        samples_out = samples_to.copy()
-        s = samples_to["samples"].clone()
-        samples_to = samples_to["samples"]
-        samples_from = samples_from["samples"]
-        if feather == 0:
-            s[:,:,y:y+samples_from.shape[2],x:x+samples_from.shape[3]] = samples_from[:,:,:samples_to.shape[2] - y, :samples_to.shape[3] - x]
-        else:
-            samples_from = samples_from[:,:,:samples_to.shape[2] - y, :samples_to.shape[3] - x]
-            mask = torch.ones_like(samples_from)
-            for t in range(feather):
-                if y != 0:
-                    mask[:,:,t:1+t,:] *= ((1.0/feather) * (t + 1))
-
-                if y + samples_from.shape[2] < samples_to.shape[2]:
-                    mask[:,:,mask.shape[2] -1 -t: mask.shape[2]-t,:] *= ((1.0/feather) * (t + 1))
-                if x != 0:
-                    mask[:,:,:,t:1+t] *= ((1.0/feather) * (t + 1))
-                if x + samples_from.shape[3] < samples_to.shape[3]:
-                    mask[:,:,:,mask.shape[3]- 1 - t: mask.shape[3]- t] *= ((1.0/feather) * (t + 1))
-            rev_mask = torch.ones_like(mask) - mask
-            s[:,:,y:y+samples_from.shape[2],x:x+samples_from.shape[3]] = samples_from[:,:,:samples_to.shape[2] - y, :samples_to.shape[3] - x] * mask + s[:,:,y:y+samples_from.shape[2],x:x+samples_from.shape[3]] * rev_mask
-        samples_out["samples"] = s
-        return (samples_out,)
+        return (composite_latents(samples_to, [(samples_from, x, y, feather)]),)
 
 class LatentBlend:
     @classmethod
@@ -1383,6 +1500,10 @@ class SetLatentNoiseMask:
         return (s,)
 
 def common_ksampler(model, seed, steps, cfg, sampler_name, scheduler, positive, negative, latent, denoise=1.0, disable_noise=False, start_step=None, last_step=None, force_full_denoise=False):
+    key_parts = ("common_ksampler", model, seed, steps, cfg, sampler_name, scheduler, positive, negative, latent, denoise, disable_noise, start_step, last_step, force_full_denoise)
+    return sample_cache.cached_sample(key_parts, latent, lambda: _common_ksampler(model, seed, steps, cfg, sampler_name, scheduler, positive, negative, latent, denoise=denoise, disable_noise=disable_noise, start_step=start_step, last_step=last_step, force_full_denoise=force_full_denoise))
+
+def _common_ksampler(model, seed, steps, cfg, sampler_name, scheduler, positive, negative, latent, denoise=1.0, disable_noise=False, start_step=None, last_step=None, force_full_denoise=False):
     latent_image = latent["samples"]
     latent_image = comfy.sample.fix_empty_latent_channels(model, latent_image)
 
@@ -1481,6 +1602,13 @@ class SaveImage:
                 "images": ("IMAGE", {"tooltip": "The images to save."}),
                 "filename_prefix": ("STRING", {"default": "ComfyUI", "tooltip": "The prefix for the file to save. This may include formatting information such as %date:yyyy-MM-dd% or %Empty Latent Image.width% to include values from nodes."})
             },
+            "optional": {
+                "format": (image_writer.FORMATS, {"default": "png", "tooltip": "png and webp_lossless keep every pixel, jpeg and webp are a lot smaller and faster to write."}),
+                "quality": ("INT", {"default": 90, "min": 1, "max": 100, "tooltip": "Quality of jpeg and webp, compression effort of webp_lossless."}),
+                "png_compress_level": ("INT", {"default": 4, "min": 0, "max": 9, "tooltip": "zlib level of png, lower is faster and larger."}),
+                "png_strategy": (list(image_writer.PNG_STRATEGIES), {"default": "default", "tooltip": "zlib strategy of png, rle is much faster than default at a similar size for photos."}),
+                "webp_method": ("INT", {"default": 4, "min": 0, "max": 6, "tooltip": "webp encoder effort, 0 is fastest and 6 is smallest."}),
+            },
             "hidden": {
                 "prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"
             },
@@ -1494,25 +1622,28 @@ class SaveImage:
     CATEGORY = "image"
     DESCRIPTION = "Saves the input images to your ComfyUI output directory."
 
-    def save_images(self, images, filename_prefix="ComfyUI", prompt=None, extra_pnginfo=None):
+    def save_images(self, images, filename_prefix="ComfyUI", prompt=None, extra_pnginfo=None, format="png", quality=90, png_compress_level=None, png_strategy="default", webp_method=4):
         filename_prefix += self.prefix_append
         full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
-        results = list()
-        for (batch_number, image) in enumerate(images):
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            metadata = None
-            if not args.disable_metadata:
-                metadata = PngInfo()
-                if prompt is not None:
-                    metadata.add_text("prompt", json.dumps(prompt))
-                if extra_pnginfo is not None:
-                    for x in extra_pnginfo:
-                        metadata.add_text(x, json.dumps(extra_pnginfo[x]))
+        if png_compress_level is None:
+            png_compress_level = self.compress_level
+        extension, save_kwargs = image_writer.encoder_options(format, quality, png_compress_level, png_strategy, webp_method)
+        if not args.disable_metadata:
+            save_kwargs.update(image_writer.image_metadata(format, prompt, extra_pnginfo))
 
+        results = list()
+        writer = image_writer.get_writer() if image_writer.ASYNC_SAVE else None
+        for (batch_number, i) in enumerate(image_writer.quantize_images(images)):
             filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
-            file = f"{filename_with_batch_num}_{counter:05}_.png"
-            img.save(os.path.join(full_output_folder, file), pnginfo=metadata, compress_level=self.compress_level)
+            file = f"{filename_with_batch_num}_{counter:05}_.{extension}"
+            if writer is None:
+                image_writer.save_array(i, os.path.join(full_output_folder, file), **save_kwargs)
+            else:
+                #files still queued aren't on disk yet so get_save_image_path can't skip their counters
+                while writer.is_pending(os.path.join(full_output_folder, file)) or os.path.exists(os.path.join(full_output_folder, file)):
+                    counter += 1
+                    file = f"{filename_with_batch_num}_{counter:05}_.{extension}"
+                writer.submit(i, os.path.join(full_output_folder, file), **save_kwargs)
             results.append({
                 "filename": file,
                 "subfolder": subfolder,
@@ -1536,6 +1667,64 @@ class PreviewImage(SaveImage):
                 "hidden": {"prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"},
                 }
 
+def decode_frames(img, frame_stride=1, frame_limit=0, uint8=False, target_size=None):
+    """
+    Decodes the frames of an opened image into one [N, H, W, 3] image and one [N, H, W] mask batch.
+
+    The frames are counted first and written into preallocated outputs one at a time, so peak memory
+    is the output plus a single frame. Every frame_stride-th frame is decoded, at most frame_limit
+    frames when it is above 0. Frames of another size than the first one are skipped. MPO files
+    only contribute their first frame. Images are float32 in [0, 1] or uint8 with uint8. The mask
+    buffer is allocated when the first frame with alpha is decoded, frames without alpha get an
+    empty mask. When no frame has alpha the mask is a single 64x64 zero mask per frame.
+
+    target_size is a (width, height) hint of the size the consumer scales the image to. JPEGs are then
+    decoded at the smallest DCT scale (1/2, 1/4 or 1/8) that still covers it, EXIF rotation included.
+    """
+    if target_size is not None and img.format == 'JPEG':
+        target_width, target_height = max(1, target_size[0]), max(1, target_size[1])
+        #draft works on the stored pixels, exif_transpose rotates them afterwards
+        if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            target_width, target_height = target_height, target_width
+        img.draft(None, (target_width, target_height))
+
+    n_frames = 1 if img.format == 'MPO' else getattr(img, "n_frames", 1)
+    indices = range(0, n_frames, max(1, frame_stride))
+    if frame_limit > 0:
+        indices = indices[:frame_limit]
+
+    images = None
+    masks = None
+    count = 0
+    for index in indices:
+        img.seek(index)
+        i = node_helpers.pillow(ImageOps.exif_transpose, img)
+
+        if i.mode == 'I':
+            i = i.point(lambda i: i * (1 / 255))
+        image = i.convert("RGB")
+
+        if images is None:
+            w, h = image.size
+            images = torch.empty((len(indices), h, w, 3), dtype=torch.uint8 if uint8 else torch.float32)
+
+        if image.size[0] != w or image.size[1] != h:
+            continue
+
+        images[count].copy_(torch.from_numpy(np.array(image)))
+        if not uint8:
+            images[count].div_(255.0)
+        if 'A' in i.getbands():
+            if masks is None:
+                masks = torch.zeros((len(indices), h, w), dtype=torch.float32)
+            masks[count].copy_(torch.from_numpy(np.array(i.getchannel('A')))).div_(255.0).neg_().add_(1.)
+        count += 1
+
+    if masks is None:
+        masks = torch.zeros((count, 64, 64), dtype=torch.float32)
+    return images[:count], masks[:count]
+
+
 class LoadImage:
     @classmethod
     def INPUT_TYPES(s):
@@ -1543,63 +1732,44 @@ class LoadImage:
         files = [f for f in os.listdir(input_dir) if os.path.isfile(os.path.join(input_dir, f))]
         return {"required":
                     {"image": (sorted(files), {"image_upload": True})},
+                "optional":
+                    {"frame_stride": ("INT", {"default": 1, "min": 1, "max": 1000, "tooltip": "Only load every n-th frame of animated images."}),
+                     "frame_limit": ("INT", {"default": 0, "min": 0, "max": 100000, "tooltip": "Load at most this many frames, 0 loads all of them."}),
+                     "target_width": ("INT", {"default": 0, "min": 0, "max": MAX_RESOLUTION, "tooltip": "Width the image is scaled to afterwards, large JPEGs are then decoded at a reduced resolution that still covers it. 0 decodes the full resolution."}),
+                     "target_height": ("INT", {"default": 0, "min": 0, "max": MAX_RESOLUTION, "tooltip": "Height the image is scaled to afterwards, see target_width."})},
                 }
 
     CATEGORY = "image"
 
     RETURN_TYPES = ("IMAGE", "MASK")
     FUNCTION = "load_image"
-    def load_image(self, image):
+    def load_image(self, image, frame_stride=1, frame_limit=0, target_width=0, target_height=0):
         image_path = folder_paths.get_annotated_filepath(image)
-        
-        img = node_helpers.pillow(Image.open, image_path)
-        
-        output_images = []
-        output_masks = []
-        w, h = None, None
-
-        excluded_formats = ['MPO']
-        
-        for i in ImageSequence.Iterator(img):
-            i = node_helpers.pillow(ImageOps.exif_transpose, i)
-
-            if i.mode == 'I':
-                i = i.point(lambda i: i * (1 / 255))
-            image = i.convert("RGB")
-
-            if len(output_images) == 0:
-                w = image.size[0]
-                h = image.size[1]
-            
-            if image.size[0] != w or image.size[1] != h:
-                continue
-            
-            image = np.array(image).astype(np.float32) / 255.0
-            image = torch.from_numpy(image)[None,]
-            if 'A' in i.getbands():
-                mask = np.array(i.getchannel('A')).astype(np.float32) / 255.0
-                mask = 1. - torch.from_numpy(mask)
-            else:
-                mask = torch.zeros((64,64), dtype=torch.float32, device="cpu")
-            output_images.append(image)
-            output_masks.append(mask.unsqueeze(0))
-
-        if len(output_images) > 1 and img.format not in excluded_formats:
-            output_image = torch.cat(output_images, dim=0)
-            output_mask = torch.cat(output_masks, dim=0)
+        target_size = (target_width, target_height) if target_width > 0 or target_height > 0 else None
+        key = (model_cache.file_fingerprint(image_path), uint8_image.UINT8_IMAGES, frame_stride, frame_limit, target_size)
+        out = IMAGE_CACHE.get(key)
+        if out is None:
+            img = node_helpers.pillow(Image.open, image_path)
+            output_image, output_mask = decode_frames(img, frame_stride, frame_limit, uint8=uint8_image.UINT8_IMAGES, target_size=target_size)
+
+            if uint8_image.UINT8_IMAGES:
+                output_image = uint8_image.UInt8Image(output_image)
+            out = (output_image, output_mask)
+            IMAGE_CACHE.put(key, out, output_image.nbytes + output_mask.nbytes)
+
+        #nodes may write into their inputs (UInt8Image.__setitem__, in place tensor ops), so every call gets
+        #its own copy and the cached entry is never handed out, copying is still far cheaper than decoding
+        output_image, output_mask = out
+        if isinstance(output_image, uint8_image.UInt8Image):
+            output_image = uint8_image.UInt8Image(output_image.data.clone())
         else:
-            output_image = output_images[0]
-            output_mask = output_masks[0]
-
-        return (output_image, output_mask)
+            output_image = output_image.clone()
+        return (output_image, output_mask.clone())
 
     @classmethod
-    def IS_CHANGED(s, image):
+    def IS_CHANGED(s, image, frame_stride=1, frame_limit=0, target_width=0, target_height=0):
         image_path = folder_paths.get_annotated_filepath(image)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return FILE_DIGESTS.digest(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, image):
@@ -1645,10 +1815,7 @@ class LoadImageMask:
     @classmethod
     def IS_CHANGED(s, image, channel):
         image_path = folder_paths.get_annotated_filepath(image)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return FILE_DIGESTS.digest(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, image):
@@ -1673,6 +1840,10 @@ class ImageScale:
     CATEGORY = "image/upscaling"
 
     def upscale(self, image, upscale_method, width, height, crop):
+        data = uint8_image.uint8_data(image)
+        if data is not None and upscale_method == "nearest-exact":
+            #nearest neighbour scaling and cropping only pick pixels, the image can stay uint8
+            return (uint8_image.UInt8Image(self.upscale(data, upscale_method, width, height, crop)[0]),)
         if width == 0 and height == 0:
             s = image
         else:
@@ -1719,6 +1890,9 @@ class ImageInvert:
     CATEGORY = "image"
 
     def invert(self, image):
+        data = uint8_image.uint8_data(image)
+        if data is not None:
+            return (uint8_image.UInt8Image(255 - data),)
         s = 1.0 - image
         return (s,)
 
@@ -1734,6 +1908,9 @@ class ImageBatch:
     CATEGORY = "image"
 
     def batch(self, image1, image2):
+        data1, data2 = uint8_image.uint8_data(image1), uint8_image.uint8_data(image2)
+        if data1 is not None and data2 is not None and data1.shape[1:] == data2.shape[1:]:
+            return (uint8_image.UInt8Image(torch.cat((data1, data2), dim=0)),)
         if image1.shape[1:] != image2.shape[1:]:
             image2 = comfy.utils.common_upscale(image2.movedim(-1,1), image1.shape[2], image1.shape[1], "bilinear", "center").movedim(1,-1)
         s = torch.cat((image1, image2), dim=0)
@@ -1761,6 +1938,27 @@ class EmptyImage:
         b = torch.full([batch_size, height, width, 1], ((color) & 0xFF) / 0xFF)
         return (torch.cat((r, g, b), dim=-1), )
 
+def edge_feather_mask(height, width, feathering, top=True, bottom=True, left=True, right=True, dtype=torch.float32):
+    """
+    Returns a [height, width] feather mask that is 1 at the selected edges and falls off quadratically to 0 at feathering pixels from them.
+
+    The value at distance d from the nearest selected edge is ((feathering - d) / feathering) ** 2 for
+    d < feathering and 0 beyond, where d counts from 0 on the top and left edge and from 1 on the bottom
+    and right edge. It is computed in float64 and then cast, so it matches evaluating the formula per
+    pixel in python. Edges that aren't selected don't limit the distance.
+    """
+    rows = torch.arange(height, dtype=torch.int64)
+    cols = torch.arange(width, dtype=torch.int64)
+    dt = rows if top else torch.full_like(rows, height)
+    db = height - rows if bottom else torch.full_like(rows, height)
+    dl = cols if left else torch.full_like(cols, width)
+    dr = width - cols if right else torch.full_like(cols, width)
+
+    d = torch.minimum(torch.minimum(dt, db)[:, None], torch.minimum(dl, dr)[None, :])
+    v = (feathering - d).to(torch.float64) / feathering
+    return torch.where(d < feathering, v * v, 0.0).to(dtype)
+
+
 class ImagePadForOutpaint:
 
     @classmethod
@@ -1784,48 +1982,38 @@ class ImagePadForOutpaint:
     def expand_image(self, image, left, top, right, bottom, feathering):
         d1, d2, d3, d4 = image.size()
 
-        new_image = torch.ones(
+        new_image = torch.full(
             (d1, d2 + top + bottom, d3 + left + right, d4),
+            0.5,
             dtype=torch.float32,
-        ) * 0.5
+        )
 
-        new_image[:, top:top + d2, left:left + d3, :] = image
+        data = uint8_image.uint8_data(image)
+        if data is not None:
+            #converts in place instead of allocating the float image first
+            new_image[:, top:top + d2, left:left + d3, :].copy_(data).div_(255.0)
+        else:
+            new_image[:, top:top + d2, left:left + d3, :] = image
 
         mask = torch.ones(
             (d2 + top + bottom, d3 + left + right),
             dtype=torch.float32,
         )
 
-        t = torch.zeros(
-            (d2, d3),
-            dtype=torch.float32
-        )
-
         if feathering > 0 and feathering * 2 < d2 and feathering * 2 < d3:
-
-            for i in range(d2):
-                for j in range(d3):
-                    dt = i if top != 0 else d2
-                    db = d2 - i if bottom != 0 else d2
-
-                    dl = j if left != 0 else d3
-                    dr = d3 - j if right != 0 else d3
-
-                    d = min(dt, db, dl, dr)
-
-                    if d >= feathering:
-                        continue
-
-                    v = (feathering - d) / feathering
-
-                    t[i, j] = v * v
+            t = edge_feather_mask(d2, d3, feathering, top=top != 0, bottom=bottom != 0, left=left != 0, right=right != 0)
+        else:
+            t = torch.zeros(
+                (d2, d3),
+                dtype=torch.float32
+            )
 
         mask[top:top + d2, left:left + d3] = t
 
         return (new_image, mask)
 
 
-NODE_CLASS_MAPPINGS = {
+NODE_CLASS_MAPPINGS = node_manifest.LazyNodeClassMappings({
     "KSampler": KSampler,
     "CheckpointLoaderSimple": CheckpointLoaderSimple,
     "CLIPTextEncode": CLIPTextEncode,
@@ -1892,7 +2080,7 @@ NODE_CLASS_MAPPINGS = {
     "ConditioningZeroOut": ConditioningZeroOut,
     "ConditioningSetTimestepRange": ConditioningSetTimestepRange,
     "LoraLoaderModelOnly": LoraLoaderModelOnly,
-}
+})
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     # Sampling
@@ -1979,24 +2167,49 @@ def get_module_name(module_path: str) -> str:
     return base_path
 
 
-def load_custom_node(module_path: str, ignore=set(), module_parent="custom_nodes") -> bool:
+CUSTOM_NODE_IMPORT_ERRORS = {}
+
+
+def import_custom_node_module(module_path: str):
+    """
+    Executes a custom node module without registering its nodes.
+
+    Returns:
+        tuple: (module_name, module_dir, module)
+    """
     module_name = os.path.basename(module_path)
     if os.path.isfile(module_path):
         sp = os.path.splitext(module_path)
         module_name = sp[0]
-    try:
-        logging.debug("Trying to load custom node {}".format(module_path))
-        if os.path.isfile(module_path):
-            module_spec = importlib.util.spec_from_file_location(module_name, module_path)
-            module_dir = os.path.split(module_path)[0]
-        else:
-            module_spec = importlib.util.spec_from_file_location(module_name, os.path.join(module_path, "__init__.py"))
-            module_dir = module_path
+    logging.debug("Trying to load custom node {}".format(module_path))
+    if os.path.isfile(module_path):
+        module_spec = importlib.util.spec_from_file_location(module_name, module_path)
+        module_dir = os.path.split(module_path)[0]
+    else:
+        module_spec = importlib.util.spec_from_file_location(module_name, os.path.join(module_path, "__init__.py"))
+        module_dir = module_path
 
-        module = importlib.util.module_from_spec(module_spec)
-        sys.modules[module_name] = module
-        module_spec.loader.exec_module(module)
+    module = importlib.util.module_from_spec(module_spec)
+    sys.modules[module_name] = module
+    module_spec.loader.exec_module(module)
+    return (module_name, module_dir, module)
 
+
+def load_custom_node(module_path: str, ignore=set(), module_parent="custom_nodes", manifest=None, names=None, imported=None) -> bool:
+    """
+    Imports a custom node module and registers its nodes.
+
+    imported is the result of import_custom_node_module (or the exception it raised) if the module was
+    already executed, for example on a worker thread.
+    """
+    try:
+        if imported is None:
+            imported = import_custom_node_module(module_path)
+        elif isinstance(imported, Exception):
+            raise imported
+        module_name, module_dir, module = imported
+
+        web_dir = None
         if hasattr(module, "WEB_DIRECTORY") and getattr(module, "WEB_DIRECTORY") is not None:
             web_dir = os.path.abspath(os.path.join(module_dir, getattr(module, "WEB_DIRECTORY")))
             if os.path.isdir(web_dir):
@@ -2004,33 +2217,89 @@ def load_custom_node(module_path: str, ignore=set(), module_parent="custom_nodes
 
         if hasattr(module, "NODE_CLASS_MAPPINGS") and getattr(module, "NODE_CLASS_MAPPINGS") is not None:
             for name, node_cls in module.NODE_CLASS_MAPPINGS.items():
-                if name not in ignore:
+                if name not in ignore and (names is None or name in names):
                     NODE_CLASS_MAPPINGS[name] = node_cls
                     node_cls.RELATIVE_PYTHON_MODULE = "{}.{}".format(module_parent, get_module_name(module_path))
+            display_names = {}
             if hasattr(module, "NODE_DISPLAY_NAME_MAPPINGS") and getattr(module, "NODE_DISPLAY_NAME_MAPPINGS") is not None:
-                NODE_DISPLAY_NAME_MAPPINGS.update(module.NODE_DISPLAY_NAME_MAPPINGS)
+                display_names = module.NODE_DISPLAY_NAME_MAPPINGS
+                NODE_DISPLAY_NAME_MAPPINGS.update(display_names)
+            if manifest is not None:
+                manifest.record(module_path, module_name, module.NODE_CLASS_MAPPINGS.keys(), display_names, web_dir)
             return True
         else:
             logging.warning(f"Skip {module_path} module for custom nodes due to the lack of NODE_CLASS_MAPPINGS.")
             return False
     except Exception as e:
-        logging.warning(traceback.format_exc())
+        logging.warning("".join(traceback.format_exception(type(e), e, e.__traceback__)))
         logging.warning(f"Cannot import {module_path} module for custom nodes: {e}")
+        CUSTOM_NODE_IMPORT_ERRORS[module_path] = "{}: {}".format(type(e).__name__, e)
+        return False
+
+def defer_custom_node(module_path: str, manifest, ignore=set(), module_parent="custom_nodes") -> bool:
+    """
+    Registers the nodes of a module from its manifest entry so the module is only imported once one of them is looked up.
+
+    Returns False without registering anything if the module has to be imported now: it isn't in the
+    manifest yet, it changed since it was recorded or it replaces nodes which are already registered
+    (importing it keeps the same precedence as importing everything in order).
+    """
+    entry = manifest.lookup(module_path)
+    if entry is None:
+        return False
+    names = [name for name in entry["nodes"] if name not in ignore]
+    if any(dict.__contains__(NODE_CLASS_MAPPINGS, name) for name in names):
         return False
 
-def init_external_custom_nodes():
+    logging.debug("Deferring import of custom node {}".format(module_path))
+    NODE_CLASS_MAPPINGS.add_provider(names, functools.partial(load_custom_node, module_path, ignore, module_parent, manifest))
+    NODE_DISPLAY_NAME_MAPPINGS.update(entry["display_names"])
+    if entry["web_directory"] is not None and os.path.isdir(entry["web_directory"]):
+        EXTENSION_WEB_DIRS[entry["extension"]] = entry["web_directory"]
+    return True
+
+def load_custom_node_lazy(module_path: str, manifest, ignore=set(), module_parent="custom_nodes") -> bool:
+    """Defers the import of a module with defer_custom_node or imports it now and records it in the manifest."""
+    if defer_custom_node(module_path, manifest, ignore, module_parent):
+        return True
+    return load_custom_node(module_path, ignore, module_parent, manifest=manifest)
+
+def _import_custom_node_timed(module_path: str):
+    rss_before = psutil.Process().memory_info().rss
+    time_before = time.perf_counter()
+    try:
+        imported = import_custom_node_module(module_path)
+    except Exception as e:
+        imported = e
+    return (imported, time.perf_counter() - time_before, psutil.Process().memory_info().rss - rss_before)
+
+
+def init_external_custom_nodes(workers=1, profile_path=None, lazy=False):
     """
     Initializes the external custom nodes.
 
     This function loads custom nodes from the specified folder paths and imports them into the application.
     It measures the import times for each custom node and logs the results.
 
+    With workers > 1 the node packs are executed on a thread pool, their nodes are still registered
+    in directory order so the same pack wins when two provide a node of the same name. Packs that fail
+    on a worker (for example with an ImportError or an import deadlock because they import another
+    pack) are imported again on the calling thread after all others finished, only that failure is
+    reported.
+
+    With lazy=True packs that are unchanged since they were recorded in the node manifest aren't
+    imported, their nodes are registered from the manifest and the pack is imported when one of them
+    is first looked up. Anything else a pack does on import (server routes, patches) is deferred too.
+
+    If profile_path is given the import time, failure and resident memory change of every pack is
+    written there as json. Memory deltas of packs imported in parallel overlap and are approximate.
+
     Returns:
         None
     """
-    base_node_names = set(NODE_CLASS_MAPPINGS.keys())
+    base_node_names = set(NODE_CLASS_MAPPINGS.keys()) | NODE_CLASS_MAPPINGS.lazy_names()
     node_paths = folder_paths.get_folder_paths("custom_nodes")
-    node_import_times = []
+    module_paths = []
     for custom_node_path in node_paths:
         possible_modules = os.listdir(os.path.realpath(custom_node_path))
         if "__pycache__" in possible_modules:
@@ -2040,9 +2309,45 @@ def init_external_custom_nodes():
             module_path = os.path.join(custom_node_path, possible_module)
             if os.path.isfile(module_path) and os.path.splitext(module_path)[1] != ".py": continue
             if module_path.endswith(".disabled"): continue
-            time_before = time.perf_counter()
-            success = load_custom_node(module_path, base_node_names, module_parent="custom_nodes")
-            node_import_times.append((time.perf_counter() - time_before, module_path, success))
+            module_paths.append(module_path)
+
+    rss_start = psutil.Process().memory_info().rss
+    time_start = time.perf_counter()
+    manifest = node_manifest.NodeManifest() if lazy else None
+    to_import = [module_path for module_path in module_paths if manifest is None or manifest.lookup(module_path) is None]
+    imported = {}
+    if workers > 1 and len(to_import) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="custom-nodes") as executor:
+            imported = dict(zip(to_import, executor.map(_import_custom_node_timed, to_import)))
+
+    node_import_times = []
+    deferred = []
+    for module_path in module_paths:
+        if manifest is not None and defer_custom_node(module_path, manifest, base_node_names, module_parent="custom_nodes"):
+            deferred.append(module_path)
+            continue
+        rss_before = psutil.Process().memory_info().rss
+        time_before = time.perf_counter()
+        result = imported.get(module_path, None)
+        #import deadlocks between packs surface as RuntimeError, any failure on a worker gets a sequential retry
+        if result is not None and isinstance(result[0], Exception):
+            logging.debug("Retrying import of {} after the other custom nodes: {}".format(module_path, result[0]))
+            success = load_custom_node(module_path, base_node_names, module_parent="custom_nodes", manifest=manifest)
+        elif result is not None:
+            success = load_custom_node(module_path, base_node_names, module_parent="custom_nodes", manifest=manifest, imported=result[0])
+        else:
+            success = load_custom_node(module_path, base_node_names, module_parent="custom_nodes", manifest=manifest)
+        seconds = time.perf_counter() - time_before
+        rss_delta = psutil.Process().memory_info().rss - rss_before
+        if result is not None:
+            seconds += result[1]
+            rss_delta += result[2]
+        node_import_times.append((seconds, module_path, success, rss_delta))
+
+    if manifest is not None:
+        manifest.save()
+    if len(deferred) > 0:
+        logging.info("Deferred the import of {} unchanged custom node packs until their nodes are used".format(len(deferred)))
 
     if len(node_import_times) > 0:
         logging.info("\nImport times for custom nodes:")
@@ -2054,15 +2359,37 @@ def init_external_custom_nodes():
             logging.info("{:6.1f} seconds{}: {}".format(n[0], import_message, n[1]))
         logging.info("")
 
-def init_builtin_extra_nodes():
+    if profile_path is not None:
+        profile = {
+            "workers": workers,
+            "seconds": time.perf_counter() - time_start,
+            "rss_delta_bytes": psutil.Process().memory_info().rss - rss_start,
+            "packs": [{
+                "path": module_path,
+                "seconds": seconds,
+                "success": success,
+                "error": None if success else CUSTOM_NODE_IMPORT_ERRORS.get(module_path, "no NODE_CLASS_MAPPINGS"),
+                "rss_delta_bytes": rss_delta,
+            } for seconds, module_path, success, rss_delta in sorted(node_import_times, reverse=True)],
+            "deferred": deferred,
+        }
+        with open(profile_path, "w", encoding="utf-8") as f:
+            json.dump(profile, f, indent=2)
+        logging.info("Wrote custom node import profile to {}".format(profile_path))
+
+def init_builtin_extra_nodes(lazy=False):
     """
     Initializes the built-in extra nodes in ComfyUI.
 
     This function loads the extra node files located in the "comfy_extras" directory and imports them into ComfyUI.
     If any of the extra node files fail to import, a warning message is logged.
 
+    With lazy=True the node names of every file are taken from the node manifest and a file is only
+    imported the first time one of its nodes is looked up in NODE_CLASS_MAPPINGS. Files that aren't
+    in the manifest yet are imported right away and recorded.
+
     Returns:
-        None
+        list: The extra node files that failed to import.
     """
     extras_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "comfy_extras")
     extras_files = [
@@ -2110,19 +2437,26 @@ def init_builtin_extra_nodes():
         "nodes_torch_compile.py",
     ]
 
+    manifest = node_manifest.NodeManifest() if lazy else None
     import_failed = []
     for node_file in extras_files:
-        if not load_custom_node(os.path.join(extras_dir, node_file), module_parent="comfy_extras"):
+        if lazy:
+            success = load_custom_node_lazy(os.path.join(extras_dir, node_file), manifest, module_parent="comfy_extras")
+        else:
+            success = load_custom_node(os.path.join(extras_dir, node_file), module_parent="comfy_extras")
+        if not success:
             import_failed.append(node_file)
 
+    if manifest is not None:
+        manifest.save()
     return import_failed
 
 
-def init_extra_nodes(init_custom_nodes=True):
-    import_failed = init_builtin_extra_nodes()
+def init_extra_nodes(init_custom_nodes=True, lazy=False, custom_node_workers=1, import_profile=None):
+    import_failed = init_builtin_extra_nodes(lazy=lazy)
 
     if init_custom_nodes:
-        init_external_custom_nodes()
+        init_external_custom_nodes(workers=custom_node_workers, profile_path=import_profile, lazy=lazy)
     else:
         logging.info("Skipping loading of custom nodes")
 
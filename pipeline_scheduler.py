@@ -0,0 +1,87 @@
+import logging
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class StagePipeline:
+    """
+    Runs a sequence of stages over a stream of items with every stage in its own worker thread.
+
+    Stages are connected by bounded queues so that while one item is in a later stage (sampling) the
+    next items already go through the earlier ones (image loading, background removal, edge detection)
+    without preprocessing running arbitrarily far ahead. Each stage is a callable taking the result of
+    the previous stage (the item itself for the first stage). An exception fails only that item, its
+    remaining stages are skipped.
+
+    context is an optional factory for a context manager entered by every worker thread, for example
+    torch.inference_mode which is thread local.
+    """
+    def __init__(self, stages, queue_size=1, context=None):
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.context = context
+
+    def run(self, items, on_result=None):
+        """
+        Pushes items through the stages and returns a list of (item, result, error, seconds) in completion order,
+        seconds counts from the moment the first stage picked the item up. on_result is called with the same
+        tuple as soon as an item leaves the last stage.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = []
+        for index, (name, fn) in enumerate(self.stages):
+            t = threading.Thread(target=self._worker, args=(name, fn, queues[index], queues[index + 1]), name="pipeline-{}".format(name), daemon=True)
+            t.start()
+            threads.append(t)
+
+        feeder = threading.Thread(target=self._feed, args=(items, queues[0]), name="pipeline-feed", daemon=True)
+        feeder.start()
+
+        results = []
+        while True:
+            entry = queues[-1].get()
+            if entry is _DONE:
+                break
+            item, value, error, start = entry
+            result = (item, value, error, time.perf_counter() - start)
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+
+        feeder.join()
+        for t in threads:
+            t.join()
+        return results
+
+    def _feed(self, items, out_queue):
+        for item in items:
+            #the timer starts when the first stage picks the item up, not while it waits in the queue
+            out_queue.put((item, item, None, None))
+        out_queue.put(_DONE)
+
+    def _worker(self, name, fn, in_queue, out_queue):
+        if self.context is not None:
+            with self.context():
+                self._work(name, fn, in_queue, out_queue)
+        else:
+            self._work(name, fn, in_queue, out_queue)
+
+    def _work(self, name, fn, in_queue, out_queue):
+        while True:
+            entry = in_queue.get()
+            if entry is _DONE:
+                out_queue.put(_DONE)
+                return
+            item, value, error, start = entry
+            if start is None:
+                start = time.perf_counter()
+            if error is None:
+                try:
+                    value = fn(value)
+                except Exception as e:
+                    logging.debug("Pipeline stage {} failed".format(name), exc_info=True)
+                    value, error = None, e
+            out_queue.put((item, value, error, start))
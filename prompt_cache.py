@@ -0,0 +1,97 @@
+import hashlib
+import logging
+import os
+
+import torch
+import safetensors.torch
+
+import model_cache
+
+#bump when the stored layout changes so old entries are ignored
+CACHE_VERSION = 1
+
+MEMORY_CACHE = model_cache.LRUCache("Prompt", model_cache.budget_from_env("PROMOGENIE_PROMPT_CACHE_MB", 512))
+#files in the prompts cache directory are only written when enabled, the batch runner turns it on
+DISK_CACHE_ENABLED = os.environ.get("PROMOGENIE_PROMPT_DISK_CACHE", "0") == "1"
+DISK_CACHE_MAX_BYTES = model_cache.budget_from_env("PROMOGENIE_PROMPT_DISK_CACHE_MB", 2048)
+
+
+def set_disk_cache(enabled):
+    global DISK_CACHE_ENABLED
+    DISK_CACHE_ENABLED = enabled
+
+
+def prompt_key(clip, text):
+    """
+    Returns the cache key for encoding text with clip or None if the encoding can't be cached.
+
+    The key covers the text, the files the text encoder was loaded from, the selected clip layer and
+    the state of the encoder's patcher (LoRAs, object patches, model options) through the ModelPatcher
+    digest, which refuses patchers with hooks or wrappers. Encoders that weren't created by one of the
+    built in loaders have no source fingerprint and are never cached, neither are encoders patched with
+    tensors of unknown origin (LoRAs of third party loaders) which would have to be hashed on every call.
+    """
+    source = model_cache.get_source(clip.cond_stage_model)
+    if source is None:
+        return None
+    if model_cache.has_untagged_tensors(clip.patcher.patches):
+        logging.debug("Not caching prompt encoding: the encoder is patched with tensors of unknown source")
+        return None
+
+    m = hashlib.blake2b(digest_size=20)
+    m.update("v{}\0{!r}\0{!r}\0".format(CACHE_VERSION, source, getattr(clip, "layer_idx", None)).encode())
+    try:
+        model_cache.structure_digest(clip.patcher, m)
+    except model_cache.Unhashable as e:
+        logging.debug("Not caching prompt encoding: {}".format(e))
+        return None
+    m.update(b"\0")
+    m.update(text.encode("utf-8"))
+    return m.hexdigest()
+
+
+def load(key):
+    """Returns a [cond, {"pooled_output": ...}] conditioning entry for key or None."""
+    entry = MEMORY_CACHE.get(key)
+    if entry is None and DISK_CACHE_ENABLED:
+        path = os.path.join(model_cache.get_cache_directory("prompts"), "{}.safetensors".format(key))
+        if os.path.isfile(path):
+            try:
+                tensors = safetensors.torch.load_file(path, device="cpu")
+            except Exception as e:
+                logging.warning("Ignoring unreadable prompt cache file {}: {}".format(path, e))
+                return None
+            model_cache.touch(path)
+            cond = tensors.pop("cond")
+            entry = (cond, tensors)
+            MEMORY_CACHE.put(key, entry, _entry_size(entry))
+
+    if entry is None:
+        return None
+    return [entry[0], dict(entry[1])]
+
+
+def store(key, cond, output):
+    entry = (cond, dict(output))
+    MEMORY_CACHE.put(key, entry, _entry_size(entry))
+    if not DISK_CACHE_ENABLED:
+        return
+    if not all(isinstance(v, torch.Tensor) for v in output.values()):
+        return
+
+    tensors = {k: v.detach().cpu().contiguous() for k, v in output.items()}
+    tensors["cond"] = cond.detach().cpu().contiguous()
+    path = os.path.join(model_cache.get_cache_directory("prompts"), "{}.safetensors".format(key))
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        safetensors.torch.save_file(tensors, temp_path)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logging.warning("Could not write prompt cache file {}: {}".format(path, e))
+        return
+    model_cache.prune_cache_directory(os.path.dirname(path), DISK_CACHE_MAX_BYTES)
+
+
+def _entry_size(entry):
+    cond, output = entry
+    return cond.nbytes + sum(v.nbytes for v in output.values() if isinstance(v, torch.Tensor))
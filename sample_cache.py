@@ -0,0 +1,112 @@
+import logging
+import os
+
+import torch
+import safetensors.torch
+
+import comfy.utils
+import model_cache
+
+#bump when the stored layout changes so old entries are ignored
+CACHE_VERSION = 2
+
+#off unless enabled, the batch runner turns it on, a ComfyUI server never reuses sampler results
+ENABLED = os.environ.get("PROMOGENIE_SAMPLE_CACHE", "0") == "1"
+MEMORY_CACHE = model_cache.LRUCache("Sampler", model_cache.budget_from_env("PROMOGENIE_SAMPLE_CACHE_MB", 1024))
+DISK_CACHE_ENABLED = os.environ.get("PROMOGENIE_SAMPLE_DISK_CACHE", "0") == "1"
+DISK_CACHE_MAX_BYTES = model_cache.budget_from_env("PROMOGENIE_SAMPLE_DISK_CACHE_MB", 4096)
+
+
+def set_enabled(enabled):
+    global ENABLED
+    ENABLED = enabled
+
+
+def set_disk_cache(enabled):
+    global DISK_CACHE_ENABLED
+    DISK_CACHE_ENABLED = enabled
+
+
+def sample_key(*key_parts):
+    """
+    Returns the cache key of a sampler call or None if one of its inputs can't be fingerprinted.
+
+    key_parts should contain everything the result depends on: the model (its source files and patches),
+    the conditioning, the input latent, the seed and the sampler settings.
+    """
+    try:
+        return model_cache.structure_digest(("v{}".format(CACHE_VERSION),) + key_parts)
+    except model_cache.Unhashable as e:
+        logging.debug("Not caching sampler result: {}".format(e))
+        return None
+
+
+def _cache_path(key):
+    return os.path.join(model_cache.get_cache_directory("samples"), "{}.latent".format(key))
+
+
+def load(key):
+    """Returns the list of sample tensors stored for key or None."""
+    samples = MEMORY_CACHE.get(key)
+    if samples is None and DISK_CACHE_ENABLED:
+        path = _cache_path(key)
+        if os.path.isfile(path):
+            try:
+                tensors = safetensors.torch.load_file(path, device="cpu")
+            except Exception as e:
+                logging.warning("Ignoring unreadable sampler cache file {}: {}".format(path, e))
+                return None
+            model_cache.touch(path)
+            samples = [tensors["latent_tensor"]]
+            while "latent_tensor_{}".format(len(samples)) in tensors:
+                samples.append(tensors["latent_tensor_{}".format(len(samples))])
+            MEMORY_CACHE.put(key, samples, sum(s.nbytes for s in samples))
+    return samples
+
+
+def store(key, samples):
+    samples = [s.detach().cpu() for s in samples]
+    MEMORY_CACHE.put(key, samples, sum(s.nbytes for s in samples))
+    if not DISK_CACHE_ENABLED:
+        return
+
+    #same layout as SaveLatent so the first result can be opened with the Load Latent node
+    output = {"latent_tensor": samples[0].contiguous(), "latent_format_version_0": torch.tensor([])}
+    for i, s in enumerate(samples[1:], start=1):
+        output["latent_tensor_{}".format(i)] = s.contiguous()
+    path = _cache_path(key)
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        comfy.utils.save_torch_file(output, temp_path)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logging.warning("Could not write sampler cache file {}: {}".format(path, e))
+        return
+    model_cache.prune_cache_directory(os.path.dirname(path), DISK_CACHE_MAX_BYTES)
+
+
+def cached_sample(key_parts, latent, sample_fn):
+    """
+    Returns the LATENT outputs of sample_fn(), reusing an earlier result with the same key_parts.
+
+    sample_fn returns a tuple of LATENT dicts that are copies of latent with new samples, like KSampler
+    and SamplerCustomAdvanced do. Cached results are rebuilt the same way.
+    """
+    if not ENABLED:
+        return sample_fn()
+    key = sample_key(*key_parts)
+    if key is not None:
+        samples = load(key)
+        if samples is not None:
+            logging.info("Reusing cached sampler result {}".format(key))
+            out = []
+            for s in samples:
+                o = latent.copy()
+                o["samples"] = s.to(latent["samples"].device)
+                out.append(o)
+            return tuple(out)
+
+    out = sample_fn()
+    if key is not None:
+        store(key, [o["samples"] for o in out])
+    return out
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+
+import torch
+import safetensors.torch
+
+import comfy.utils
+import folder_paths
+import model_cache
+
+#bump when the stages of the workflow change so old checkpoints are not resumed
+STAGE_VERSION = 2
+
+
+class StageStore:
+    """
+    Persists the outputs of completed workflow stages so an interrupted job resumes after its last completed stage.
+
+    Every stage is stored as one safetensors file in the SaveLatent layout: the stage latent is saved as
+    "latent_tensor" next to the "latent_format_version_0" marker, so the file can also be opened with
+    the Load Latent node, and the images and masks of the stage are saved under their own names.
+    """
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = model_cache.get_cache_directory("stages")
+        self.directory = directory
+
+    def job_key(self, job, input_files=()):
+        """Returns a key for the job that changes when any job field or input file changes."""
+        m = hashlib.blake2b(digest_size=16)
+        m.update("v{}\0".format(STAGE_VERSION).encode())
+        m.update(json.dumps(job, sort_keys=True, default=str).encode())
+        for name in input_files:
+            path = folder_paths.get_annotated_filepath(name)
+            if os.path.isfile(path):
+                m.update(repr(model_cache.file_fingerprint(path)).encode())
+        job_id = re.sub(r"[^A-Za-z0-9_.-]", "_", str(job.get("job_id", "job")))
+        return "{}_{}".format(job_id, m.hexdigest())
+
+    def _stage_path(self, job_key, stage):
+        return os.path.join(self.directory, job_key, "{}.safetensors".format(stage))
+
+    def load(self, job_key, stage):
+        """Returns (images, latent) of a completed stage or None."""
+        path = self._stage_path(job_key, stage)
+        if not os.path.isfile(path):
+            return None
+        try:
+            tensors = safetensors.torch.load_file(path, device="cpu")
+        except Exception as e:
+            logging.warning("Ignoring unreadable stage checkpoint {}: {}".format(path, e))
+            return None
+
+        latent = None
+        if "latent_tensor" in tensors:
+            latent = {"samples": tensors.pop("latent_tensor")}
+            tensors.pop("latent_format_version_0", None)
+        return (tensors, latent)
+
+    def save(self, job_key, stage, images, latent=None):
+        output = {k: v.detach().cpu().contiguous() for k, v in images.items()}
+        if latent is not None:
+            output["latent_tensor"] = latent["samples"].detach().cpu().contiguous()
+            output["latent_format_version_0"] = torch.tensor([])
+
+        path = self._stage_path(job_key, stage)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        comfy.utils.save_torch_file(output, temp_path, metadata={"stage": stage, "job": job_key})
+        os.replace(temp_path, path)
+
+    def run(self, job_key, stage, fn, *args, defer=None):
+        """
+        Returns the stored outputs of the stage or runs fn(*args) and stores its (images, latent).
+        With defer the outputs are stored by the function passed to defer(save) instead, for stages that
+        are only complete once work started by fn has finished.
+        """
+        stored = self.load(job_key, stage)
+        if stored is not None:
+            logging.info("{}: reusing completed stage {}".format(job_key, stage))
+            return stored
+        images, latent = fn(*args)
+        if defer is None:
+            self.save(job_key, stage, images, latent)
+        else:
+            defer(lambda: self.save(job_key, stage, images, latent))
+        return (images, latent)
+
+    def discard(self, job_key):
+        """Removes the stored stages of a finished job."""
+        shutil.rmtree(os.path.join(self.directory, job_key), ignore_errors=True)
@@ -0,0 +1,152 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+import psutil
+
+from node_wrapper import wrap_node_mappings
+
+
+class StartupProfiler:
+    """
+    Records the wall time, bytes read and resident memory growth of named startup phases.
+
+    Phases can be nested, a phase includes the phases started inside it. Once instrument_model_loading()
+    was called, the time spent reading state dicts from disk (comfy.utils.load_torch_file) and copying
+    them into the constructed modules, including any dtype conversion (torch.nn.Module.load_state_dict),
+    is also attributed to every running phase. What remains of a phase is model construction and other
+    work.
+
+    Bytes read are reported twice: "file" is the size of the state dict files loaded, "read" is what the
+    process read through read() calls. Safetensors files are memory mapped so they only show up in the
+    first one.
+    """
+    def __init__(self):
+        self.phases = []
+        self._local = threading.local()
+        self._process = psutil.Process()
+        self._originals = None
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = []
+            self._local.stack = stack
+        return stack
+
+    def _read_bytes(self):
+        try:
+            counters = self._process.io_counters()
+        except (AttributeError, NotImplementedError, psutil.Error):
+            return 0
+        return getattr(counters, "read_chars", counters.read_bytes)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        stack = self._stack()
+        record = {
+            "name": name,
+            "depth": len(stack),
+            "seconds": 0.0,
+            "load_seconds": 0.0,
+            "convert_seconds": 0.0,
+            "file_bytes": 0,
+            "read_bytes": 0,
+            "rss_delta_bytes": 0,
+        }
+        self.phases.append(record)
+        stack.append(record)
+        rss_before = self._process.memory_info().rss
+        read_before = self._read_bytes()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            record["read_bytes"] = self._read_bytes() - read_before
+            record["rss_delta_bytes"] = self._process.memory_info().rss - rss_before
+            stack.pop()
+
+    def _attribute(self, key, value):
+        for record in self._stack():
+            record[key] += value
+
+    def instrument_model_loading(self):
+        """Wraps comfy.utils.load_torch_file and torch.nn.Module.load_state_dict to time state dict I/O and conversion."""
+        if self._originals is not None:
+            return
+        import torch
+        import comfy.utils
+
+        load_torch_file = comfy.utils.load_torch_file
+        load_state_dict = torch.nn.Module.load_state_dict
+        self._originals = (load_torch_file, load_state_dict)
+        profiler = self
+
+        def timed_load_torch_file(ckpt, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return load_torch_file(ckpt, *args, **kwargs)
+            finally:
+                profiler._attribute("load_seconds", time.perf_counter() - start)
+                if os.path.isfile(ckpt):
+                    profiler._attribute("file_bytes", os.path.getsize(ckpt))
+
+        def timed_load_state_dict(module, *args, **kwargs):
+            #only the outermost call is timed, modules may load their children's state dicts themselves
+            if getattr(profiler._local, "in_load_state_dict", False):
+                return load_state_dict(module, *args, **kwargs)
+            profiler._local.in_load_state_dict = True
+            start = time.perf_counter()
+            try:
+                return load_state_dict(module, *args, **kwargs)
+            finally:
+                profiler._local.in_load_state_dict = False
+                profiler._attribute("convert_seconds", time.perf_counter() - start)
+
+        comfy.utils.load_torch_file = timed_load_torch_file
+        torch.nn.Module.load_state_dict = timed_load_state_dict
+
+    def uninstrument_model_loading(self):
+        if self._originals is None:
+            return
+        import torch
+        import comfy.utils
+
+        comfy.utils.load_torch_file, torch.nn.Module.load_state_dict = self._originals
+        self._originals = None
+
+    def node_mappings(self, node_mappings):
+        """Wraps node mappings so that every node FUNCTION call is recorded as a phase."""
+        return wrap_node_mappings(node_mappings, self.call)
+
+    def call(self, class_name, node, function_name, function, args, kwargs):
+        """Runs a node call as a phase named after the node and its file inputs."""
+        files = [str(v) for k, v in kwargs.items() if isinstance(v, str) and (k.endswith("_name") or k.endswith("_path") or k.startswith("clip_name"))]
+        label = class_name if len(files) == 0 else "{} {}".format(class_name, ", ".join(os.path.basename(f.replace("\\", "/")) for f in files))
+        with self.phase(label):
+            return function(*args, **kwargs)
+
+    def summary(self):
+        lines = ["{:<56} {:>8} {:>8} {:>8} {:>8} {:>10} {:>10} {:>10}".format(
+            "Phase", "Wall s", "Load s", "Conv s", "Other s", "File MB", "Read MB", "RSS +MB")]
+        for record in self.phases:
+            other = max(0.0, record["seconds"] - record["load_seconds"] - record["convert_seconds"])
+            lines.append("{:<56} {:8.2f} {:8.2f} {:8.2f} {:8.2f} {:10.1f} {:10.1f} {:10.1f}".format(
+                ("  " * record["depth"] + record["name"])[:56],
+                record["seconds"],
+                record["load_seconds"],
+                record["convert_seconds"],
+                other,
+                record["file_bytes"] / (1024 * 1024),
+                record["read_bytes"] / (1024 * 1024),
+                record["rss_delta_bytes"] / (1024 * 1024)))
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"phases": self.phases}, f, indent=2)
+        logging.info("Wrote startup profile to {}".format(path))
@@ -0,0 +1,127 @@
+import os
+
+import torch
+
+#LoadImage returns UInt8Image batches instead of float32 tensors
+UINT8_IMAGES = os.environ.get("PROMOGENIE_UINT8_IMAGES", "0") == "1"
+
+
+def set_enabled(enabled):
+    """Enables or disables loading images as UInt8Image."""
+    global UINT8_IMAGES
+    UINT8_IMAGES = enabled
+
+
+class UInt8Image:
+    """
+    An IMAGE batch kept as its uint8 [B, H, W, C] pixels, a quarter of the memory of the float32 image.
+
+    It stands for the float32 image in [0, 1] that LoadImage would have returned: torch functions,
+    tensor methods and operators convert it with to_float() and run on the result. It is not a
+    torch.Tensor though, nodes that check isinstance(image, torch.Tensor) or hand it to code outside
+    of torch and numpy don't accept it. Nodes that only move pixels around (saving, nearest resizing,
+    cropping, batching, inverting, padding) use the uint8 data directly and keep the small
+    representation. Indexing and iterating also stay uint8, assigning to an index writes into the
+    pixels. to_float() is not cached, a node that reads the image twice converts it twice.
+    """
+    def __init__(self, data):
+        if data.dtype != torch.uint8:
+            raise ValueError("UInt8Image needs a uint8 tensor, got {}".format(data.dtype))
+        self.data = data
+
+    dtype = torch.float32
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def device(self):
+        return self.data.device
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def size(self, dim=None):
+        return self.data.size() if dim is None else self.data.size(dim)
+
+    def dim(self):
+        return self.data.dim()
+
+    def to_float(self):
+        """Returns the float32 image, bit identical to decoding the pixels with np.float32(pixels) / 255.0."""
+        return self.data.to(torch.float32).div_(255.0)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return UInt8Image(self.data[index])
+
+    def __setitem__(self, index, value):
+        """Writes into the pixels, float values are rounded to the nearest of the 256 levels and clamped to [0, 1]."""
+        data = uint8_data(value)
+        if data is None:
+            data = torch.round(torch.as_tensor(value, device=self.data.device) * 255.).clamp_(0, 255).to(torch.uint8)
+        self.data[index] = data
+
+    def __iter__(self):
+        for i in range(len(self.data)):
+            yield UInt8Image(self.data[i])
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.to_float().cpu().numpy()
+        return array if dtype is None else array.astype(dtype)
+
+    def __repr__(self):
+        return "UInt8Image(shape={}, device={})".format(tuple(self.data.shape), self.data.device)
+
+    @classmethod
+    def __torch_function__(cls, func, types, args=(), kwargs=None):
+        return func(*_to_float(args), **_to_float(kwargs or {}))
+
+    def __getattr__(self, name):
+        if name == "data" or name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.to_float(), name)
+
+
+def _forward(name):
+    def method(self, *args):
+        return getattr(self.to_float(), name)(*_to_float(args))
+    method.__name__ = name
+    return method
+
+#operators are looked up on the type and bypass __getattr__, in place operators fall back to these and return a tensor
+for _name in ("__add__", "__radd__", "__sub__", "__rsub__", "__mul__", "__rmul__", "__truediv__", "__rtruediv__",
+              "__floordiv__", "__rfloordiv__", "__mod__", "__rmod__", "__pow__", "__rpow__", "__matmul__", "__rmatmul__",
+              "__and__", "__rand__", "__or__", "__ror__", "__xor__", "__rxor__", "__lshift__", "__rlshift__",
+              "__rshift__", "__rrshift__", "__neg__", "__pos__", "__abs__", "__invert__",
+              "__eq__", "__ne__", "__lt__", "__le__", "__gt__", "__ge__",
+              "__bool__", "__float__", "__int__", "__index__", "__round__"):
+    setattr(UInt8Image, _name, _forward(_name))
+
+
+def _to_float(value):
+    if isinstance(value, UInt8Image):
+        return value.to_float()
+    if type(value) in (list, tuple):
+        return type(value)(_to_float(v) for v in value)
+    if isinstance(value, dict):
+        return {k: _to_float(v) for k, v in value.items()}
+    return value
+
+
+def uint8_data(image):
+    """Returns the uint8 pixels of a UInt8Image, None for anything else."""
+    return image.data if isinstance(image, UInt8Image) else None
+
+
+def to_float(image):
+    """Returns image as a float32 tensor, converting a UInt8Image."""
+    return image.to_float() if isinstance(image, UInt8Image) else image
@@ -1,9 +1,17 @@
+import argparse
+import concurrent.futures
+import csv
+import hashlib
+import json
 import os
-import random
+import subprocess
 import sys
+import time
 from typing import Sequence, Mapping, Any, Union
 import torch
 
+from startup_profiler import StartupProfiler
+
 
 def get_value_at_index(obj: Union[Sequence, Mapping], index: int) -> Any:
     """Returns the value at the given index of a sequence or mapping.
@@ -85,571 +93,1110 @@ def add_extra_model_paths() -> None:
         print("Could not find the extra_model_paths config file.")
 
 
-add_comfyui_directory_to_sys_path()
-add_extra_model_paths()
+STARTUP_PROFILER = StartupProfiler()
+with STARTUP_PROFILER.phase("add_comfyui_directory_to_sys_path"):
+    add_comfyui_directory_to_sys_path()
+with STARTUP_PROFILER.phase("add_extra_model_paths"):
+    add_extra_model_paths()
 
 
-def import_custom_nodes() -> None:
+def import_custom_nodes(headless: bool = True, lazy: bool = True, workers: int = 1, import_profile: str = None) -> float:
     """Find all custom nodes in the custom_nodes folder and add those node objects to NODE_CLASS_MAPPINGS
 
-    This function sets up a new asyncio event loop, initializes the PromptServer,
-    creates a PromptQueue, and initializes the custom nodes.
-    """
-    import asyncio
-    import execution
-    from nodes import init_extra_nodes
-    import server
-
-    # Creating a new event loop and setting it as the default loop
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-
-    # Creating an instance of PromptServer with the loop
-    server_instance = server.PromptServer(loop)
-    execution.PromptQueue(server_instance)
-
-    # Initializing custom nodes
-    init_extra_nodes()
-
-
-from nodes import NODE_CLASS_MAPPINGS
-
-
-def main():
-    import_custom_nodes()
-    with torch.inference_mode():
-        loadimage = NODE_CLASS_MAPPINGS["LoadImage"]()
-        loadimage_1 = loadimage.load_image(image="100588455.png")
+    By default only a lightweight HeadlessPromptServer is installed as PromptServer.instance since
+    the nodes are executed from this script. With headless=False this function sets up a new
+    asyncio event loop, initializes the PromptServer and creates a PromptQueue like the web server
+    does before initializing the custom nodes.
 
-        loadimage_2 = loadimage.load_image(image="background _image_with text.jpeg")
+    With lazy=True the comfy_extras node files and unchanged custom node packs are only imported once
+    one of their nodes is used, their node names come from the node manifest in the cache directory. With workers > 1 the
+    custom node packs are imported on that many threads, import_profile is the path of a json file
+    receiving the import time, failure and memory change of every pack.
 
-        cr_image_size = NODE_CLASS_MAPPINGS["CR Image Size"]()
-        cr_image_size_7 = cr_image_size.ImageSize(
-            width=1600, height=904, upscale_factor=1
-        )
-
-        checkpointloadersimple = NODE_CLASS_MAPPINGS["CheckpointLoaderSimple"]()
-        checkpointloadersimple_264 = checkpointloadersimple.load_checkpoint(
-            ckpt_name="epicrealism_naturalSinRC1VAE.safetensors"
-        )
-
-        cr_text = NODE_CLASS_MAPPINGS["CR Text"]()
-        cr_text_583 = cr_text.text_multiline(
-            text="Write text 'Independence Day Discount 20% off' on a sticker on the top right side of the image\n\nA plain and empty podium in a circular shape place in center. The background and style should be on this: \nA vibrant, patriotic scene of India celebrating Independence Day. Imagine a bustling city street filled with people waving flags, dancing, and wearing traditional attire. In the background, iconic Indian landmarks like the Taj Mahal or the Red Fort are bathed in the golden glow of the setting sun. The overall atmosphere should be festive, energetic, and full of national pride.\nThe product is a jar containing schezwan sauce with a white lid of company Chings\n\n"
-        )
-
-        cliptextencode = NODE_CLASS_MAPPINGS["CLIPTextEncode"]()
-        cliptextencode_266 = cliptextencode.encode(
-            text=get_value_at_index(cr_text_583, 0),
-            clip=get_value_at_index(checkpointloadersimple_264, 1),
-        )
-
-        cliptextencode_269 = cliptextencode.encode(
-            text="", clip=get_value_at_index(checkpointloadersimple_264, 1)
-        )
-
-        logic_boolean_primitive = NODE_CLASS_MAPPINGS["Logic Boolean Primitive"]()
-        logic_boolean_primitive_629 = logic_boolean_primitive.do(boolean=True)
-
-        cr_set_value_on_boolean = NODE_CLASS_MAPPINGS["CR Set Value On Boolean"]()
-        cr_set_value_on_boolean_632 = cr_set_value_on_boolean.set_value(
-            boolean=get_value_at_index(logic_boolean_primitive_629, 0),
-            value_if_true=1,
-            value_if_false=2,
-        )
-
-        imageresize = NODE_CLASS_MAPPINGS["ImageResize+"]()
-        imageresize_8 = imageresize.execute(
-            width=get_value_at_index(cr_image_size_7, 0),
-            height=get_value_at_index(cr_image_size_7, 1),
-            interpolation="lanczos",
-            method="fill / crop",
-            condition="always",
-            multiple_of=0,
-            image=get_value_at_index(loadimage_2, 0),
-        )
-
-        layercolor_exposure = NODE_CLASS_MAPPINGS["LayerColor: Exposure"]()
-        layercolor_exposure_488 = layercolor_exposure.color_correct_exposure(
-            exposure=1, image=get_value_at_index(imageresize_8, 0)
-        )
-
-        image_blank = NODE_CLASS_MAPPINGS["Image Blank"]()
-        image_blank_627 = image_blank.blank_image(
-            width=get_value_at_index(cr_image_size_7, 0),
-            height=get_value_at_index(cr_image_size_7, 1),
-            red=80,
-            green=80,
-            blue=80,
-        )
-
-        cr_image_input_switch = NODE_CLASS_MAPPINGS["CR Image Input Switch"]()
-        cr_image_input_switch_610 = cr_image_input_switch.switch(
-            Input=get_value_at_index(cr_set_value_on_boolean_632, 0),
-            image1=get_value_at_index(layercolor_exposure_488, 0),
-            image2=get_value_at_index(image_blank_627, 0),
-        )
-
-        imageresize_97 = imageresize.execute(
-            width=get_value_at_index(cr_image_size_7, 0),
-            height=get_value_at_index(cr_image_size_7, 1),
-            interpolation="lanczos",
-            method="pad",
-            condition="always",
-            multiple_of=0,
-            image=get_value_at_index(loadimage_1, 0),
-        )
-
-        easy_imagerembg = NODE_CLASS_MAPPINGS["easy imageRemBg"]()
-        easy_imagerembg_11 = easy_imagerembg.remove(
-            rem_mode="RMBG-1.4",
-            image_output="Preview",
-            save_prefix="ComfyUI",
-            torchscript_jit=False,
-            images=get_value_at_index(imageresize_97, 0),
-        )
-
-        layercolor_exposure_294 = layercolor_exposure.color_correct_exposure(
-            exposure=4, image=get_value_at_index(easy_imagerembg_11, 0)
-        )
-
-        layerutility_imageblendadvance_v2 = NODE_CLASS_MAPPINGS[
-            "LayerUtility: ImageBlendAdvance V2"
-        ]()
-        layerutility_imageblendadvance_v2_360 = (
-            layerutility_imageblendadvance_v2.image_blend_advance_v2(
-                invert_mask=False,
-                blend_mode="normal",
-                opacity=100,
-                x_percent=50,
-                y_percent=60,
-                mirror="None",
-                scale=0.4,
-                aspect_ratio=1,
-                rotate=0,
-                transform_method="lanczos",
-                anti_aliasing=0,
-                background_image=get_value_at_index(cr_image_input_switch_610, 0),
-                layer_image=get_value_at_index(layercolor_exposure_294, 0),
-            )
-        )
-
-        layercolor_autoadjust = NODE_CLASS_MAPPINGS["LayerColor: AutoAdjust"]()
-        layercolor_autoadjust_99 = layercolor_autoadjust.auto_adjust(
-            strength=10,
-            brightness=0,
-            contrast=0,
-            saturation=0,
-            red=0,
-            green=0,
-            blue=0,
-            image=get_value_at_index(layerutility_imageblendadvance_v2_360, 0),
-        )
-
-        checkpointloadersimple_593 = checkpointloadersimple.load_checkpoint(
-            ckpt_name="juggernautXL_v9Rdphoto2Lightning.safetensors"
-        )
-
-        loraloader = NODE_CLASS_MAPPINGS["LoraLoader"]()
-        loraloader_594 = loraloader.load_lora(
-            lora_name="mjv6.safetensors",
-            strength_model=0.2,
-            strength_clip=1,
-            model=get_value_at_index(checkpointloadersimple_593, 0),
-            clip=get_value_at_index(checkpointloadersimple_593, 1),
-        )
-
-        cliptextencode_595 = cliptextencode.encode(
-            text=get_value_at_index(cr_text_583, 0),
-            clip=get_value_at_index(loraloader_594, 1),
-        )
-
-        cliptextencode_598 = cliptextencode.encode(
-            text="", clip=get_value_at_index(checkpointloadersimple_593, 1)
-        )
-
-        controlnetloader = NODE_CLASS_MAPPINGS["ControlNetLoader"]()
-        controlnetloader_600 = controlnetloader.load_controlnet(
-            control_net_name="SDXL\controlnet-canny-sdxl-1.0\diffusion_pytorch_model_V2.safetensors"
-        )
+    Returns:
+        float: The time it took in seconds.
+    """
+    start = time.perf_counter()
+    from nodes import init_extra_nodes
 
-        imagecompositemasked = NODE_CLASS_MAPPINGS["ImageCompositeMasked"]()
-        imagecompositemasked_661 = imagecompositemasked.composite(
-            x=0,
-            y=0,
-            resize_source=False,
-            destination=get_value_at_index(image_blank_627, 0),
-            source=get_value_at_index(layerutility_imageblendadvance_v2_360, 0),
-            mask=get_value_at_index(layerutility_imageblendadvance_v2_360, 1),
-        )
+    if headless:
+        from headless import init_headless_server
 
-        cannyedgepreprocessor = NODE_CLASS_MAPPINGS["CannyEdgePreprocessor"]()
-        cannyedgepreprocessor_602 = cannyedgepreprocessor.execute(
-            low_threshold=100,
-            high_threshold=200,
-            resolution=1024,
-            image=get_value_at_index(imagecompositemasked_661, 0),
-        )
+        init_headless_server()
+    else:
+        import asyncio
+        import execution
+        import server
 
-        controlnetapplyadvanced = NODE_CLASS_MAPPINGS["ControlNetApplyAdvanced"]()
-        controlnetapplyadvanced_599 = controlnetapplyadvanced.apply_controlnet(
-            strength=1,
-            start_percent=0,
-            end_percent=1,
-            positive=get_value_at_index(cliptextencode_595, 0),
-            negative=get_value_at_index(cliptextencode_598, 0),
-            control_net=get_value_at_index(controlnetloader_600, 0),
-            image=get_value_at_index(cannyedgepreprocessor_602, 0),
-        )
+        # Creating a new event loop and setting it as the default loop
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
 
-        vaeencode = NODE_CLASS_MAPPINGS["VAEEncode"]()
-        vaeencode_606 = vaeencode.encode(
-            pixels=get_value_at_index(imagecompositemasked_661, 0),
-            vae=get_value_at_index(checkpointloadersimple_593, 2),
-        )
+        # Creating an instance of PromptServer with the loop
+        server_instance = server.PromptServer(loop)
+        execution.PromptQueue(server_instance)
 
-        ksampler = NODE_CLASS_MAPPINGS["KSampler"]()
-        ksampler_597 = ksampler.sample(
-            seed=random.randint(1, 2**64),
-            steps=6,
-            cfg=3,
-            sampler_name="dpmpp_sde",
-            scheduler="karras",
-            denoise=1,
-            model=get_value_at_index(loraloader_594, 0),
-            positive=get_value_at_index(controlnetapplyadvanced_599, 0),
-            negative=get_value_at_index(controlnetapplyadvanced_599, 1),
-            latent_image=get_value_at_index(vaeencode_606, 0),
-        )
+    # Initializing custom nodes
+    init_extra_nodes(lazy=lazy, custom_node_workers=workers, import_profile=import_profile)
+    return time.perf_counter() - start
 
-        vaedecode = NODE_CLASS_MAPPINGS["VAEDecode"]()
-        vaedecode_604 = vaedecode.decode(
-            samples=get_value_at_index(ksampler_597, 0),
-            vae=get_value_at_index(checkpointloadersimple_593, 2),
-        )
 
-        growmaskwithblur = NODE_CLASS_MAPPINGS["GrowMaskWithBlur"]()
-        growmaskwithblur_333 = growmaskwithblur.expand_mask(
-            expand=-1,
-            incremental_expandrate=0,
-            tapered_corners=True,
-            flip_input=False,
-            blur_radius=1,
-            lerp_alpha=1,
-            decay_factor=1,
-            fill_holes=False,
-            mask=get_value_at_index(layerutility_imageblendadvance_v2_360, 1),
-        )
+def compare_startup(lazy: bool = True, workers: int = 1) -> None:
+    """Measures the node registry startup in fresh interpreters with and without the headless server.
 
-        imagecompositemasked_740 = imagecompositemasked.composite(
-            x=0,
-            y=0,
-            resize_source=False,
-            destination=get_value_at_index(vaedecode_604, 0),
-            source=get_value_at_index(imagecompositemasked_661, 0),
-            mask=get_value_at_index(growmaskwithblur_333, 0),
-        )
+    Both runs get the same lazy and workers settings. With lazy=True an untimed run first builds the
+    node manifest, otherwise the headless run would pay for the cold manifest the server run reuses.
+    """
+    base = [sys.executable, os.path.abspath(__file__), "--startup-only", "--custom-node-workers", str(workers)]
+    if not lazy:
+        base.append("--no-lazy-nodes")
+    else:
+        subprocess.run(base, capture_output=True, text=True)
+    for headless in (True, False):
+        command = list(base)
+        if not headless:
+            command.append("--no-headless")
+        start = time.perf_counter()
+        result = subprocess.run(command, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        status = "" if result.returncode == 0 else " (FAILED)"
+        print("{:<8} startup: {:6.1f} seconds{}".format("headless" if headless else "server", elapsed, status))
+
+
+with STARTUP_PROFILER.phase("import nodes"):
+    from nodes import NODE_CLASS_MAPPINGS, CHECKPOINT_CACHE, CONTROLNET_CACHE, IMAGE_CACHE
+from node_memo import MemoizingNodeMappings
+from node_tracer import NodeTracer
+import image_writer
+import uint8_image
+from stage_store import StageStore
+from pipeline_scheduler import StagePipeline
+import model_cache
+import prompt_cache
+import sample_cache
+
+
+PROMPT_TEMPLATE = "Write text '{sticker_text}' on a sticker on the top right side of the image\n\n{prompt}"
+
+DEFAULT_JOB = {
+    "job_id": "default",
+    "product_image": "100588455.png",
+    "background_image": "background _image_with text.jpeg",
+    "sticker_text": "Independence Day Discount 20% off",
+    "prompt": "A plain and empty podium in a circular shape place in center. The background and style should be on this: \nA vibrant, patriotic scene of India celebrating Independence Day. Imagine a bustling city street filled with people waving flags, dancing, and wearing traditional attire. In the background, iconic Indian landmarks like the Taj Mahal or the Red Fort are bathed in the golden glow of the setting sun. The overall atmosphere should be festive, energetic, and full of national pride.\nThe product is a jar containing schezwan sauce with a white lid of company Chings\n\n",
+    "background_prompt": "A plain and empty wooden podium in a circular shape placed in a home drawing room with a small library and sofa background with soft diffused lightning designed  This scene should evoke a modern classy feeling",
+    "width": 1600,
+    "height": 904,
+    "x_percent": 50,
+    "y_percent": 60,
+    "scale": 0.4,
+    "filename_prefix": "ComfyUI",
+    "output_format": "png",
+    "output_quality": 90,
+    "seed": None,
+}
+
+JOB_FIELD_TYPES = {
+    "width": int,
+    "height": int,
+    "x_percent": float,
+    "y_percent": float,
+    "scale": float,
+    "output_quality": int,
+    "seed": int,
+}
+
+
+def normalize_job(row: Mapping[str, Any], index: int = 0) -> dict:
+    """Fills a manifest row with the defaults and converts the numeric fields.
+
+    Empty values (as produced by blank CSV cells) fall back to the default.
 
-        cr_image_input_switch_580 = cr_image_input_switch.switch(
-            Input=get_value_at_index(cr_set_value_on_boolean_632, 0),
-            image1=get_value_at_index(layercolor_autoadjust_99, 0),
-            image2=get_value_at_index(imagecompositemasked_740, 0),
-        )
+    Args:
+        row (Mapping[str, Any]): One manifest entry.
+        index (int): Position of the entry in the manifest, used for the default job id.
 
-        vaeencode_277 = vaeencode.encode(
-            pixels=get_value_at_index(cr_image_input_switch_580, 0),
-            vae=get_value_at_index(checkpointloadersimple_264, 2),
-        )
+    Returns:
+        dict: A complete job description.
 
-        iclightconditioning = NODE_CLASS_MAPPINGS["ICLightConditioning"]()
-        iclightconditioning_276 = iclightconditioning.encode(
-            multiplier=0.18,
-            positive=get_value_at_index(cliptextencode_266, 0),
-            negative=get_value_at_index(cliptextencode_269, 0),
-            vae=get_value_at_index(checkpointloadersimple_264, 2),
-            foreground=get_value_at_index(vaeencode_277, 0),
-        )
+    Raises:
+        ValueError: If the row contains a field that is not a known job field.
+    """
+    unknown = set(row) - set(DEFAULT_JOB)
+    if unknown:
+        raise ValueError("Unknown manifest fields: {}".format(", ".join(sorted(unknown))))
 
-        cr_image_input_switch_613 = cr_image_input_switch.switch(
-            Input=get_value_at_index(cr_set_value_on_boolean_632, 0),
-            image1=get_value_at_index(layercolor_autoadjust_99, 0),
-            image2=get_value_at_index(imagecompositemasked_740, 0),
-        )
+    job = dict(DEFAULT_JOB)
+    job["job_id"] = "job_{:05}".format(index)
+    for key, value in row.items():
+        if value is None or value == "":
+            continue
+        job[key] = JOB_FIELD_TYPES.get(key, str)(value)
+    return job
 
-        image_select_channel = NODE_CLASS_MAPPINGS["Image Select Channel"]()
-        image_select_channel_40 = image_select_channel.select_channel(
-            channel="green", image=get_value_at_index(cr_image_input_switch_613, 0)
-        )
 
-        imageblur = NODE_CLASS_MAPPINGS["ImageBlur"]()
-        imageblur_98 = imageblur.blur(
-            blur_radius=30,
-            sigma=1,
-            image=get_value_at_index(image_select_channel_40, 0),
-        )
+def read_manifest(path: str) -> list:
+    """Reads a campaign manifest, either CSV with a header row or JSON lines.
 
-        layercolor_brightness__contrast = NODE_CLASS_MAPPINGS[
-            "LayerColor: Brightness & Contrast"
-        ]()
-        layercolor_brightness__contrast_549 = (
-            layercolor_brightness__contrast.color_correct_brightness_and_contrast(
-                brightness=1.2,
-                contrast=1,
-                saturation=1,
-                image=get_value_at_index(imageblur_98, 0),
-            )
-        )
+    Each entry names a product image, a background image, the sticker text and the
+    placement parameters, see DEFAULT_JOB for the accepted fields.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    return [normalize_job(row, index) for index, row in enumerate(rows)]
 
-        vaeencode_284 = vaeencode.encode(
-            pixels=get_value_at_index(layercolor_brightness__contrast_549, 0),
-            vae=get_value_at_index(checkpointloadersimple_264, 2),
-        )
 
-        controlnetloader_301 = controlnetloader.load_controlnet(
-            control_net_name="SDXL\controlnet-canny-sdxl-1.0\diffusion_pytorch_model_V2.safetensors"
-        )
+def load_models(node_mappings: Mapping[str, Any] = NODE_CLASS_MAPPINGS) -> dict:
+    """Loads every model and job independent input of the workflow once.
 
-        loadandapplyiclightunet = NODE_CLASS_MAPPINGS["LoadAndApplyICLightUnet"]()
-        loadandapplyiclightunet_279 = loadandapplyiclightunet.load(
-            model_path="iclight_sd15_fc_unet_ldm.safetensors",
-            model=get_value_at_index(checkpointloadersimple_264, 0),
+    The returned dictionary is passed to render_job for each job so that the
+    checkpoints, LoRAs and ControlNets stay loaded across a whole batch.
+    """
+    checkpointloadersimple = node_mappings["CheckpointLoaderSimple"]()
+    checkpointloadersimple_264 = checkpointloadersimple.load_checkpoint(
+        ckpt_name="epicrealism_naturalSinRC1VAE.safetensors"
+    )
+
+    cliptextencode = node_mappings["CLIPTextEncode"]()
+    cliptextencode_269 = cliptextencode.encode(
+        text="", clip=get_value_at_index(checkpointloadersimple_264, 1)
+    )
+
+    checkpointloadersimple_593 = checkpointloadersimple.load_checkpoint(
+        ckpt_name="juggernautXL_v9Rdphoto2Lightning.safetensors"
+    )
+
+    loraloader = node_mappings["LoraLoader"]()
+    loraloader_594 = loraloader.load_lora(
+        lora_name="mjv6.safetensors",
+        strength_model=0.2,
+        strength_clip=1,
+        model=get_value_at_index(checkpointloadersimple_593, 0),
+        clip=get_value_at_index(checkpointloadersimple_593, 1),
+    )
+
+    cliptextencode_598 = cliptextencode.encode(
+        text="", clip=get_value_at_index(checkpointloadersimple_593, 1)
+    )
+
+    controlnetloader = node_mappings["ControlNetLoader"]()
+    controlnetloader_600 = controlnetloader.load_controlnet(
+        control_net_name="SDXL\controlnet-canny-sdxl-1.0\diffusion_pytorch_model_V2.safetensors"
+    )
+
+    controlnetloader_301 = controlnetloader.load_controlnet(
+        control_net_name="SDXL\controlnet-canny-sdxl-1.0\diffusion_pytorch_model_V2.safetensors"
+    )
+
+    loadandapplyiclightunet = node_mappings["LoadAndApplyICLightUnet"]()
+    loadandapplyiclightunet_279 = loadandapplyiclightunet.load(
+        model_path="iclight_sd15_fc_unet_ldm.safetensors",
+        model=get_value_at_index(checkpointloadersimple_264, 0),
+    )
+    #the IC-Light weights are patches of the SD1.5 model, tag them so cache keys don't hash them on every job
+    import folder_paths
+    iclight_path = folder_paths.get_full_path("unet", "iclight_sd15_fc_unet_ldm.safetensors")
+    if iclight_path is not None:
+        model_cache.tag_patch_sources(
+            get_value_at_index(loadandapplyiclightunet_279, 0),
+            model_cache.file_fingerprint(iclight_path),
+            base=get_value_at_index(checkpointloadersimple_264, 0),
         )
 
-        ksampler_278 = ksampler.sample(
-            seed=random.randint(1, 2**64),
-            steps=40,
-            cfg=3,
-            sampler_name="dpmpp_2m_sde",
-            scheduler="karras",
-            denoise=1,
-            model=get_value_at_index(loadandapplyiclightunet_279, 0),
-            positive=get_value_at_index(iclightconditioning_276, 0),
-            negative=get_value_at_index(iclightconditioning_276, 1),
-            latent_image=get_value_at_index(vaeencode_284, 0),
+    checkpointloadersimple_325 = checkpointloadersimple.load_checkpoint(
+        ckpt_name="juggernautXL_v9Rdphoto2Lightning.safetensors"
+    )
+
+    loraloader_326 = loraloader.load_lora(
+        lora_name="mjv6.safetensors",
+        strength_model=0.2,
+        strength_clip=1,
+        model=get_value_at_index(checkpointloadersimple_325, 0),
+        clip=get_value_at_index(checkpointloadersimple_325, 1),
+    )
+
+    cliptextencode_328 = cliptextencode.encode(
+        text="", clip=get_value_at_index(loraloader_326, 1)
+    )
+
+    unetloader = node_mappings["UNETLoader"]()
+    unetloader_773 = unetloader.load_unet(
+        unet_name="flux1-schnell.safetensors", weight_dtype="default"
+    )
+
+    dualcliploader = node_mappings["DualCLIPLoader"]()
+    dualcliploader_774 = dualcliploader.load_clip(
+        clip_name1="t5xxl_fp16.safetensors",
+        clip_name2="clip_l.safetensors",
+        type="flux",
+    )
+
+    ksamplerselect = node_mappings["KSamplerSelect"]()
+    ksamplerselect_780 = ksamplerselect.get_sampler(sampler_name="euler")
+
+    vaeloader = node_mappings["VAELoader"]()
+    vaeloader_782 = vaeloader.load_vae(
+        vae_name="diffusion_pytorch_model.safetensors"
+    )
+
+    return {
+        "checkpointloadersimple_264": checkpointloadersimple_264,
+        "cliptextencode_269": cliptextencode_269,
+        "checkpointloadersimple_593": checkpointloadersimple_593,
+        "loraloader_594": loraloader_594,
+        "cliptextencode_598": cliptextencode_598,
+        "controlnetloader_600": controlnetloader_600,
+        "controlnetloader_301": controlnetloader_301,
+        "loadandapplyiclightunet_279": loadandapplyiclightunet_279,
+        "checkpointloadersimple_325": checkpointloadersimple_325,
+        "loraloader_326": loraloader_326,
+        "cliptextencode_328": cliptextencode_328,
+        "unetloader_773": unetloader_773,
+        "dualcliploader_774": dualcliploader_774,
+        "ksamplerselect_780": ksamplerselect_780,
+        "vaeloader_782": vaeloader_782,
+    }
+
+
+STAGES = ("composite", "harmonize", "relight", "restore_detail", "flux_background")
+
+
+def job_seed(job: Mapping[str, Any], node: str) -> int:
+    """Returns a reproducible seed for a sampler node of a job.
+
+    The seed is derived from the job's seed field, or its job id when no seed is
+    given, so re-rendering a job gives the same banner and can reuse cached
+    sampler results.
+    """
+    base = job["job_id"] if job.get("seed") is None else job["seed"]
+    digest = hashlib.blake2b("{}/{}".format(base, node).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def switch_input(node_mappings: Mapping[str, Any]) -> Any:
+    """Returns the CR Image Input Switch selector driven by the Logic Boolean Primitive."""
+    logic_boolean_primitive = node_mappings["Logic Boolean Primitive"]()
+    logic_boolean_primitive_629 = logic_boolean_primitive.do(boolean=True)
+
+    cr_set_value_on_boolean = node_mappings["CR Set Value On Boolean"]()
+    cr_set_value_on_boolean_632 = cr_set_value_on_boolean.set_value(
+        boolean=get_value_at_index(logic_boolean_primitive_629, 0),
+        value_if_true=1,
+        value_if_false=2,
+    )
+    return get_value_at_index(cr_set_value_on_boolean_632, 0)
+
+
+def campaign_prompt(job: Mapping[str, Any], node_mappings: Mapping[str, Any]) -> str:
+    cr_text = node_mappings["CR Text"]()
+    cr_text_583 = cr_text.text_multiline(
+        text=PROMPT_TEMPLATE.format(sticker_text=job["sticker_text"], prompt=job["prompt"])
+    )
+    return get_value_at_index(cr_text_583, 0)
+
+
+def stage_composite(models, job, node_mappings):
+    """Cuts the product out of its photo, places it on the background and detects its edges."""
+    loadimage = node_mappings["LoadImage"]()
+    #both photos are scaled to the banner size, oversized JPEGs are decoded at a reduced resolution
+    loadimage_1 = loadimage.load_image(
+        image=job["product_image"], target_width=job["width"], target_height=job["height"]
+    )
+
+    loadimage_2 = loadimage.load_image(
+        image=job["background_image"], target_width=job["width"], target_height=job["height"]
+    )
+
+    cr_image_size = node_mappings["CR Image Size"]()
+    cr_image_size_7 = cr_image_size.ImageSize(
+        width=job["width"], height=job["height"], upscale_factor=1
+    )
+
+    imageresize = node_mappings["ImageResize+"]()
+    imageresize_8 = imageresize.execute(
+        width=get_value_at_index(cr_image_size_7, 0),
+        height=get_value_at_index(cr_image_size_7, 1),
+        interpolation="lanczos",
+        method="fill / crop",
+        condition="always",
+        multiple_of=0,
+        image=get_value_at_index(loadimage_2, 0),
+    )
+
+    layercolor_exposure = node_mappings["LayerColor: Exposure"]()
+    layercolor_exposure_488 = layercolor_exposure.color_correct_exposure(
+        exposure=1, image=get_value_at_index(imageresize_8, 0)
+    )
+
+    image_blank = node_mappings["Image Blank"]()
+    image_blank_627 = image_blank.blank_image(
+        width=get_value_at_index(cr_image_size_7, 0),
+        height=get_value_at_index(cr_image_size_7, 1),
+        red=80,
+        green=80,
+        blue=80,
+    )
+
+    cr_image_input_switch = node_mappings["CR Image Input Switch"]()
+    cr_image_input_switch_610 = cr_image_input_switch.switch(
+        Input=switch_input(node_mappings),
+        image1=get_value_at_index(layercolor_exposure_488, 0),
+        image2=get_value_at_index(image_blank_627, 0),
+    )
+
+    imageresize_97 = imageresize.execute(
+        width=get_value_at_index(cr_image_size_7, 0),
+        height=get_value_at_index(cr_image_size_7, 1),
+        interpolation="lanczos",
+        method="pad",
+        condition="always",
+        multiple_of=0,
+        image=get_value_at_index(loadimage_1, 0),
+    )
+
+    easy_imagerembg = node_mappings["easy imageRemBg"]()
+    easy_imagerembg_11 = easy_imagerembg.remove(
+        rem_mode="RMBG-1.4",
+        image_output="Preview",
+        save_prefix="ComfyUI",
+        torchscript_jit=False,
+        images=get_value_at_index(imageresize_97, 0),
+    )
+
+    layercolor_exposure_294 = layercolor_exposure.color_correct_exposure(
+        exposure=4, image=get_value_at_index(easy_imagerembg_11, 0)
+    )
+
+    layerutility_imageblendadvance_v2 = node_mappings[
+        "LayerUtility: ImageBlendAdvance V2"
+    ]()
+    layerutility_imageblendadvance_v2_360 = (
+        layerutility_imageblendadvance_v2.image_blend_advance_v2(
+            invert_mask=False,
+            blend_mode="normal",
+            opacity=100,
+            x_percent=job["x_percent"],
+            y_percent=job["y_percent"],
+            mirror="None",
+            scale=job["scale"],
+            aspect_ratio=1,
+            rotate=0,
+            transform_method="lanczos",
+            anti_aliasing=0,
+            background_image=get_value_at_index(cr_image_input_switch_610, 0),
+            layer_image=get_value_at_index(layercolor_exposure_294, 0),
         )
-
-        vaedecode_280 = vaedecode.decode(
-            samples=get_value_at_index(ksampler_278, 0),
-            vae=get_value_at_index(checkpointloadersimple_264, 2),
+    )
+
+    layercolor_autoadjust = node_mappings["LayerColor: AutoAdjust"]()
+    layercolor_autoadjust_99 = layercolor_autoadjust.auto_adjust(
+        strength=10,
+        brightness=0,
+        contrast=0,
+        saturation=0,
+        red=0,
+        green=0,
+        blue=0,
+        image=get_value_at_index(layerutility_imageblendadvance_v2_360, 0),
+    )
+
+    imagecompositemasked = node_mappings["ImageCompositeMasked"]()
+    imagecompositemasked_661 = imagecompositemasked.composite(
+        x=0,
+        y=0,
+        resize_source=False,
+        destination=get_value_at_index(image_blank_627, 0),
+        source=get_value_at_index(layerutility_imageblendadvance_v2_360, 0),
+        mask=get_value_at_index(layerutility_imageblendadvance_v2_360, 1),
+    )
+
+    cannyedgepreprocessor = node_mappings["CannyEdgePreprocessor"]()
+    cannyedgepreprocessor_602 = cannyedgepreprocessor.execute(
+        low_threshold=100,
+        high_threshold=200,
+        resolution=1024,
+        image=get_value_at_index(imagecompositemasked_661, 0),
+    )
+
+    growmaskwithblur = node_mappings["GrowMaskWithBlur"]()
+    growmaskwithblur_333 = growmaskwithblur.expand_mask(
+        expand=-1,
+        incremental_expandrate=0,
+        tapered_corners=True,
+        flip_input=False,
+        blur_radius=1,
+        lerp_alpha=1,
+        decay_factor=1,
+        fill_holes=False,
+        mask=get_value_at_index(layerutility_imageblendadvance_v2_360, 1),
+    )
+
+    splitimagewithalpha = node_mappings["SplitImageWithAlpha"]()
+    splitimagewithalpha_763 = splitimagewithalpha.split_image_with_alpha(
+        image=get_value_at_index(loadimage_1, 0)
+    )
+
+    images = {
+        "layercolor_autoadjust_99": get_value_at_index(layercolor_autoadjust_99, 0),
+        "imagecompositemasked_661": get_value_at_index(imagecompositemasked_661, 0),
+        "cannyedgepreprocessor_602": get_value_at_index(cannyedgepreprocessor_602, 0),
+        "growmaskwithblur_333": get_value_at_index(growmaskwithblur_333, 0),
+    }
+    return (images, None)
+
+
+def stage_harmonize(models, job, node_mappings, composite):
+    """Harmonises the composite with an SDXL canny ControlNet pass."""
+    cliptextencode = node_mappings["CLIPTextEncode"]()
+    cliptextencode_595 = cliptextencode.encode(
+        text=campaign_prompt(job, node_mappings),
+        clip=get_value_at_index(models["loraloader_594"], 1),
+    )
+
+    controlnetapplyadvanced = node_mappings["ControlNetApplyAdvanced"]()
+    controlnetapplyadvanced_599 = controlnetapplyadvanced.apply_controlnet(
+        strength=1,
+        start_percent=0,
+        end_percent=1,
+        positive=get_value_at_index(cliptextencode_595, 0),
+        negative=get_value_at_index(models["cliptextencode_598"], 0),
+        control_net=get_value_at_index(models["controlnetloader_600"], 0),
+        image=composite["cannyedgepreprocessor_602"],
+    )
+
+    vaeencode = node_mappings["VAEEncode"]()
+    vaeencode_606 = vaeencode.encode(
+        pixels=composite["imagecompositemasked_661"],
+        vae=get_value_at_index(models["checkpointloadersimple_593"], 2),
+    )
+
+    ksampler = node_mappings["KSampler"]()
+    ksampler_597 = ksampler.sample(
+        seed=job_seed(job, "ksampler_597"),
+        steps=6,
+        cfg=3,
+        sampler_name="dpmpp_sde",
+        scheduler="karras",
+        denoise=1,
+        model=get_value_at_index(models["loraloader_594"], 0),
+        positive=get_value_at_index(controlnetapplyadvanced_599, 0),
+        negative=get_value_at_index(controlnetapplyadvanced_599, 1),
+        latent_image=get_value_at_index(vaeencode_606, 0),
+    )
+
+    vaedecode = node_mappings["VAEDecode"]()
+    vaedecode_604 = vaedecode.decode(
+        samples=get_value_at_index(ksampler_597, 0),
+        vae=get_value_at_index(models["checkpointloadersimple_593"], 2),
+    )
+
+    imagecompositemasked = node_mappings["ImageCompositeMasked"]()
+    imagecompositemasked_740 = imagecompositemasked.composite(
+        x=0,
+        y=0,
+        resize_source=False,
+        destination=get_value_at_index(vaedecode_604, 0),
+        source=composite["imagecompositemasked_661"],
+        mask=composite["growmaskwithblur_333"],
+    )
+
+    cr_image_input_switch = node_mappings["CR Image Input Switch"]()
+    cr_image_input_switch_580 = cr_image_input_switch.switch(
+        Input=switch_input(node_mappings),
+        image1=composite["layercolor_autoadjust_99"],
+        image2=get_value_at_index(imagecompositemasked_740, 0),
+    )
+
+    images = {
+        "imagecompositemasked_740": get_value_at_index(imagecompositemasked_740, 0),
+        "cr_image_input_switch_580": get_value_at_index(cr_image_input_switch_580, 0),
+    }
+    return (images, get_value_at_index(ksampler_597, 0))
+
+
+def stage_relight(models, job, node_mappings, composite, harmonized):
+    """Relights the harmonised image with IC-Light."""
+    checkpointloadersimple_264 = models["checkpointloadersimple_264"]
+
+    cliptextencode = node_mappings["CLIPTextEncode"]()
+    cliptextencode_266 = cliptextencode.encode(
+        text=campaign_prompt(job, node_mappings),
+        clip=get_value_at_index(checkpointloadersimple_264, 1),
+    )
+
+    vaeencode = node_mappings["VAEEncode"]()
+    vaeencode_277 = vaeencode.encode(
+        pixels=harmonized["cr_image_input_switch_580"],
+        vae=get_value_at_index(checkpointloadersimple_264, 2),
+    )
+
+    iclightconditioning = node_mappings["ICLightConditioning"]()
+    iclightconditioning_276 = iclightconditioning.encode(
+        multiplier=0.18,
+        positive=get_value_at_index(cliptextencode_266, 0),
+        negative=get_value_at_index(models["cliptextencode_269"], 0),
+        vae=get_value_at_index(checkpointloadersimple_264, 2),
+        foreground=get_value_at_index(vaeencode_277, 0),
+    )
+
+    cr_image_input_switch = node_mappings["CR Image Input Switch"]()
+    cr_image_input_switch_613 = cr_image_input_switch.switch(
+        Input=switch_input(node_mappings),
+        image1=composite["layercolor_autoadjust_99"],
+        image2=harmonized["imagecompositemasked_740"],
+    )
+
+    image_select_channel = node_mappings["Image Select Channel"]()
+    image_select_channel_40 = image_select_channel.select_channel(
+        channel="green", image=get_value_at_index(cr_image_input_switch_613, 0)
+    )
+
+    imageblur = node_mappings["ImageBlur"]()
+    imageblur_98 = imageblur.blur(
+        blur_radius=30,
+        sigma=1,
+        image=get_value_at_index(image_select_channel_40, 0),
+    )
+
+    layercolor_brightness__contrast = node_mappings[
+        "LayerColor: Brightness & Contrast"
+    ]()
+    layercolor_brightness__contrast_549 = (
+        layercolor_brightness__contrast.color_correct_brightness_and_contrast(
+            brightness=1.2,
+            contrast=1,
+            saturation=1,
+            image=get_value_at_index(imageblur_98, 0),
         )
+    )
+
+    vaeencode_284 = vaeencode.encode(
+        pixels=get_value_at_index(layercolor_brightness__contrast_549, 0),
+        vae=get_value_at_index(checkpointloadersimple_264, 2),
+    )
+
+    ksampler = node_mappings["KSampler"]()
+    ksampler_278 = ksampler.sample(
+        seed=job_seed(job, "ksampler_278"),
+        steps=40,
+        cfg=3,
+        sampler_name="dpmpp_2m_sde",
+        scheduler="karras",
+        denoise=1,
+        model=get_value_at_index(models["loadandapplyiclightunet_279"], 0),
+        positive=get_value_at_index(iclightconditioning_276, 0),
+        negative=get_value_at_index(iclightconditioning_276, 1),
+        latent_image=get_value_at_index(vaeencode_284, 0),
+    )
+
+    vaedecode = node_mappings["VAEDecode"]()
+    vaedecode_280 = vaedecode.decode(
+        samples=get_value_at_index(ksampler_278, 0),
+        vae=get_value_at_index(checkpointloadersimple_264, 2),
+    )
+
+    color_blend = node_mappings["Color Blend"]()
+    color_blend_750 = color_blend.blend(
+        mode="Luminosity",
+        blend_image=get_value_at_index(vaedecode_280, 0),
+        base_image=harmonized["cr_image_input_switch_580"],
+    )
+
+    image_blend = node_mappings["Image Blend"]()
+    image_blend_755 = image_blend.image_blend(
+        blend_percentage=0.1,
+        image_a=get_value_at_index(color_blend_750, 0),
+        image_b=get_value_at_index(vaedecode_280, 0),
+    )
+
+    images = {
+        "image_blend_755": get_value_at_index(image_blend_755, 0),
+    }
+    return (images, get_value_at_index(ksampler_278, 0))
+
+
+def stage_restore_detail(models, job, node_mappings, composite, harmonized, relit):
+    """Repaints the relit image and restores the product details, then saves the banner."""
+    checkpointloadersimple_325 = models["checkpointloadersimple_325"]
+    loraloader_326 = models["loraloader_326"]
+
+    vaeencode = node_mappings["VAEEncode"]()
+    vaeencode_309 = vaeencode.encode(
+        pixels=relit["image_blend_755"],
+        vae=get_value_at_index(checkpointloadersimple_325, 2),
+    )
+
+    cliptextencode = node_mappings["CLIPTextEncode"]()
+    cliptextencode_327 = cliptextencode.encode(
+        text=campaign_prompt(job, node_mappings),
+        clip=get_value_at_index(loraloader_326, 1),
+    )
+
+    logic_boolean_primitive = node_mappings["Logic Boolean Primitive"]()
+    logic_boolean_primitive_649 = logic_boolean_primitive.do(boolean=True)
+
+    cr_set_value_on_boolean = node_mappings["CR Set Value On Boolean"]()
+    cr_set_value_on_boolean_650 = cr_set_value_on_boolean.set_value(
+        boolean=get_value_at_index(logic_boolean_primitive_649, 0),
+        value_if_true=1,
+        value_if_false=2,
+    )
+
+    cannyedgepreprocessor = node_mappings["CannyEdgePreprocessor"]()
+    cannyedgepreprocessor_415 = cannyedgepreprocessor.execute(
+        low_threshold=100,
+        high_threshold=200,
+        resolution=1024,
+        image=relit["image_blend_755"],
+    )
+
+    controlnetapplyadvanced = node_mappings["ControlNetApplyAdvanced"]()
+    controlnetapplyadvanced_414 = controlnetapplyadvanced.apply_controlnet(
+        strength=1,
+        start_percent=0,
+        end_percent=1,
+        positive=get_value_at_index(cliptextencode_327, 0),
+        negative=get_value_at_index(models["cliptextencode_328"], 0),
+        control_net=get_value_at_index(models["controlnetloader_301"], 0),
+        image=get_value_at_index(cannyedgepreprocessor_415, 0),
+    )
+
+    ksampler = node_mappings["KSampler"]()
+    ksampler_304 = ksampler.sample(
+        seed=job_seed(job, "ksampler_304"),
+        steps=3,
+        cfg=2,
+        sampler_name="dpmpp_sde",
+        scheduler="karras",
+        denoise=0.4,
+        model=get_value_at_index(loraloader_326, 0),
+        positive=get_value_at_index(controlnetapplyadvanced_414, 0),
+        negative=get_value_at_index(controlnetapplyadvanced_414, 1),
+        latent_image=get_value_at_index(vaeencode_309, 0),
+    )
+
+    vaedecode = node_mappings["VAEDecode"]()
+    vaedecode_305 = vaedecode.decode(
+        samples=get_value_at_index(ksampler_304, 0),
+        vae=get_value_at_index(checkpointloadersimple_325, 2),
+    )
+
+    cr_image_input_switch = node_mappings["CR Image Input Switch"]()
+    cr_image_input_switch_704 = cr_image_input_switch.switch(
+        Input=get_value_at_index(cr_set_value_on_boolean_650, 0),
+        image1=get_value_at_index(vaedecode_305, 0),
+        image2=relit["image_blend_755"],
+    )
+
+    detailtransfer = node_mappings["DetailTransfer"]()
+    detailtransfer_290 = detailtransfer.process(
+        mode="soft_light",
+        blur_sigma=5,
+        blend_factor=1,
+        target=get_value_at_index(cr_image_input_switch_704, 0),
+        source=composite["layercolor_autoadjust_99"],
+        mask=composite["growmaskwithblur_333"],
+    )
+
+    restoredetail = node_mappings["RestoreDetail"]()
+    restoredetail_714 = restoredetail.batch_normalize(
+        mode="add",
+        blur_type="blur",
+        blur_size=5,
+        factor=1,
+        images=relit["image_blend_755"],
+        detail=get_value_at_index(detailtransfer_290, 0),
+    )
+
+    cr_image_input_switch_559 = cr_image_input_switch.switch(
+        Input=switch_input(node_mappings),
+        image1=composite["layercolor_autoadjust_99"],
+        image2=harmonized["imagecompositemasked_740"],
+    )
+
+    layercolor_coloradapter = node_mappings["LayerColor: ColorAdapter"]()
+    layercolor_coloradapter_287 = layercolor_coloradapter.color_adapter(
+        opacity=50,
+        image=get_value_at_index(restoredetail_714, 0),
+        color_ref_image=get_value_at_index(cr_image_input_switch_559, 0),
+    )
+
+    layermask_maskpreview = node_mappings["LayerMask: MaskPreview"]()
+    layermask_maskpreview_486 = layermask_maskpreview.mask_preview(
+        mask=composite["growmaskwithblur_333"]
+    )
+
+    image_comparer_rgthree = node_mappings["Image Comparer (rgthree)"]()
+    image_comparer_rgthree_757 = image_comparer_rgthree.compare_images(
+        image_a=get_value_at_index(vaedecode_305, 0),
+        image_b=relit["image_blend_755"],
+    )
+
+    image_comparer_rgthree_768 = image_comparer_rgthree.compare_images(
+        image_a=relit["image_blend_755"],
+        image_b=harmonized["cr_image_input_switch_580"],
+    )
+
+    image_blend = node_mappings["Image Blend"]()
+    image_blend_770 = image_blend.image_blend(
+        blend_percentage=0.6,
+        image_a=get_value_at_index(layercolor_coloradapter_287, 0),
+        image_b=get_value_at_index(detailtransfer_290, 0),
+    )
+
+    saveimage = node_mappings["SaveImage"]()
+    saveimage_770 = saveimage.save_images(
+        filename_prefix=job["filename_prefix"],
+        images=get_value_at_index(image_blend_770, 0),
+        format=job["output_format"],
+        quality=job["output_quality"],
+    )
+
+    images = {
+        "image_blend_770": get_value_at_index(image_blend_770, 0),
+    }
+    return (images, get_value_at_index(ksampler_304, 0))
+
+
+def stage_flux_background(models, job, node_mappings):
+    """Generates an alternative background with Flux and saves it."""
+    cliptextencode = node_mappings["CLIPTextEncode"]()
+    cliptextencode_775 = cliptextencode.encode(
+        text=job["background_prompt"],
+        clip=get_value_at_index(models["dualcliploader_774"], 0),
+    )
+
+    emptylatentimage = node_mappings["EmptyLatentImage"]()
+    emptylatentimage_777 = emptylatentimage.generate(
+        width=1304, height=800, batch_size=1
+    )
+
+    randomnoise = node_mappings["RandomNoise"]()
+    randomnoise_778 = randomnoise.get_noise(noise_seed=job_seed(job, "randomnoise_778"))
+
+    basicguider = node_mappings["BasicGuider"]()
+    basicguider_776 = basicguider.get_guider(
+        model=get_value_at_index(models["unetloader_773"], 0),
+        conditioning=get_value_at_index(cliptextencode_775, 0),
+    )
+
+    basicscheduler = node_mappings["BasicScheduler"]()
+    basicscheduler_783 = basicscheduler.get_sigmas(
+        scheduler="sgm_uniform",
+        steps=20,
+        denoise=1,
+        model=get_value_at_index(models["unetloader_773"], 0),
+    )
+
+    samplercustomadvanced = node_mappings["SamplerCustomAdvanced"]()
+    samplercustomadvanced_inputs = {
+        "noise": get_value_at_index(randomnoise_778, 0),
+        "guider": get_value_at_index(basicguider_776, 0),
+        "sampler": get_value_at_index(models["ksamplerselect_780"], 0),
+        "sigmas": get_value_at_index(basicscheduler_783, 0),
+        "latent_image": get_value_at_index(emptylatentimage_777, 0),
+    }
+    samplercustomadvanced_781 = sample_cache.cached_sample(
+        ("SamplerCustomAdvanced", samplercustomadvanced_inputs),
+        samplercustomadvanced_inputs["latent_image"],
+        lambda: samplercustomadvanced.sample(**samplercustomadvanced_inputs),
+    )
+
+    vaedecode = node_mappings["VAEDecode"]()
+    vaedecode_785 = vaedecode.decode(
+        samples=get_value_at_index(samplercustomadvanced_781, 0),
+        vae=get_value_at_index(models["vaeloader_782"], 0),
+    )
+
+    saveimage = node_mappings["SaveImage"]()
+    saveimage_784 = saveimage.save_images(
+        filename_prefix=job["filename_prefix"] + "_background",
+        images=get_value_at_index(vaedecode_785, 0),
+        format=job["output_format"],
+        quality=job["output_quality"],
+    )
+
+    images = {
+        "vaedecode_785": get_value_at_index(vaedecode_785, 0),
+    }
+    return (images, get_value_at_index(samplercustomadvanced_781, 0))
+
+
+def job_key(job: Mapping[str, Any], store: StageStore = None) -> str:
+    if store is None:
+        return None
+    return store.job_key(job, (job["product_image"], job["background_image"]))
 
-        color_blend = NODE_CLASS_MAPPINGS["Color Blend"]()
-        color_blend_750 = color_blend.blend(
-            mode="Luminosity",
-            blend_image=get_value_at_index(vaedecode_280, 0),
-            base_image=get_value_at_index(cr_image_input_switch_580, 0),
-        )
 
-        image_blend = NODE_CLASS_MAPPINGS["Image Blend"]()
-        image_blend_755 = image_blend.image_blend(
-            blend_percentage=0.1,
-            image_a=get_value_at_index(color_blend_750, 0),
-            image_b=get_value_at_index(vaedecode_280, 0),
-        )
+def run_stage(models, job, node_mappings, store, stage, fn, *args, pending=None):
+    if store is None:
+        return fn(models, job, node_mappings, *args)[0]
 
-        checkpointloadersimple_325 = checkpointloadersimple.load_checkpoint(
-            ckpt_name="juggernautXL_v9Rdphoto2Lightning.safetensors"
-        )
+    writes = []
 
-        vaeencode_309 = vaeencode.encode(
-            pixels=get_value_at_index(image_blend_755, 0),
-            vae=get_value_at_index(checkpointloadersimple_325, 2),
-        )
+    def run(*stage_args):
+        with image_writer.collect_writes() as stage_writes:
+            outputs = fn(*stage_args)
+        writes.extend(stage_writes)
+        return outputs
 
-        loraloader_326 = loraloader.load_lora(
-            lora_name="mjv6.safetensors",
-            strength_model=0.2,
-            strength_clip=1,
-            model=get_value_at_index(checkpointloadersimple_325, 0),
-            clip=get_value_at_index(checkpointloadersimple_325, 1),
-        )
+    def defer(save):
+        #with --async-save the files are only queued, the stage is stored once they are written
+        commit = image_writer.when_written(writes, save)
+        if pending is not None:
+            pending.append(commit)
 
-        cliptextencode_327 = cliptextencode.encode(
-            text=get_value_at_index(cr_text_583, 0),
-            clip=get_value_at_index(loraloader_326, 1),
-        )
+    return store.run(job_key(job, store), stage, run, models, job, node_mappings, *args, defer=defer)[0]
 
-        cliptextencode_328 = cliptextencode.encode(
-            text="", clip=get_value_at_index(loraloader_326, 1)
-        )
 
-        logic_boolean_primitive_649 = logic_boolean_primitive.do(boolean=True)
+def prepare_job(models: Mapping[str, Any], job: Mapping[str, Any], node_mappings: Mapping[str, Any] = NODE_CLASS_MAPPINGS, store: StageStore = None) -> dict:
+    """Runs the CPU bound preprocessing of a job: loading, resizing, background removal and edge detection."""
+    return run_stage(models, job, node_mappings, store, "composite", stage_composite)
 
-        unetloader = NODE_CLASS_MAPPINGS["UNETLoader"]()
-        unetloader_773 = unetloader.load_unet(
-            unet_name="flux1-schnell.safetensors", weight_dtype="default"
-        )
 
-        dualcliploader = NODE_CLASS_MAPPINGS["DualCLIPLoader"]()
-        dualcliploader_774 = dualcliploader.load_clip(
-            clip_name1="t5xxl_fp16.safetensors",
-            clip_name2="clip_l.safetensors",
-            type="flux",
-        )
+def finish_job(models: Mapping[str, Any], job: Mapping[str, Any], composite: Mapping[str, Any], node_mappings: Mapping[str, Any] = NODE_CLASS_MAPPINGS, store: StageStore = None) -> concurrent.futures.Future:
+    """Runs the sampling stages of a job on the output of prepare_job.
 
-        cliptextencode_775 = cliptextencode.encode(
-            text="A plain and empty wooden podium in a circular shape placed in a home drawing room with a small library and sofa background with soft diffused lightning designed  This scene should evoke a modern classy feeling",
-            clip=get_value_at_index(dualcliploader_774, 0),
-        )
+    Returns a future that is done once the files of the job are written, it fails
+    if one of them couldn't be. With --async-save the writes continue in the
+    background, the stages that saved files are stored and the stored stages of
+    the job are removed from the writer threads.
+    """
+    pending = []
+    with image_writer.collect_writes() as writes:
+        harmonized = run_stage(models, job, node_mappings, store, "harmonize", stage_harmonize, composite, pending=pending)
+        relit = run_stage(models, job, node_mappings, store, "relight", stage_relight, composite, harmonized, pending=pending)
+        run_stage(models, job, node_mappings, store, "restore_detail", stage_restore_detail, composite, harmonized, relit, pending=pending)
+        run_stage(models, job, node_mappings, store, "flux_background", stage_flux_background, pending=pending)
+
+    def finished():
+        if store is not None:
+            store.discard(job_key(job, store))
+    return image_writer.when_written(writes + pending, finished)
+
+
+def render_job(models: Mapping[str, Any], job: Mapping[str, Any], node_mappings: Mapping[str, Any] = NODE_CLASS_MAPPINGS, store: StageStore = None) -> concurrent.futures.Future:
+    """Renders one banner for the given job using the models from load_models.
+
+    The job runs as the named stages in STAGES. With a store, the outputs of every
+    completed stage are persisted and a rerun of the same job resumes after the
+    last completed stage; the stored stages are removed once the job finished.
+    Returns the future of finish_job.
+    """
+    composite = prepare_job(models, job, node_mappings, store)
+    return finish_job(models, job, composite, node_mappings, store)
 
-        emptylatentimage = NODE_CLASS_MAPPINGS["EmptyLatentImage"]()
-        emptylatentimage_777 = emptylatentimage.generate(
-            width=1304, height=800, batch_size=1
-        )
 
-        randomnoise = NODE_CLASS_MAPPINGS["RandomNoise"]()
-        randomnoise_778 = randomnoise.get_noise(noise_seed=random.randint(1, 2**64))
+def run_batch(jobs: Sequence[Mapping[str, Any]], models: Mapping[str, Any] = None, dedupe: bool = True, store: StageStore = None, pipeline: bool = False, profiler: StartupProfiler = None, tracer: NodeTracer = None) -> list:
+    """Renders every job in one process, loading the models only once.
 
-        ksamplerselect = NODE_CLASS_MAPPINGS["KSamplerSelect"]()
-        ksamplerselect_780 = ksamplerselect.get_sampler(sampler_name="euler")
+    A failing job is reported and skipped so that one broken row does not stop a
+    whole campaign. With dedupe, identical node calls within a job are only
+    executed once. With a stage store, interrupted jobs resume after their last
+    completed stage. With pipeline, the preprocessing of the next job runs in a
+    second thread while the current job is sampling. With a profiler, every
+    node call of load_models is recorded as a phase. With a tracer, every node
+    call is traced.
 
-        vaeloader = NODE_CLASS_MAPPINGS["VAELoader"]()
-        vaeloader_782 = vaeloader.load_vae(
-            vae_name="diffusion_pytorch_model.safetensors"
-        )
+    Returns:
+        list: The job ids that failed.
+    """
+    def new_node_mappings():
+        node_mappings = MemoizingNodeMappings(NODE_CLASS_MAPPINGS) if dedupe else NODE_CLASS_MAPPINGS
+        return node_mappings if tracer is None else tracer.node_mappings(node_mappings)
+
+    if models is None:
+        node_mappings = new_node_mappings()
+        if profiler is not None:
+            with profiler.phase("load_models"):
+                models = load_models(profiler.node_mappings(node_mappings))
+        else:
+            models = load_models(node_mappings)
+        if dedupe:
+            print(node_mappings.summary())
+
+    def report(index, job, node_mappings, error, seconds):
+        if error is not None:
+            failed.append(job["job_id"])
+            print(f"[{index + 1}/{len(jobs)}] {job['job_id']} failed: {error}")
+            return
+        print(f"[{index + 1}/{len(jobs)}] {job['job_id']} rendered in {seconds:.1f}s")
+        if dedupe:
+            print(node_mappings.summary())
+
+    def report_when_written(index, job, node_mappings, written, seconds):
+        #with --async-save a job only counts as rendered once the writer threads wrote its files
+        reported = concurrent.futures.Future()
+
+        def done(future):
+            try:
+                report(index, job, node_mappings, future.exception(), seconds)
+            finally:
+                reported.set_result(None)
+        written.add_done_callback(done)
+        reports.append(reported)
+
+    def report_result(result):
+        (index, job, node_mappings), written, error, seconds = result
+        if error is not None:
+            report(index, job, node_mappings, error, seconds)
+        else:
+            report_when_written(index, job, node_mappings, written, seconds)
+
+    failed = []
+    reports = []
+    batch_start = time.perf_counter()
+    if pipeline:
+        def preprocess(item):
+            index, job, node_mappings = item
+            return item, prepare_job(models, job, node_mappings, store)
+
+        def sample(value):
+            (index, job, node_mappings), composite = value
+            return finish_job(models, job, composite, node_mappings, store)
+
+        scheduler = StagePipeline([("preprocess", preprocess), ("sample", sample)], context=torch.inference_mode)
+        items = ((index, job, new_node_mappings()) for index, job in enumerate(jobs))
+        scheduler.run(items, on_result=report_result)
+    else:
+        for index, job in enumerate(jobs):
+            job_start = time.perf_counter()
+            node_mappings = new_node_mappings()
+            try:
+                written = render_job(models, job, node_mappings, store)
+            except Exception as e:
+                report(index, job, node_mappings, e, time.perf_counter() - job_start)
+                continue
+            report_when_written(index, job, node_mappings, written, time.perf_counter() - job_start)
+    concurrent.futures.wait(reports)
+
+    print(f"Rendered {len(jobs) - len(failed)}/{len(jobs)} jobs in {time.perf_counter() - batch_start:.1f}s")
+    return failed
+
+
+def report_write(result: image_writer.WriteResult):
+    """Reports an image written by the background writer threads of --async-save."""
+    if result.error is not None:
+        print(f"Could not write {result.path}: {result.error}")
+    else:
+        print(f"Saved {result.path} ({result.size / 1024:.0f} KB) in {result.seconds:.2f}s")
+
+
+def parse_args(argv: Sequence[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Render product banners with the PromoGenie workflow.")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="CSV or JSONL file with one job per row. Without it the built in example job is rendered.")
+    parser.add_argument("--checkpoint-cache-gb", type=float, default=None,
+                        help="Memory budget for loaded checkpoints (default 24), 0 disables reuse of loaded checkpoints.")
+    parser.add_argument("--controlnet-cache-gb", type=float, default=None,
+                        help="Memory budget for loaded ControlNets (default 8), 0 disables reuse of loaded ControlNets.")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Don't persist the stage outputs of a job, by default an interrupted job resumes after its last completed stage.")
+    parser.add_argument("--stage-dir", type=str, default=None,
+                        help="Folder for the persisted stage outputs, defaults to the stages folder of the cache directory.")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Overlap the preprocessing of the next job with the sampling of the current one.")
+    parser.add_argument("--no-headless", action="store_true",
+                        help="Create the full PromptServer and PromptQueue before importing the nodes instead of the lightweight headless stand-in.")
+    parser.add_argument("--no-lazy-nodes", action="store_true",
+                        help="Import every comfy_extras node file and custom node pack at startup instead of when one of its nodes is first used.")
+    parser.add_argument("--custom-node-workers", type=int, default=1,
+                        help="Import the custom node packs on this many threads.")
+    parser.add_argument("--node-import-profile", default=None,
+                        help="Write the import time, failure and memory change of every custom node pack to this json file.")
+    parser.add_argument("--startup-only", action="store_true",
+                        help="Only initialize the node registry and report how long it took.")
+    parser.add_argument("--compare-startup", action="store_true",
+                        help="Report the startup time with and without the headless stand-in, each measured in a fresh process.")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print how long each startup phase and model load took, split into file loading, weight conversion and the rest.")
+    parser.add_argument("--profile-startup-json", type=str, default=None,
+                        help="Also write the startup profile to this json file.")
+    parser.add_argument("--trace", type=str, default=None,
+                        help="Write a Chrome trace (chrome://tracing, ui.perfetto.dev) of every node call to this json file.")
+    parser.add_argument("--trace-cpu-memory", action="store_true",
+                        help="Also record the CPU allocations of every node call in the trace with torch.profiler, this slows the nodes down.")
+    parser.add_argument("--async-save", action="store_true",
+                        help="Encode and write the saved images on background threads, the batch waits for them before it exits.")
+    parser.add_argument("--image-writer-threads", type=int, default=None,
+                        help="Threads encoding the saved images with --async-save, defaults to PROMOGENIE_IMAGE_WRITER_THREADS or 2.")
+    parser.add_argument("--uint8-images", action="store_true",
+                        help="Keep loaded images as uint8 until a node needs float math, a quarter of the memory of float32 images.")
+    parser.add_argument("--no-sample-cache", action="store_true",
+                        help="Don't reuse sampler results of earlier runs with identical inputs.")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="Execute every node call even when an identical call already ran in the same job.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str] = None):
+    args = parse_args(argv)
+    if args.compare_startup:
+        compare_startup(lazy=not args.no_lazy_nodes, workers=args.custom_node_workers)
+        return 0
+    if args.startup_only:
+        seconds = import_custom_nodes(headless=not args.no_headless, lazy=not args.no_lazy_nodes,
+                                      workers=args.custom_node_workers, import_profile=args.node_import_profile)
+        print(f"Node registry initialized in {seconds:.1f}s")
+        return 0
+
+    if args.manifest is not None:
+        jobs = read_manifest(args.manifest)
+    else:
+        jobs = [dict(DEFAULT_JOB)]
 
-        detailtransfer = NODE_CLASS_MAPPINGS["DetailTransfer"]()
-        restoredetail = NODE_CLASS_MAPPINGS["RestoreDetail"]()
-        layercolor_coloradapter = NODE_CLASS_MAPPINGS["LayerColor: ColorAdapter"]()
-        layermask_maskpreview = NODE_CLASS_MAPPINGS["LayerMask: MaskPreview"]()
-        image_comparer_rgthree = NODE_CLASS_MAPPINGS["Image Comparer (rgthree)"]()
-        splitimagewithalpha = NODE_CLASS_MAPPINGS["SplitImageWithAlpha"]()
-        basicguider = NODE_CLASS_MAPPINGS["BasicGuider"]()
-        basicscheduler = NODE_CLASS_MAPPINGS["BasicScheduler"]()
-        samplercustomadvanced = NODE_CLASS_MAPPINGS["SamplerCustomAdvanced"]()
-        saveimage = NODE_CLASS_MAPPINGS["SaveImage"]()
-
-        for q in range(1):
-            cr_set_value_on_boolean_650 = cr_set_value_on_boolean.set_value(
-                boolean=get_value_at_index(logic_boolean_primitive_649, 0),
-                value_if_true=1,
-                value_if_false=2,
-            )
-
-            cannyedgepreprocessor_415 = cannyedgepreprocessor.execute(
-                low_threshold=100,
-                high_threshold=200,
-                resolution=1024,
-                image=get_value_at_index(image_blend_755, 0),
-            )
-
-            controlnetapplyadvanced_414 = controlnetapplyadvanced.apply_controlnet(
-                strength=1,
-                start_percent=0,
-                end_percent=1,
-                positive=get_value_at_index(cliptextencode_327, 0),
-                negative=get_value_at_index(cliptextencode_328, 0),
-                control_net=get_value_at_index(controlnetloader_301, 0),
-                image=get_value_at_index(cannyedgepreprocessor_415, 0),
-            )
-
-            ksampler_304 = ksampler.sample(
-                seed=random.randint(1, 2**64),
-                steps=3,
-                cfg=2,
-                sampler_name="dpmpp_sde",
-                scheduler="karras",
-                denoise=0.4,
-                model=get_value_at_index(loraloader_326, 0),
-                positive=get_value_at_index(controlnetapplyadvanced_414, 0),
-                negative=get_value_at_index(controlnetapplyadvanced_414, 1),
-                latent_image=get_value_at_index(vaeencode_309, 0),
-            )
-
-            vaedecode_305 = vaedecode.decode(
-                samples=get_value_at_index(ksampler_304, 0),
-                vae=get_value_at_index(checkpointloadersimple_325, 2),
-            )
-
-            cr_image_input_switch_704 = cr_image_input_switch.switch(
-                Input=get_value_at_index(cr_set_value_on_boolean_650, 0),
-                image1=get_value_at_index(vaedecode_305, 0),
-                image2=get_value_at_index(image_blend_755, 0),
-            )
-
-            detailtransfer_290 = detailtransfer.process(
-                mode="soft_light",
-                blur_sigma=5,
-                blend_factor=1,
-                target=get_value_at_index(cr_image_input_switch_704, 0),
-                source=get_value_at_index(layercolor_autoadjust_99, 0),
-                mask=get_value_at_index(growmaskwithblur_333, 0),
-            )
-
-            restoredetail_714 = restoredetail.batch_normalize(
-                mode="add",
-                blur_type="blur",
-                blur_size=5,
-                factor=1,
-                images=get_value_at_index(image_blend_755, 0),
-                detail=get_value_at_index(detailtransfer_290, 0),
-            )
-
-            cr_image_input_switch_559 = cr_image_input_switch.switch(
-                Input=get_value_at_index(cr_set_value_on_boolean_632, 0),
-                image1=get_value_at_index(layercolor_autoadjust_99, 0),
-                image2=get_value_at_index(imagecompositemasked_740, 0),
-            )
-
-            layercolor_coloradapter_287 = layercolor_coloradapter.color_adapter(
-                opacity=50,
-                image=get_value_at_index(restoredetail_714, 0),
-                color_ref_image=get_value_at_index(cr_image_input_switch_559, 0),
-            )
-
-            layermask_maskpreview_486 = layermask_maskpreview.mask_preview(
-                mask=get_value_at_index(growmaskwithblur_333, 0)
-            )
-
-            image_comparer_rgthree_757 = image_comparer_rgthree.compare_images(
-                image_a=get_value_at_index(vaedecode_305, 0),
-                image_b=get_value_at_index(image_blend_755, 0),
-            )
-
-            splitimagewithalpha_763 = splitimagewithalpha.split_image_with_alpha(
-                image=get_value_at_index(loadimage_1, 0)
-            )
-
-            image_comparer_rgthree_768 = image_comparer_rgthree.compare_images(
-                image_a=get_value_at_index(image_blend_755, 0),
-                image_b=get_value_at_index(cr_image_input_switch_580, 0),
-            )
-
-            image_blend_770 = image_blend.image_blend(
-                blend_percentage=0.6,
-                image_a=get_value_at_index(layercolor_coloradapter_287, 0),
-                image_b=get_value_at_index(detailtransfer_290, 0),
-            )
-
-            basicguider_776 = basicguider.get_guider(
-                model=get_value_at_index(unetloader_773, 0),
-                conditioning=get_value_at_index(cliptextencode_775, 0),
-            )
-
-            basicscheduler_783 = basicscheduler.get_sigmas(
-                scheduler="sgm_uniform",
-                steps=20,
-                denoise=1,
-                model=get_value_at_index(unetloader_773, 0),
-            )
-
-            samplercustomadvanced_781 = samplercustomadvanced.sample(
-                noise=get_value_at_index(randomnoise_778, 0),
-                guider=get_value_at_index(basicguider_776, 0),
-                sampler=get_value_at_index(ksamplerselect_780, 0),
-                sigmas=get_value_at_index(basicscheduler_783, 0),
-                latent_image=get_value_at_index(emptylatentimage_777, 0),
-            )
-
-            vaedecode_785 = vaedecode.decode(
-                samples=get_value_at_index(samplercustomadvanced_781, 0),
-                vae=get_value_at_index(vaeloader_782, 0),
-            )
-
-            saveimage_784 = saveimage.save_images(
-                filename_prefix="ComfyUI", images=get_value_at_index(vaedecode_785, 0)
-            )
+    prompt_cache.set_disk_cache(os.environ.get("PROMOGENIE_PROMPT_DISK_CACHE", "1") != "0")
+    sample_cache.set_enabled(not args.no_sample_cache)
+    sample_cache.set_disk_cache(os.environ.get("PROMOGENIE_SAMPLE_DISK_CACHE", "1") != "0")
+    if args.checkpoint_cache_gb is not None:
+        CHECKPOINT_CACHE.set_max_bytes(int(args.checkpoint_cache_gb * 1024 ** 3))
+    else:
+        CHECKPOINT_CACHE.set_max_bytes(model_cache.budget_from_env("PROMOGENIE_CHECKPOINT_CACHE_MB", 24 * 1024))
+    if args.controlnet_cache_gb is not None:
+        CONTROLNET_CACHE.set_max_bytes(int(args.controlnet_cache_gb * 1024 ** 3))
+    else:
+        CONTROLNET_CACHE.set_max_bytes(model_cache.budget_from_env("PROMOGENIE_CONTROLNET_CACHE_MB", 8 * 1024))
+
+    profile = args.profile_startup or args.profile_startup_json is not None
+    with STARTUP_PROFILER.phase("import_custom_nodes"):
+        seconds = import_custom_nodes(headless=not args.no_headless, lazy=not args.no_lazy_nodes,
+                                      workers=args.custom_node_workers, import_profile=args.node_import_profile)
+    print(f"Node registry initialized in {seconds:.1f}s")
+    if profile:
+        STARTUP_PROFILER.instrument_model_loading()
+    if args.uint8_images:
+        uint8_image.set_enabled(True)
+    if args.async_save:
+        if args.image_writer_threads is not None:
+            image_writer.WRITER_THREADS = args.image_writer_threads
+        image_writer.set_async(True)
+        image_writer.get_writer().add_listener(report_write)
+    tracer = None if args.trace is None else NodeTracer(profile_memory=args.trace_cpu_memory)
+    try:
+        with torch.inference_mode():
+            store = None if args.no_resume else StageStore(args.stage_dir)
+            failed = run_batch(jobs, dedupe=not args.no_dedupe, store=store, pipeline=args.pipeline,
+                               profiler=STARTUP_PROFILER if profile else None, tracer=tracer)
+    finally:
+        if tracer is not None:
+            tracer.write(args.trace)
+        writes = image_writer.wait()
+    failed_writes = [w for w in writes if w.error is not None]
+    if args.async_save:
+        print(f"Wrote {len(writes) - len(failed_writes)}/{len(writes)} images")
+    if profile:
+        STARTUP_PROFILER.uninstrument_model_loading()
+        print(STARTUP_PROFILER.summary())
+        if args.profile_startup_json is not None:
+            STARTUP_PROFILER.write_json(args.profile_startup_json)
+    print(CHECKPOINT_CACHE.format_stats())
+    print(CONTROLNET_CACHE.format_stats())
+    print(IMAGE_CACHE.format_stats())
+    return 1 if failed or failed_writes else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())